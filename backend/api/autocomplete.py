@@ -0,0 +1,100 @@
+"""Поиск ингредиентов по началу названия без обращения к базе."""
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from recipes.reference import ingredients
+
+TRIGRAM_THRESHOLD = 0.3
+
+
+def normalize(value):
+    return ' '.join(value.lower().replace('ё', 'е').split())
+
+
+def trigrams(value):
+    """Триграммы слов строки, как в pg_trgm."""
+    result = set()
+    for word in value.split():
+        word = f'  {word} '
+        result.update(word[i:i + 3] for i in range(len(word) - 2))
+    return result
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Строится из кэша справочника и перестраивается, когда меняется его
+    версия, в том числе после изменений в других процессах.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = None
+
+    def build(self, reference):
+        items = sorted((
+            (normalize(item['name']), item) for item in reference.items
+        ), key=lambda item: (item[0], item[1]['id']))
+        keys = [key for key, _ in items]
+        postings = defaultdict(list)
+        sizes = []
+        for position, key in enumerate(keys):
+            grams = trigrams(key)
+            sizes.append(len(grams))
+            for gram in grams:
+                postings[gram].append(position)
+        return {
+            'version': reference.version,
+            'keys': keys,
+            'items': [item for _, item in items],
+            'postings': dict(postings),
+            'sizes': sizes,
+        }
+
+    def get_data(self):
+        reference = ingredients.get()
+        data = self.data
+        if data is None or data['version'] != reference.version:
+            with self.lock:
+                data = self.data
+                if data is None or data['version'] != reference.version:
+                    data = self.data = self.build(reference)
+        return data
+
+    def search(self, query, limit):
+        """Ингредиенты, название которых начинается с query, а если их
+        меньше limit - дополненные похожими по триграммам."""
+        data = self.get_data()
+        query = normalize(query)
+        keys = data['keys']
+        start = bisect_left(keys, query)
+        positions = []
+        for position in range(start, len(keys)):
+            if len(positions) == limit or not keys[position].startswith(query):
+                break
+            positions.append(position)
+        if len(positions) < limit:
+            positions.extend(self.similar(
+                data, query, limit - len(positions), exclude=set(positions)))
+        return [data['items'][position] for position in positions]
+
+    def similar(self, data, query, limit, exclude):
+        grams = trigrams(query)
+        if not grams:
+            return []
+        shared = Counter()
+        for gram in grams:
+            shared.update(data['postings'].get(gram, ()))
+        scored = []
+        for position, common in shared.items():
+            if position in exclude:
+                continue
+            score = common / (len(grams) + data['sizes'][position] - common)
+            if score >= TRIGRAM_THRESHOLD:
+                scored.append((-score, data['keys'][position], position))
+        scored.sort()
+        return [position for _, _, position in scored[:limit]]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,66 @@
+"""Кэш ответов для анонимных пользователей.
+
+Анонимному пользователю все рецепты видны одинаково, поэтому ответ
+кэшируется целиком под ключом из адреса, нормализованных параметров и
+версий данных (см. recipes.versions). Тот же ключ служит ETag, а
+Cache-Control позволяет nginx и браузеру держать ответ несколько секунд.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from core.replicas import use_primary
+from recipes.versions import get_versions
+
+
+def normalize_params(query_params, allowed):
+    """Параметры запроса в каноническом виде; None, если среди них есть
+    неизвестные и ответ кэшировать нельзя."""
+    items = []
+    for name in sorted(query_params):
+        if name not in allowed:
+            return None
+        items.extend(
+            (name, value) for value in sorted(query_params.getlist(name)))
+    return urlencode(items)
+
+
+def cached_response(request, version_keys, get_response, params=()):
+    """Ответ get_response() из кэша для анонимного пользователя или 304.
+
+    params - параметры запроса, от которых зависит ответ.
+    """
+    if not request.user.is_anonymous:
+        return get_response()
+    query = normalize_params(request.query_params, params)
+    if query is None:
+        return get_response()
+    digest = hashlib.sha1('\n'.join((
+        request.build_absolute_uri(request.path), query,
+        *get_versions(version_keys),
+    )).encode()).hexdigest()
+    etag = quote_etag(digest)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        key = f'api:response:{digest}'
+        data = cache.get(key)
+        if data is None:
+            with use_primary():
+                response = get_response()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        else:
+            response = Response(data)
+    response['ETag'] = etag
+    patch_cache_control(
+        response, public=True, max_age=settings.RESPONSE_CACHE_MAX_AGE)
+    patch_vary_headers(response, ('Authorization',))
+    return response
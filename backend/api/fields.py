@@ -0,0 +1,77 @@
+import base64
+import binascii
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework import serializers
+
+
+class StreamingBase64ImageField(Base64ImageField):
+    """Base64ImageField, который декодирует картинку частями во временный
+    файл на диске, а не целиком в память, и ограничивает её размер.
+
+    Хранилище копирует файл частями, Pillow проверяет его с диска.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def to_internal_value(self, base64_data):
+        if base64_data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(base64_data, str):
+            return super().to_internal_value(base64_data)
+        base64_data = base64_data.rpartition(';base64,')[2]
+        file = tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR)
+        try:
+            for data in self.decode(base64_data):
+                file.write(data)
+                if file.tell() > settings.RECIPE_IMAGE_MAX_SIZE:
+                    raise serializers.ValidationError(
+                        f'Размер изображения больше '
+                        f'{settings.RECIPE_IMAGE_MAX_SIZE // 2 ** 20} МБ.')
+            file.seek(0)
+            extension = self.get_extension(file)
+        except serializers.ValidationError:
+            file.close()
+            raise
+        except (binascii.Error, ValueError):
+            file.close()
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        return File(file, name=f'{uuid.uuid4()}.{extension}')
+
+    def decode(self, base64_data):
+        """Декодированные части base64_data.
+
+        Пробелы и переводы строк пропускаются, а символы, не вошедшие в
+        целую четвёрку, переносятся в следующую часть; недостающие «=» в
+        конце дописываются.
+        """
+        tail = ''
+        for start in range(0, len(base64_data), self.CHUNK_SIZE):
+            chunk = tail + ''.join(
+                base64_data[start:start + self.CHUNK_SIZE].split())
+            size = len(chunk) - len(chunk) % 4
+            yield base64.b64decode(chunk[:size], validate=True)
+            tail = chunk[size:]
+        if tail:
+            yield base64.b64decode(
+                tail + '=' * (-len(tail) % 4), validate=True)
+
+    def get_extension(self, file):
+        """Формат картинки; заодно Pillow проверяет, что она не битая."""
+        try:
+            with Image.open(file) as image:
+                extension = image.format.lower()
+                image.verify()
+        except Exception:
+            raise serializers.ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            file.seek(0)
+        extension = 'jpg' if extension == 'jpeg' else extension
+        if extension not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        return extension
@@ -3,6 +3,7 @@ from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
 from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
 
 
 class IngredientsFilter(SearchFilter):
@@ -19,21 +20,28 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search')
 
-    def filter_is_favorited(self, queryset, name, value):
+    def filter_user_list(self, queryset, model, value):
+        """Рецепты из избранного или списка покупок пользователя."""
         if not value:
             return queryset
-        favorite_recipes_id = Favorite.objects.filter(
-            user=self.request.user.id).values_list("recipe__id", flat=True)
-        return queryset.filter(id__in=favorite_recipes_id)
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(
+            id__in=model.objects.filter(user=user).values('recipe_id'))
+
+    def filter_is_favorited(self, queryset, name, value):
+        return self.filter_user_list(queryset, Favorite, value)
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
-        if not value:
-            return queryset
-        shoppingcart_recipes_id = ShoppingCart.objects.filter(
-            user=self.request.user.id).values_list("recipe__id", flat=True)
-        return queryset.filter(id__in=shoppingcart_recipes_id)
+        return self.filter_user_list(queryset, ShoppingCart, value)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
@@ -0,0 +1,261 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import User
+
+# Имя, метод, адрес, запрос от авторизованного пользователя.
+# Запросы, меняющие данные, выполняются в транзакции, которая затем
+# откатывается, поэтому база после замера остаётся прежней.
+ENDPOINTS = (
+    ('recipes-list-anonymous', 'get', '/api/recipes/', False),
+    ('recipes-list', 'get', '/api/recipes/', True),
+    ('recipes-list-limit', 'get', '/api/recipes/?limit=100', True),
+    ('recipes-list-deep-page', 'get', '/api/recipes/?page={last_page}', True),
+    ('recipes-list-no-count', 'get', '/api/recipes/?count=false', True),
+    ('recipes-list-cursor', 'get', '/api/recipes/?cursor={cursor}', True),
+    ('recipes-filter-tags', 'get', '/api/recipes/?tags={tag}', True),
+    ('recipes-filter-author', 'get', '/api/recipes/?author={author}', True),
+    ('recipes-favorited', 'get', '/api/recipes/?is_favorited=1', True),
+    ('recipes-in-shopping-cart', 'get',
+     '/api/recipes/?is_in_shopping_cart=1', True),
+    ('recipes-search', 'get', '/api/recipes/?search={search}', True),
+    ('recipes-feed', 'get', '/api/recipes/feed/', True),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', True),
+    ('download-shopping-cart', 'get',
+     '/api/recipes/download_shopping_cart/', True),
+    ('download-shopping-cart-pdf', 'get',
+     '/api/recipes/download_shopping_cart/?type=pdf', True),
+    ('favorite-add', 'post', '/api/recipes/{free_recipe}/favorite/', True),
+    ('favorite-remove', 'delete',
+     '/api/recipes/{free_recipe}/favorite/', True),
+    ('shopping-cart-add', 'post',
+     '/api/recipes/{free_recipe}/shopping_cart/', True),
+    ('shopping-cart-remove', 'delete',
+     '/api/recipes/{free_recipe}/shopping_cart/', True),
+    ('subscriptions', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', True),
+    ('subscribe', 'post', '/api/users/{free_author}/subscribe/', True),
+    ('unsubscribe', 'delete', '/api/users/{free_author}/subscribe/', True),
+    ('users-list', 'get', '/api/users/', True),
+    ('users-detail', 'get', '/api/users/{author}/', True),
+    ('users-me', 'get', '/api/users/me/', True),
+    ('tags-list', 'get', '/api/tags/', False),
+    ('tags-detail', 'get', '/api/tags/{tag_id}/', False),
+    ('ingredients-search', 'get', '/api/ingredients/?name={prefix}', False),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient}/', False),
+)
+
+# Запрос, который без замера выполняется перед удалением в той же
+# транзакции: удалять нужно то, что уже добавлено.
+SETUP = {
+    'favorite-remove': ('post', '/api/recipes/{free_recipe}/favorite/'),
+    'shopping-cart-remove': (
+        'post', '/api/recipes/{free_recipe}/shopping_cart/'),
+    'unsubscribe': ('post', '/api/users/{free_author}/subscribe/'),
+}
+# Служебные запросы транзакции-обёртки в число запросов не входят.
+TRANSACTION_STATEMENTS = (
+    'BEGIN', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+DEFAULT_BUDGET = os.path.join(settings.BASE_DIR, 'benchmark_budget.json')
+
+
+def percentile(values, percent):
+    """Вернуть перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, -(-len(ordered) * percent // 100) - 1)
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ('Замерить число запросов, время ответа и пиковую память '
+            'для каждого эндпоинта API и сравнить с бюджетом')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--user', help='Email пользователя для запросов')
+        parser.add_argument('--budget', default=DEFAULT_BUDGET)
+        parser.add_argument(
+            '--write-budget', action='store_true',
+            help='Записать текущие замеры в файл бюджета',
+        )
+        parser.add_argument('--only', nargs='*', default=(),
+                            help='Замерить только указанные эндпоинты')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        params = self.get_params(user)
+        clients = {False: APIClient(), True: APIClient()}
+        clients[True].force_authenticate(user)
+        endpoints = [endpoint for endpoint in ENDPOINTS
+                     if not options['only'] or endpoint[0] in options['only']]
+        results = {name: {'times': []} for name, *_ in endpoints}
+        # Первый проход прогревает кэши и замеряет пиковую память,
+        # остальные замеряют время и число запросов.
+        for iteration in range(options['iterations'] + 1):
+            for name, method, url, auth in endpoints:
+                client = clients[auth]
+                with self.rollback(method):
+                    if name in SETUP:
+                        setup_method, setup_url = SETUP[name]
+                        self.request(
+                            client, setup_method, setup_url.format(**params))
+                    self.measure(
+                        client, method, url.format(**params), results[name],
+                        warmup=iteration == 0,
+                    )
+        measured = {
+            name: {
+                'status': result['status'],
+                'queries': result['queries'],
+                'p50_ms': round(percentile(result['times'], 50), 2),
+                'p95_ms': round(percentile(result['times'], 95), 2),
+                'peak_memory_kb': result['peak_memory_kb'],
+            } for name, result in results.items()
+        }
+        self.report(measured)
+        if options['write_budget']:
+            self.write_budget(options['budget'], measured)
+            return
+        self.check_budget(options['budget'], measured)
+
+    def get_user(self, email):
+        users = User.objects.all()
+        if email:
+            users = users.filter(email=email)
+        user = users.annotate(
+            cart_size=Count('shopping_cart')
+        ).order_by('-cart_size', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, сначала выполните seed_data')
+        return user
+
+    def get_params(self, user):
+        recipe = Recipe.objects.filter(
+            id__in=ShoppingCart.objects.filter(
+                user=user).values('recipe_id')
+        ).first() or Recipe.objects.first()
+        free_recipe = Recipe.objects.exclude(
+            id__in=Favorite.objects.filter(user=user).values('recipe_id')
+        ).exclude(
+            id__in=ShoppingCart.objects.filter(user=user).values('recipe_id')
+        ).first()
+        free_author = User.objects.exclude(id=user.id).exclude(
+            following__user=user).first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.first()
+        if None in (recipe, free_recipe, free_author, tag, ingredient):
+            raise CommandError(
+                'Недостаточно данных, сначала выполните seed_data')
+        return {
+            'recipe': recipe.id,
+            'author': recipe.author_id,
+            'free_recipe': free_recipe.id,
+            'free_author': free_author.id,
+            'tag': tag.slug,
+            'tag_id': tag.id,
+            'ingredient': ingredient.id,
+            'prefix': ingredient.name[:2],
+            'search': recipe.name.split()[0],
+            'last_page': -(-Recipe.objects.count() // 6),
+            'cursor': self.get_cursor(user),
+        }
+
+    def get_cursor(self, user):
+        """Курсор середины ленты рецептов."""
+        client = APIClient()
+        client.force_authenticate(user)
+        page = Recipe.objects.count() // 2 or 1
+        url = client.get(f'/api/recipes/?cursor=&limit={page}').data['next']
+        return parse_qs(urlsplit(url).query)['cursor'][0] if url else ''
+
+    @contextmanager
+    def rollback(self, method):
+        """Откатить изменения, сделанные запросом."""
+        if method == 'get':
+            yield
+            return
+        with transaction.atomic():
+            yield
+            transaction.set_rollback(True)
+
+    def measure(self, client, method, url, result, warmup):
+        if warmup:
+            tracemalloc.start()
+            self.request(client, method, url)
+            result['peak_memory_kb'] = (
+                tracemalloc.get_traced_memory()[1] // 1024)
+            tracemalloc.stop()
+            return
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result['status'] = self.request(client, method, url)
+            elapsed = time.perf_counter() - started
+        result['times'].append(elapsed * 1000)
+        result['queries'] = sum(
+            not query['sql'].startswith(TRANSACTION_STATEMENTS)
+            for query in queries.captured_queries
+        )
+
+    def request(self, client, method, url):
+        response = getattr(client, method)(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def report(self, measured):
+        self.stdout.write(
+            f'{"endpoint":<28}{"status":>7}{"queries":>8}{"p50 ms":>10}'
+            f'{"p95 ms":>10}{"peak KB":>10}'
+        )
+        for name, result in measured.items():
+            self.stdout.write(
+                f'{name:<28}{result["status"]:>7}{result["queries"]:>8}'
+                f'{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+                f'{result["peak_memory_kb"]:>10}'
+            )
+
+    def write_budget(self, path, measured):
+        budget = {
+            name: {
+                'queries': result['queries'],
+                'p95_ms': round(result['p95_ms'] * 3 + 20),
+                'peak_memory_kb': result['peak_memory_kb'] * 2 + 256,
+            } for name, result in measured.items()
+        }
+        with open(path, 'w', encoding='utf-8') as budget_file:
+            json.dump(budget, budget_file, indent=4)
+            budget_file.write('\n')
+        self.stdout.write(f'Бюджет записан в {path}')
+
+    def check_budget(self, path, measured):
+        try:
+            with open(path, encoding='utf-8') as budget_file:
+                budget = json.load(budget_file)
+        except FileNotFoundError:
+            raise CommandError(f'Файл бюджета {path} не найден')
+        errors = []
+        for name, result in measured.items():
+            if result['status'] >= 400:
+                errors.append(f'{name}: статус ответа {result["status"]}')
+            for metric, limit in budget.get(name, {}).items():
+                if result[metric] > limit:
+                    errors.append(
+                        f'{name}: {metric} = {result[metric]} > {limit}')
+        if errors:
+            raise CommandError(
+                'Бюджет превышен:\n' + '\n'.join(errors))
+        self.stdout.write(self.style.SUCCESS('Бюджет соблюдён.'))
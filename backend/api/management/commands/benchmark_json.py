@@ -0,0 +1,101 @@
+import io
+import time
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeReadSerializer
+from recipes.models import Recipe
+from users.models import User
+
+# Название, рендерер, парсер.
+IMPLEMENTATIONS = (
+    ('json', JSONRenderer(), JSONParser()),
+    ('orjson', FastJSONRenderer(), FastJSONParser()),
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнить скорость кодирования и разбора JSON для страниц '
+            'рецептов стандартным json и orjson')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--sizes', type=int, nargs='*', default=(6, 100),
+                            help='Размеры страниц рецептов')
+        parser.add_argument('--user', help='Email пользователя для запросов')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write(
+                'orjson не установлен, быстрые классы работают через json.')
+        request = self.get_request(options['user'])
+        self.stdout.write(
+            f'{"page":>6}{"bytes":>10}{"library":>9}{"encode/s":>11}'
+            f'{"MB/s":>9}{"decode/s":>11}{"MB/s":>9}'
+        )
+        for size in options['sizes']:
+            page = self.get_page(request, size)
+            expected = None
+            for name, renderer, parser in IMPLEMENTATIONS:
+                content = renderer.render(page)
+                if expected is None:
+                    expected = content
+                elif content != expected:
+                    raise CommandError(
+                        f'{name}: результат отличается от json '
+                        f'на странице из {size} рецептов')
+                if parser.parse(io.BytesIO(content)) != page:
+                    raise CommandError(
+                        f'{name}: разобранная страница отличается от '
+                        f'исходной')
+                encode = self.measure(
+                    options['iterations'], renderer.render, page)
+                decode = self.measure(
+                    options['iterations'],
+                    lambda: parser.parse(io.BytesIO(content)))
+                megabytes = len(content) / 2 ** 20
+                self.stdout.write(
+                    f'{size:>6}{len(content):>10}{name:>9}'
+                    f'{encode:>11.0f}{encode * megabytes:>9.1f}'
+                    f'{decode:>11.0f}{decode * megabytes:>9.1f}'
+                )
+
+    def get_request(self, email):
+        users = User.objects.all()
+        if email:
+            users = users.filter(email=email)
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, сначала выполните seed_data')
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        return request
+
+    def get_page(self, request, size):
+        """Страница рецептов в том виде, в каком её отдаёт API."""
+        recipes = list(Recipe.objects.only(
+            'id', 'author_id', 'pub_date').order_by('-pub_date')[:size])
+        if not recipes:
+            raise CommandError('Нет рецептов, сначала выполните seed_data')
+        return OrderedDict([
+            ('count', Recipe.objects.count()),
+            ('next', 'http://testserver/api/recipes/?page=2'),
+            ('previous', None),
+            ('results', RecipeReadSerializer(
+                recipes, many=True, context={'request': request}).data),
+        ])
+
+    def measure(self, iterations, function, *args):
+        """Число вызовов в секунду."""
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function(*args)
+        return iterations / (time.perf_counter() - started)
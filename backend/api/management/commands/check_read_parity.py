@@ -0,0 +1,89 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.representations import build_recipe_bodies
+from api.serializers import RecipeReadSerializer, apply_viewer_flags
+from recipes.models import Recipe
+from users.models import User
+
+# Сколько расхождений показывать.
+MAX_ERRORS = 10
+
+
+class Command(BaseCommand):
+    help = ('Проверить, что быстрые представления рецептов совпадают с '
+            'RecipeReadSerializer байт в байт')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', nargs='*', default=None,
+            help='Email пользователей, для которых сравнивать флаги; по '
+                 'умолчанию анонимный и пользователь с самым большим '
+                 'избранным',
+        )
+        parser.add_argument('--limit', type=int,
+                            help='Проверить только столько рецептов')
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        users = self.get_users(options['user'])
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True)
+        if options['limit'] is not None:
+            recipe_ids = recipe_ids[:options['limit']]
+        recipe_ids = list(recipe_ids)
+        size = options['chunk_size']
+        errors = []
+        for user in users:
+            request = Request(APIRequestFactory().get('/api/recipes/'))
+            request.user = user
+            for start in range(0, len(recipe_ids), size):
+                errors += self.compare(
+                    request, recipe_ids[start:start + size])
+        if errors:
+            raise CommandError(
+                f'Расхождений: {len(errors)}\n'
+                + '\n'.join(errors[:MAX_ERRORS]))
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено рецептов: {len(recipe_ids)}, пользователей: '
+            f'{len(users)}. Расхождений нет.'))
+
+    def get_users(self, emails):
+        if emails is not None:
+            users = list(User.objects.filter(email__in=emails))
+            if len(users) != len(set(emails)):
+                raise CommandError('Не все пользователи найдены')
+            return users
+        user = User.objects.annotate(
+            favorites_count=Count('favorites')
+        ).order_by('-favorites_count', 'id').first()
+        return [AnonymousUser()] + ([user] if user else [])
+
+    def compare(self, request, recipe_ids):
+        """Расхождения между сериализатором и build_recipe_bodies."""
+        expected = {
+            recipe.id: RecipeReadSerializer(
+                recipe, context={'request': request}).data
+            for recipe in Recipe.objects.for_user(request.user).filter(
+                id__in=recipe_ids)
+        }
+        actual = {
+            recipe['id']: recipe for recipe in apply_viewer_flags(
+                build_recipe_bodies(recipe_ids, request), recipe_ids,
+                request.user)
+        }
+        renderer = JSONRenderer()
+        errors = []
+        for id in recipe_ids:
+            expected_content = renderer.render(expected.get(id))
+            actual_content = renderer.render(actual.get(id))
+            if expected_content != actual_content:
+                errors.append(
+                    f'рецепт {id}, пользователь {request.user}:\n'
+                    f'  сериализатор: {expected_content.decode()[:500]}\n'
+                    f'  быстрый путь: {actual_content.decode()[:500]}')
+        return errors
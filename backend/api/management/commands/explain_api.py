@@ -0,0 +1,111 @@
+import re
+
+from django.core.cache import cache
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .benchmark_api import ENDPOINTS
+from .benchmark_api import Command as BenchmarkCommand
+
+EXPLAIN = {
+    'postgresql': 'EXPLAIN (ANALYZE, BUFFERS) ',
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+}
+# Использованные индексы и полные просмотры таблиц в строках плана.
+INDEX_PATTERNS = (
+    re.compile(r'Scan(?: Backward)? using (\w+)'),
+    re.compile(r'Bitmap Index Scan on (\w+)'),
+    re.compile(r'USING (?:COVERING )?INDEX (\w+)'),
+)
+FULL_SCAN_PATTERNS = (
+    re.compile(r'Seq Scan on (\w+)'),
+    re.compile(r'^SCAN (?:TABLE )?(\w+)$'),
+)
+
+
+def find_all(patterns, lines, names=None):
+    return sorted({
+        match for line in lines for pattern in patterns
+        for match in pattern.findall(line.strip())
+        if names is None or match in names
+    })
+
+
+class Command(BenchmarkCommand):
+    help = ('Выполнить EXPLAIN ANALYZE (на SQLite - EXPLAIN QUERY PLAN) '
+            'для SQL-запросов каждого эндпоинта API и показать, какие '
+            'индексы они используют')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Email пользователя для запросов')
+        parser.add_argument('--only', nargs='*', default=(),
+                            help='Проверить только указанные эндпоинты')
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым эндпоинтом, чтобы увидеть все '
+                 'запросы, а не только те, что идут мимо кэша',
+        )
+        parser.add_argument('--plans', action='store_true',
+                            help='Печатать запросы и планы целиком')
+
+    def handle(self, *args, **options):
+        prefix = EXPLAIN.get(connection.vendor)
+        if prefix is None:
+            raise CommandError(
+                f'EXPLAIN для {connection.vendor} не поддерживается')
+        user = self.get_user(options['user'])
+        params = self.get_params(user)
+        clients = {False: APIClient(), True: APIClient()}
+        clients[True].force_authenticate(user)
+        # В планах SQLite встречаются и псевдонимы подзапросов.
+        tables = set(connection.introspection.table_names())
+        summary = []
+        for name, method, url, auth in ENDPOINTS:
+            if options['only'] and name not in options['only']:
+                continue
+            url = url.format(**params)
+            if options['cold']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.request(clients[auth], method, url)
+            # Пишущие запросы EXPLAIN ANALYZE выполнил бы ещё раз.
+            selects = list(dict.fromkeys(
+                query['sql'] for query in queries.captured_queries
+                if query['sql'].lstrip().upper().startswith(('SELECT', 'WITH'))
+            ))
+            plans = [self.explain(prefix, sql) for sql in selects]
+            lines = [line for plan in plans for line in plan]
+            summary.append((
+                name, len(queries.captured_queries), len(selects),
+                find_all(INDEX_PATTERNS, lines),
+                find_all(FULL_SCAN_PATTERNS, lines, tables),
+            ))
+            if options['plans']:
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f'{name}: {method.upper()} {url}'))
+                for sql, plan in zip(selects, plans):
+                    self.stdout.write(sql)
+                    self.stdout.write('\n'.join(
+                        f'    {line}' for line in plan) + '\n')
+        self.write_summary(summary)
+
+    def explain(self, prefix, sql):
+        """Строки плана запроса."""
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            rows = cursor.fetchall()
+        if connection.vendor == 'sqlite':
+            return [row[-1] for row in rows]
+        return [row[0] for row in rows]
+
+    def write_summary(self, summary):
+        for name, queries, selects, indexes, full_scans in summary:
+            self.stdout.write(
+                f'{name:<28}{queries:>3} запросов, {selects:>2} SELECT')
+            if indexes:
+                self.stdout.write(f'    индексы: {", ".join(indexes)}')
+            if full_scans:
+                self.stdout.write(self.style.WARNING(
+                    f'    полный просмотр: {", ".join(full_scans)}'))
@@ -0,0 +1,270 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from api.renderers import FastJSONRenderer
+from api.representations import get_ingredients, get_tags
+from recipes.models import Recipe
+from users.models import User
+
+AUTHOR_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name')
+RECIPE_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'text', 'cooking_time', 'pub_date')
+USER_FIELDS = AUTHOR_FIELDS + (
+    'date_joined', 'recipes_count', 'followers_count')
+# Колонки CSV; вложенные значения пишутся в них строкой JSON, даты - как
+# в JSON.
+COLUMNS = {
+    'recipes': ('id', 'name', 'text', 'cooking_time', 'pub_date', 'image',
+                'author', 'tags', 'ingredients'),
+    'users': USER_FIELDS,
+}
+MANIFEST = 'manifest.json'
+
+
+def get_rows(model, fields, first, last, chunk_size):
+    """Строки диапазона pk пачками по chunk_size."""
+    rows = model.objects.filter(pk__range=(first, last)).order_by(
+        'pk').values_list(*fields).iterator(chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_recipes(first, last, chunk_size):
+    for rows in get_rows(Recipe, RECIPE_FIELDS, first, last, chunk_size):
+        recipe_ids = [row[0] for row in rows]
+        authors = {
+            author['id']: author for author in User.objects.filter(
+                id__in={row[1] for row in rows}).values(*AUTHOR_FIELDS)
+        }
+        tags = get_tags(recipe_ids)
+        ingredients = get_ingredients(recipe_ids)
+        for id, author_id, name, image, text, cooking_time, pub_date in rows:
+            yield {
+                'id': id,
+                'name': name,
+                'text': text,
+                'cooking_time': cooking_time,
+                'pub_date': pub_date,
+                'image': image or None,
+                'author': authors[author_id],
+                'tags': tags.get(id, []),
+                'ingredients': ingredients.get(id, []),
+            }
+
+
+def export_users(first, last, chunk_size):
+    for rows in get_rows(User, USER_FIELDS, first, last, chunk_size):
+        for row in rows:
+            yield dict(zip(USER_FIELDS, row))
+
+
+EXPORTERS = {
+    'recipes': (Recipe, export_recipes),
+    'users': (User, export_users),
+}
+
+
+def write_jsonl(file, name, records):
+    render = FastJSONRenderer().render
+    for record in records:
+        file.write(render(record) + b'\n')
+
+
+def write_csv(file, name, records):
+    renderer = FastJSONRenderer()
+    encode = renderer.encoder_class().default
+    text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(COLUMNS[name])
+    for record in records:
+        writer.writerow([
+            renderer.render(value).decode() if isinstance(value, (dict, list))
+            else encode(value) if isinstance(value, datetime) else value
+            for value in (record[column] for column in COLUMNS[name])
+        ])
+    text.detach()
+
+
+WRITERS = {
+    'jsonl': write_jsonl,
+    'csv': write_csv,
+}
+
+
+class CountingWriter:
+    """Считает размер и SHA-256 того, что записано на диск."""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def export_partition(name, first, last, path, file_format, compress_level,
+                     chunk_size):
+    """Выгрузить диапазон pk в файл; выполняется в отдельном процессе.
+
+    Пустой диапазон файла не оставляет, тогда возвращается None.
+    """
+    started = time.monotonic()
+    exporter = EXPORTERS[name][1]
+    records = 0
+
+    def counted(records_iterator):
+        nonlocal records
+        for record in records_iterator:
+            records += 1
+            yield record
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as raw:
+        output = CountingWriter(raw)
+        if compress_level:
+            file = gzip.GzipFile(
+                filename='', mode='wb', fileobj=output,
+                compresslevel=compress_level, mtime=0)
+        else:
+            file = output
+        WRITERS[file_format](
+            file, name, counted(exporter(first, last, chunk_size)))
+        if compress_level:
+            file.close()
+    if not records:
+        os.remove(temporary)
+        return None
+    os.replace(temporary, path)
+    return {
+        'file': os.path.basename(path),
+        'first_id': first,
+        'last_id': last,
+        'records': records,
+        'bytes': output.size,
+        'sha256': output.sha256.hexdigest(),
+        'seconds': round(time.monotonic() - started, 3),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Выгрузить рецепты (с тегами, ингредиентами и автором) и '
+            'пользователей в сжатые JSON Lines или CSV по диапазонам pk '
+            'параллельно в нескольких процессах')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Папка для файлов выгрузки')
+        parser.add_argument('--models', nargs='*', choices=sorted(EXPORTERS),
+                            default=sorted(EXPORTERS))
+        parser.add_argument('--format', choices=sorted(WRITERS),
+                            default='jsonl')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument(
+            '--partition-size', type=int, default=100000,
+            help='Ширина диапазона pk в одном файле',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько строк читать из базы за раз',
+        )
+        parser.add_argument(
+            '--compress-level', type=int, default=6, choices=range(10),
+            help='Уровень gzip; 0 - без сжатия',
+        )
+
+    def handle(self, *args, **options):
+        output = options['output']
+        os.makedirs(output, exist_ok=True)
+        if os.path.exists(os.path.join(output, MANIFEST)):
+            raise CommandError(f'В {output} уже есть выгрузка')
+        started = time.monotonic()
+        extension = options['format'] + (
+            '.gz' if options['compress_level'] else '')
+        tasks = [
+            (name, first, last,
+             os.path.join(output, f'{name}-{number:05}.{extension}'),
+             options['format'], options['compress_level'],
+             options['chunk_size'])
+            for name in options['models']
+            for number, (first, last) in enumerate(self.get_partitions(
+                EXPORTERS[name][0], options['partition_size']))
+        ]
+        # Дочерние процессы не должны делить соединение с родителем.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('fork'),
+        ) as executor:
+            futures = [
+                (task[0], executor.submit(export_partition, *task))
+                for task in tasks
+            ]
+            partitions = {name: [] for name in options['models']}
+            for name, future in futures:
+                partition = future.result()
+                if partition is None:
+                    continue
+                partitions[name].append(partition)
+                self.stdout.write(
+                    f'{partition["file"]}: {partition["records"]} записей '
+                    f'за {partition["seconds"]:.1f} с')
+        self.write_manifest(output, options, partitions)
+        for name, items in partitions.items():
+            self.stdout.write(
+                f'{name}: {sum(item["records"] for item in items)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгрузка завершена за {time.monotonic() - started:.1f} с.'))
+
+    @staticmethod
+    def get_partitions(model, size):
+        bounds = model.objects.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            return []
+        return [
+            (first, min(first + size - 1, bounds['last']))
+            for first in range(bounds['first'], bounds['last'] + 1, size)
+        ]
+
+    @staticmethod
+    def write_manifest(output, options, partitions):
+        """Манифест пишется последним: его наличие значит, что выгрузка
+        завершена."""
+        manifest = {
+            'created': timezone.now().isoformat(),
+            'format': options['format'],
+            'compression': 'gzip' if options['compress_level'] else None,
+            'models': {
+                name: {
+                    'records': sum(item['records'] for item in items),
+                    'partitions': items,
+                } for name, items in partitions.items()
+            },
+        }
+        temporary = os.path.join(output, f'{MANIFEST}.tmp')
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2)
+        os.replace(temporary, os.path.join(output, MANIFEST))
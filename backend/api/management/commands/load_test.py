@@ -0,0 +1,201 @@
+import asyncio
+import json
+import os
+import time
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import CommandError
+from rest_framework.authtoken.models import Token
+
+from .benchmark_api import ENDPOINTS
+from .benchmark_api import Command as BenchmarkCommand
+from .benchmark_api import percentile
+
+# Эндпоинты, которые в основном читают.
+READ_ENDPOINTS = (
+    'recipes-list-anonymous', 'recipes-list', 'recipes-detail', 'tags-list',
+    'ingredients-search', 'download-shopping-cart',
+    'download-shopping-cart-pdf',
+)
+TIMEOUT = 60
+
+
+def get_rss(pid):
+    """Суммарная память процесса и всех его потомков в байтах."""
+    parents = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as stat:
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        parents[int(name)] = int(fields[1])
+    pids = {pid}
+    while True:
+        children = {child for child, parent in parents.items()
+                    if parent in pids} - pids
+        if not children:
+            break
+        pids |= children
+    pages = 0
+    for process in pids:
+        try:
+            with open(f'/proc/{process}/statm') as statm:
+                pages += int(statm.read().split()[1])
+        except OSError:
+            continue
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class Command(BenchmarkCommand):
+    help = ('Нагрузить запущенный сервер параллельными запросами к '
+            'читающим эндпоинтам (и, при желании, медленными загрузками) и '
+            'показать пропускную способность и время ответа')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--user', help='Email пользователя для запросов')
+        parser.add_argument('--only', nargs='*', default=READ_ENDPOINTS,
+                            help='Эндпоинты из benchmark_api')
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--duration', type=float, default=20,
+                            help='Длительность в секундах')
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Клиенты, которые всё время медленно загружают тело '
+                 'POST-запроса, как загрузка картинки по плохой сети',
+        )
+        parser.add_argument('--slow-size', type=int, default=16 * 1024,
+                            help='Размер тела медленной загрузки в байтах')
+        parser.add_argument('--slow-rate', type=int, default=1024,
+                            help='Скорость медленной загрузки в байтах/с')
+        parser.add_argument(
+            '--server-pid', type=int,
+            help='pid главного процесса сервера: показать пиковую память '
+                 'его и всех воркеров',
+        )
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Нужен адрес вида http://host:port')
+        user = self.get_user(options['user'])
+        params = self.get_params(user)
+        token = Token.objects.get_or_create(user=user)[0].key
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.headers = {
+            False: f'Host: {url.netloc}\r\n',
+            True: f'Host: {url.netloc}\r\nAuthorization: Token {token}\r\n',
+        }
+        self.requests = [
+            (name, quote(url.format(**params), safe='/?&=%'), auth)
+            for name, method, url, auth in ENDPOINTS
+            if name in options['only'] and method == 'get'
+        ]
+        if not self.requests:
+            raise CommandError('Нет подходящих эндпоинтов')
+        self.results = {name: [] for name, _, _ in self.requests}
+        self.errors = {name: 0 for name, _, _ in self.requests}
+        self.uploads = 0
+        self.peak_rss = 0
+        started = time.monotonic()
+        asyncio.run(self.run(options))
+        self.write_report(options, time.monotonic() - started)
+
+    async def run(self, options):
+        deadline = time.monotonic() + options['duration']
+        tasks = [
+            self.client(index, deadline)
+            for index in range(options['concurrency'])
+        ] + [
+            self.slow_client(deadline, options['slow_size'],
+                             options['slow_rate'])
+            for _ in range(options['slow_clients'])
+        ]
+        if options['server_pid']:
+            tasks.append(self.watch_memory(options['server_pid'], deadline))
+        await asyncio.gather(*tasks)
+
+    async def request(self, head, body=b'', rate=None):
+        """Отправить запрос HTTP/1.0 и вернуть код ответа."""
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(head.encode())
+            if rate is None:
+                writer.write(body)
+            else:
+                for start in range(0, len(body), rate):
+                    writer.write(body[start:start + rate])
+                    await writer.drain()
+                    await asyncio.sleep(1)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        return int(response.split(b' ', 2)[1])
+
+    async def client(self, index, deadline):
+        """Запросы к эндпоинтам по кругу, пока не выйдет время."""
+        while time.monotonic() < deadline:
+            name, url, auth = self.requests[index % len(self.requests)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(self.request(
+                    f'GET {url} HTTP/1.0\r\n{self.headers[auth]}\r\n'
+                ), TIMEOUT)
+            except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+                status = None
+            if status is None or status >= 400:
+                self.errors[name] += 1
+                continue
+            self.results[name].append(
+                (time.perf_counter() - started) * 1000)
+
+    async def slow_client(self, deadline, size, rate):
+        """Загрузка тела POST-запроса со скоростью rate байт в секунду.
+
+        Тело - заведомо неполный рецепт: сервер ответит 400, не записав
+        ничего в базу. Незаконченная к концу замера загрузка прерывается.
+        """
+        body = json.dumps({'name': 'x' * max(size - 12, 0)}).encode()
+        head = (
+            f'POST /api/recipes/ HTTP/1.0\r\n{self.headers[True]}'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n'
+        )
+        while time.monotonic() < deadline:
+            try:
+                await asyncio.wait_for(
+                    self.request(head, body, rate),
+                    max(deadline - time.monotonic(), 0))
+            except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+                continue
+            self.uploads += 1
+
+    async def watch_memory(self, pid, deadline):
+        while time.monotonic() < deadline:
+            self.peak_rss = max(self.peak_rss, get_rss(pid))
+            await asyncio.sleep(0.5)
+
+    def write_report(self, options, elapsed):
+        self.stdout.write(
+            f'{"endpoint":<28}{"requests":>9}{"errors":>8}{"p50 ms":>10}'
+            f'{"p95 ms":>10}'
+        )
+        for name, times in self.results.items():
+            self.stdout.write(
+                f'{name:<28}{len(times):>9}{self.errors[name]:>8}'
+                f'{percentile(times, 50) if times else 0:>10.1f}'
+                f'{percentile(times, 95) if times else 0:>10.1f}'
+            )
+        total = sum(len(times) for times in self.results.values())
+        self.stdout.write(f'Запросов в секунду: {total / elapsed:.1f}')
+        if options['slow_clients']:
+            self.stdout.write(f'Медленных загрузок завершено: {self.uploads}')
+        if options['server_pid']:
+            self.stdout.write(
+                f'Пиковая память сервера: {self.peak_rss / 2 ** 20:.0f} МБ')
@@ -1,6 +1,203 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+FALSE_VALUES = ('0', 'false', 'False')
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная навигация по номеру страницы.
+
+    С параметром count=false общее количество не считается: запрашивается
+    на один объект больше страницы, чтобы узнать, есть ли следующая.
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.with_count = request.query_params.get(
+            self.count_query_param) not in FALSE_VALUES
+        if self.with_count:
+            return super().paginate_queryset(queryset, request, view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        page_number = request.query_params.get(self.page_query_param, 1)
+        try:
+            self.number = int(page_number)
+            if self.number < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message='Неверный номер страницы.'))
+        offset = (self.number - 1) * page_size
+        items = list(queryset[offset:offset + page_size + 1])
+        if not items and self.number > 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message='Страница пуста.'))
+        self.has_next = len(items) > page_size
+        self.request = request
+        return items[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.with_count:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if self.with_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param, self.number + 1)
+
+    def get_previous_link(self):
+        if self.with_count:
+            return super().get_previous_link()
+        if self.number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.number - 1)
+
+
+class KeysetPagination(BasePagination):
+    """Навигация по курсору без OFFSET и COUNT.
+
+    Курсор хранит значения полей сортировки последнего (или первого)
+    объекта страницы, следующая страница выбирается условием по ним.
+    Сортировка берётся из атрибута keyset_ordering представления,
+    последним полем должен идти уникальный ключ.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = view.keyset_ordering
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+        values, self.reverse = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param))
+        ordering = self.ordering
+        if self.reverse:
+            ordering = [self.invert(name) for name in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.get_filter(ordering, values))
+        items = list(queryset[:self.page_size + 1])
+        has_more = len(items) > self.page_size
+        items = items[:self.page_size]
+        if self.reverse:
+            items.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = values is not None
+        self.page = items
+        return items
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return page_size
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    @staticmethod
+    def invert(name):
+        return name[1:] if name.startswith('-') else f'-{name}'
+
+    def get_filter(self, ordering, values):
+        """Условие «строго после» кортежа values в порядке ordering."""
+        condition = Q()
+        equal = {}
+        for name, value in zip(ordering, values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def encode_cursor(self, item, reverse):
+        values = [
+            field.value_to_string(item) for field in self.fields
+        ]
+        data = json.dumps({'v': values, 'r': reverse}).encode()
+        cursor = base64.urlsafe_b64encode(data).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, cursor)
+
+    def decode_cursor(self, cursor):
+        """Значения полей и направление; пустой курсор - первая страница."""
+        if not cursor:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            values = [
+                field.to_python(value)
+                for field, value in zip(self.fields, data['v'])
+            ]
+            if len(values) != len(self.fields):
+                raise ValueError
+            return values, bool(data['r'])
+        except (binascii.Error, KeyError, TypeError, ValueError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(BasePagination):
+    """Навигация, выбираемая запросом: по курсору, если передан параметр
+    cursor (пустой - первая страница), иначе по номеру страницы."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.paginator = KeysetPagination()
+        else:
+            self.paginator = CustomPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
@@ -0,0 +1,27 @@
+"""Парсер JSON на orjson; без библиотеки работает обычный JSONParser."""
+import codecs
+
+from django.conf import settings
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+from .renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(parsers.JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        content = stream.read()
+        try:
+            # orjson читает только UTF-8 и, как JSONParser со STRICT_JSON,
+            # не принимает NaN и Infinity.
+            if codecs.lookup(encoding).name != 'utf-8':
+                content = content.decode(encoding)
+            return orjson.loads(content)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,184 @@
+"""Потоковая запись PDF из строк текста.
+
+reportlab собирает документ в памяти и отдаёт его целиком только в
+save(). Здесь каждая страница записывается сразу, как только готова, а
+то, что нужно всему документу (дерево страниц, шрифты, таблица xref),
+дописывается в конце: PDF разрешает ссылаться на объекты, записанные
+позже. Шрифт TrueType читается и урезается до использованных символов
+средствами reportlab.
+"""
+import functools
+import os
+import zlib
+
+from reportlab.pdfbase.ttfonts import (FF_NONSYMBOLIC, FF_SYMBOLIC, SUBSETN,
+                                       TTFont, makeToUnicodeCMap)
+
+HEADER = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+# Номера объектов, на которые ссылаются страницы, но которые
+# записываются в конце.
+CATALOG, PAGES, RESOURCES = 1, 2, 3
+# Шрифт, если файла TrueType нет: кириллицу он не покажет.
+STANDARD_FONT = (
+    b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+    b'/Encoding /WinAnsiEncoding >>'
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(path):
+    """Разобранный шрифт TrueType или None, если файла нет."""
+    if not os.path.exists(path):
+        return None
+    return TTFont(os.path.basename(path), path)
+
+
+def escape(text):
+    """Строка PDF в круглых скобках."""
+    return b'(' + b''.join(
+        bytes((code,)) if 32 <= code < 127 and code not in b'()\\'
+        else b'\\%03o' % code
+        for code in text
+    ) + b')'
+
+
+def stream(content, **entries):
+    """Сжатый поток с записями словаря entries."""
+    data = zlib.compress(content)
+    header = b''.join(
+        b'/%s %d ' % (key.encode(), value) for key, value in entries.items())
+    return (b'<< %s/Length %d /Filter /FlateDecode >>\nstream\n'
+            % (header, len(data)) + data + b'\nendstream')
+
+
+class StreamingPDF:
+    """PDF, который отдаётся по странице.
+
+    begin() возвращает заголовок, add_page() - байты очередной страницы,
+    end() - хвост документа.
+    """
+
+    def __init__(self, font_path, page_size, lines_per_page, margin=50,
+                 font_size=12):
+        self.font = get_font(font_path)
+        self.width, self.height = page_size
+        self.margin = margin
+        self.step = (self.height - 2 * margin) / lines_per_page
+        self.font_size = font_size
+        self.offset = 0
+        self.offsets = {}
+        self.next_number = RESOURCES + 1
+        self.pages = []
+
+    def write(self, body, number=None):
+        """Байты объекта; без number он получает следующий номер."""
+        if number is None:
+            number = self.next_number
+            self.next_number += 1
+        data = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        self.offsets[number] = self.offset
+        self.offset += len(data)
+        return number, data
+
+    def begin(self):
+        self.offset = len(HEADER)
+        return HEADER
+
+    def show(self, text):
+        """Операторы вывода строки текущим шрифтом."""
+        if self.font is None:
+            return b'/F0 %d Tf %s Tj' % (
+                self.font_size,
+                escape(text.encode('cp1252', errors='replace')),
+            )
+        return b' '.join(
+            b'/F%d %d Tf %s Tj' % (subset, self.font_size, escape(chunk))
+            for subset, chunk in self.font.splitString(text, self)
+        )
+
+    def add_page(self, lines):
+        """Страница со строками lines сверху вниз."""
+        content = b'\n'.join(
+            b'BT 1 0 0 1 %d %.2f Tm %s ET' % (
+                self.margin,
+                self.height - self.margin - index * self.step,
+                self.show(line),
+            ) for index, line in enumerate(lines)
+        )
+        number, contents = self.write(stream(content))
+        page, data = self.write((
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources %d 0 R /Contents %d 0 R >>'
+        ) % (PAGES, self.width, self.height, RESOURCES, number))
+        self.pages.append(page)
+        return contents + data
+
+    def fonts(self):
+        """Байты объектов шрифтов и их номера по индексам в ресурсах."""
+        if self.font is None:
+            number, data = self.write(STANDARD_FONT)
+            return data, {0: number}
+        state = self.close()
+        subsets = state.subsets if state is not None else ()
+        face = self.font.face
+        objects, names = [], {}
+        for index, subset in enumerate(subsets):
+            name = SUBSETN(index) + b'+' + face.name + face.subfontNameX
+            data = face.makeSubset(subset)
+            file_number, data = self.write(stream(data, Length1=len(data)))
+            objects.append(data)
+            cmap_number, data = self.write(stream(
+                makeToUnicodeCMap(name.decode(), subset).encode()))
+            objects.append(data)
+            descriptor, data = self.write((
+                b'<< /Type /FontDescriptor /FontName /%s /Flags %d '
+                b'/FontBBox [%s] /ItalicAngle %d /Ascent %d /Descent %d '
+                b'/CapHeight %d /StemV %d /MissingWidth %d '
+                b'/FontFile2 %d 0 R >>'
+            ) % (
+                name, face.flags & ~FF_NONSYMBOLIC | FF_SYMBOLIC,
+                b' '.join(b'%d' % value for value in face.bbox),
+                face.italicAngle, face.ascent, face.descent,
+                face.capHeight, face.stemV, face.defaultWidth, file_number,
+            ))
+            objects.append(data)
+            widths = b' '.join(
+                b'%d' % face.getCharWidth(code) for code in subset)
+            names[index], data = self.write((
+                b'<< /Type /Font /Subtype /TrueType /BaseFont /%s '
+                b'/FirstChar 0 /LastChar %d /Widths [%s] '
+                b'/FontDescriptor %d 0 R /ToUnicode %d 0 R >>'
+            ) % (name, len(subset) - 1, widths, descriptor, cmap_number))
+            objects.append(data)
+        return b''.join(objects), names
+
+    def close(self):
+        """Забыть, какие символы каких подмножеств шрифта заняты."""
+        if self.font is not None:
+            return self.font.state.pop(self, None)
+
+    def end(self):
+        """Шрифты, дерево страниц, каталог и таблица xref."""
+        data = b'' if self.pages else self.add_page(())
+        fonts, names = self.fonts()
+        resources = b' '.join(
+            b'/F%d %d 0 R' % item for item in names.items())
+        objects = (
+            (RESOURCES, b'<< /Font << %s >> >>' % resources),
+            (PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                b' '.join(b'%d 0 R' % page for page in self.pages),
+                len(self.pages),
+            )),
+            (CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % PAGES),
+        )
+        data += fonts + b''.join(
+            self.write(body, number)[1] for number, body in objects)
+        size = len(self.offsets) + 1
+        xref = b''.join(
+            b'%010d 00000 n \n' % offset
+            for _, offset in sorted(self.offsets.items()))
+        return data + (
+            b'xref\n0 %d\n0000000000 65535 f \n%s'
+            b'trailer\n<< /Size %d /Root %d 0 R >>\n'
+            b'startxref\n%d\n%%%%EOF\n'
+        ) % (size, xref, size, CATALOG, self.offset)
@@ -0,0 +1,114 @@
+"""Представления рецептов без полей DRF.
+
+RecipeReadSerializer на каждый рецепт, тег, ингредиент и автора проходит
+по полям сериализатора, и на больших страницах это дольше самих запросов.
+Здесь те же словари собираются напрямую из строк .values_list() и
+справочников тегов и ингредиентов в кэше (recipes.reference): пять
+запросов на любое число рецептов, теги и ингредиенты без JOIN.
+
+Результат должен совпадать с RecipeReadSerializer (с флагами анонимного
+пользователя) вплоть до порядка ключей; это проверяют тест
+tests/test_representations.py и команда check_read_parity.
+"""
+from collections import defaultdict
+
+from recipes import reference
+from recipes.models import IngredientAmount, Recipe, RecipeImageVariant
+from users.models import User
+
+RECIPE_FIELDS = ('id', 'author_id', 'name', 'image', 'text', 'cooking_time')
+AUTHOR_FIELDS = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+def get_url_builder(model, request):
+    """Функция имя файла -> ссылка, как у ImageField сериализатора."""
+    storage = model._meta.get_field('image').storage
+    if request is None:
+        return storage.url
+    return lambda name: request.build_absolute_uri(storage.url(name))
+
+
+def get_tags(recipe_ids):
+    """Теги рецептов в порядке модели Tag (он же порядок справочника)."""
+    tag_ids = defaultdict(list)
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids).values_list('recipe_id', 'tag_id'):
+        tag_ids[recipe_id].append(tag_id)
+    tags = reference.tags.get_including(
+        {id for ids in tag_ids.values() for id in ids})
+    position = {item['id']: index for index, item in enumerate(tags.items)}
+    return {
+        recipe_id: [
+            dict(tags.by_id[id]) for id in sorted(
+                (id for id in ids if id in position), key=position.get)
+        ] for recipe_id, ids in tag_ids.items()
+    }
+
+
+def get_ingredients(recipe_ids):
+    rows = list(IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('id').values_list('recipe_id', 'ingredient_id', 'amount'))
+    ingredients = reference.ingredients.get_including(
+        {row[1] for row in rows}).by_id
+    amounts = defaultdict(list)
+    for recipe_id, ingredient_id, amount in rows:
+        # Ингредиент удалили после чтения строк рецепта.
+        if ingredient_id not in ingredients:
+            continue
+        ingredient = ingredients[ingredient_id]
+        amounts[recipe_id].append({
+            'id': ingredient_id,
+            'name': ingredient['name'],
+            'measurement_unit': ingredient['measurement_unit'],
+            'amount': amount,
+        })
+    return amounts
+
+
+def get_images(recipe_ids, sources, request):
+    """Ссылки на варианты картинок, как у get_image_variants."""
+    url = get_url_builder(RecipeImageVariant, request)
+    images = defaultdict(dict)
+    for recipe_id, source, name, file_format, image in (
+        RecipeImageVariant.objects.filter(recipe_id__in=recipe_ids).order_by(
+            'id').values_list('recipe_id', 'source', 'name', 'format', 'image')
+    ):
+        if source == sources[recipe_id]:
+            images[recipe_id].setdefault(name, {})[file_format] = url(image)
+    return images
+
+
+def build_recipe_bodies(recipe_ids, request):
+    """Представления рецептов по id, общие для всех пользователей."""
+    recipes = list(Recipe.objects.filter(
+        id__in=recipe_ids).order_by().values_list(*RECIPE_FIELDS))
+    if not recipes:
+        return {}
+    recipe_ids = [recipe[0] for recipe in recipes]
+    authors = {
+        author['id']: author for author in User.objects.filter(
+            id__in={recipe[1] for recipe in recipes}
+        ).values(*AUTHOR_FIELDS)
+    }
+    tags = get_tags(recipe_ids)
+    ingredients = get_ingredients(recipe_ids)
+    images = get_images(
+        recipe_ids, {recipe[0]: recipe[3] for recipe in recipes}, request)
+    url = get_url_builder(Recipe, request)
+    return {
+        id: {
+            'id': id,
+            'tags': tags.get(id, []),
+            'author': {**authors[author_id], 'is_subscribed': False},
+            'ingredients': ingredients.get(id, []),
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+            'name': name,
+            'image': url(image) if image else None,
+            'images': images.get(id, {}),
+            'text': text,
+            'cooking_time': cooking_time,
+        }
+        for id, author_id, name, image, text, cooking_time in recipes
+    }
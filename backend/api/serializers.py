@@ -1,10 +1,23 @@
-from drf_extra_fields.fields import Base64ImageField
+import hashlib
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import CharField, Value
 from rest_framework import serializers
 
+from core.replicas import use_primary
 from core.validators import validate_min_value, validate_username
+from recipes import reference
 from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingCartIngredient, Tag)
+from recipes.images import schedule_variants
+from recipes.search import index_recipes
+from recipes.versions import get_versions, recipe_version_key
 from users.models import Subscription, User
+from .fields import StreamingBase64ImageField
+from .representations import build_recipe_bodies
 
 
 def get_is_in_list(user, obj, model):
@@ -13,6 +26,30 @@ def get_is_in_list(user, obj, model):
             and model.objects.filter(user=user, recipe=obj).exists())
 
 
+def get_recipes_limit(request):
+    """Количество рецептов автора в выдаче подписок или None."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return None
+    try:
+        recipes_limit = int(recipes_limit)
+        if recipes_limit < 0:
+            raise ValueError
+    except ValueError:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Ожидается целое неотрицательное число.'})
+    return recipes_limit
+
+
+def validate_reference_ids(reference_cache, ids):
+    """Проверить id тегов или ингредиентов по кэшу справочника."""
+    missing = reference_cache.missing(ids)
+    if missing:
+        raise serializers.ValidationError(
+            f'Недопустимый первичный ключ "{missing[0]}" - '
+            f'объект не существует.')
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для любого пользователя."""
 
@@ -25,6 +62,8 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Определяет, подписан ли пользователь на авторов."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -60,7 +99,7 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
 class AddToIngredientAmountSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления количества ингредиентов."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(validators=(validate_min_value,))
 
     class Meta:
@@ -76,12 +115,122 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
+def get_image_variants(recipe, request):
+    """Ссылки на готовые варианты текущей картинки рецепта:
+    {вариант: {формат: url}}."""
+    images = {}
+    for variant in recipe.image_variants.all():
+        if variant.source != recipe.image.name:
+            continue
+        url = variant.image.url
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        images.setdefault(variant.name, {})[variant.format] = url
+    return images
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения рецептов в сокращенном формате."""
 
+    images = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+
+    def get_images(self, obj):
+        return get_image_variants(obj, self.context.get('request'))
+
+
+def get_recipe_bodies(recipe_ids, request):
+    """Представления рецептов, одинаковые для всех пользователей, по id.
+
+    Лежат в кэше под версиями рецепта и справочников, недостающие
+    собирает build_recipe_bodies с флагами анонимного пользователя.
+    """
+    base_url = request.build_absolute_uri('/') if request else ''
+    *versions, tags_version, ingredients_version = get_versions([
+        *(recipe_version_key(id) for id in recipe_ids),
+        reference.tags.version_key,
+        reference.ingredients.version_key,
+    ])
+    keys = {
+        id: 'recipes:body:' + hashlib.sha1(
+            f'{base_url}:{id}:{version}:{tags_version}:'
+            f'{ingredients_version}'.encode()).hexdigest()
+        for id, version in zip(recipe_ids, versions)
+    }
+    cached = cache.get_many(keys.values())
+    bodies = {id: cached[key] for id, key in keys.items() if key in cached}
+    missing = [id for id in recipe_ids if id not in bodies]
+    if missing:
+        with use_primary():
+            built = build_recipe_bodies(missing, request)
+        cache.set_many(
+            {keys[id]: body for id, body in built.items()},
+            settings.RESPONSE_CACHE_TIMEOUT,
+        )
+        bodies.update(built)
+    return bodies
+
+
+def get_viewer_flags(user, recipe_ids, author_ids):
+    """Какие рецепты у пользователя в избранном и списке покупок и на
+    каких авторов он подписан - одним запросом на страницу."""
+    flags = {'is_favorited': set(), 'is_in_shopping_cart': set(),
+             'is_subscribed': set()}
+    if user.is_anonymous or not recipe_ids:
+        return flags
+
+    def rows(queryset, flag, field):
+        return queryset.filter(user=user).annotate(
+            flag=Value(flag, output_field=CharField())
+        ).values_list('flag', field)
+
+    for flag, id in rows(
+        Favorite.objects.filter(recipe_id__in=recipe_ids),
+        'is_favorited', 'recipe_id',
+    ).union(
+        rows(ShoppingCart.objects.filter(recipe_id__in=recipe_ids),
+             'is_in_shopping_cart', 'recipe_id'),
+        rows(Subscription.objects.filter(following_id__in=author_ids),
+             'is_subscribed', 'following_id'),
+        all=True,
+    ):
+        flags[flag].add(id)
+    return flags
+
+
+def apply_viewer_flags(bodies, recipe_ids, user):
+    """Копии представлений рецептов с флагами пользователя; рецепты,
+    которых нет в bodies, пропускаются."""
+    recipe_ids = [id for id in recipe_ids if id in bodies]
+    flags = get_viewer_flags(
+        user, recipe_ids, {bodies[id]['author']['id'] for id in recipe_ids})
+    recipes = []
+    for id in recipe_ids:
+        recipe = dict(bodies[id])
+        recipe['author'] = dict(recipe['author'])
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in flags['is_subscribed'])
+        recipe['is_favorited'] = id in flags['is_favorited']
+        recipe['is_in_shopping_cart'] = id in flags['is_in_shopping_cart']
+        recipes.append(recipe)
+    return recipes
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: общая часть из кэша (get_recipe_bodies), поверх
+    неё флаги текущего пользователя (apply_viewer_flags).
+
+    Рецептам в списке достаточно id: остальное берётся из кэша.
+    """
+
+    def to_representation(self, data):
+        request = self.context['request']
+        recipe_ids = [recipe.id for recipe in data]
+        return apply_viewer_flags(
+            get_recipe_bodies(recipe_ids, request), recipe_ids, request.user)
 
 
 class RecipeReadSerializer(serializers.ModelSerializer):
@@ -92,17 +241,26 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True,)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
+                  'is_in_shopping_cart', 'name', 'image', 'images', 'text',
                   'cooking_time')
+        list_serializer_class = RecipeListSerializer
+
+    def get_images(self, obj):
+        return get_image_variants(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return get_is_in_list(self.context.get('request').user, obj, Favorite)
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return get_is_in_list(
             self.context.get('request').user, obj, ShoppingCart)
 
@@ -110,24 +268,74 @@ class RecipeReadSerializer(serializers.ModelSerializer):
 class RecipeWriteSerializer(RecipeReadSerializer):
     """Сериализатор для рецептов (POST, PATCH, DEL)."""
 
-    image = Base64ImageField()
+    image = StreamingBase64ImageField()
     ingredients = AddToIngredientAmountSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'name', 'image',
                   'text', 'cooking_time')
 
+    def validate_tags(self, tags):
+        validate_reference_ids(reference.tags, tags)
+        return tags
+
+    def validate_ingredients(self, ingredients):
+        validate_reference_ids(
+            reference.ingredients,
+            [ingredient['id'] for ingredient in ingredients])
+        return ingredients
+
     def create_ingredients(self, ingredients, recipe):
         IngredientAmount.objects.bulk_create([IngredientAmount(
-            ingredient=ingredient['id'],
+            ingredient_id=ingredient['id'],
             recipe=recipe,
             amount=ingredient['amount']
         ) for ingredient in ingredients])
 
+    def update_ingredients(self, recipe, ingredients):
+        """Привести ингредиенты рецепта к новому списку: совпадающие строки
+        не трогать, изменённые обновить, лишние удалить.
+
+        Вернуть количество каждого ингредиента в оставшихся строках до и
+        после изменения: удалённые строки вычитает из списков покупок
+        сигнал, а массовые обновление и вставка сигналов не шлют.
+        """
+        existing = defaultdict(list)
+        old_amounts = Counter()
+        for row in IngredientAmount.objects.filter(
+                recipe=recipe).order_by('id'):
+            existing[row.ingredient_id].append(row)
+            old_amounts[row.ingredient_id] += row.amount
+        new_amounts = Counter()
+        changed = []
+        created = []
+        for ingredient in ingredients:
+            id, amount = ingredient['id'], ingredient['amount']
+            new_amounts[id] += amount
+            if existing[id]:
+                row = existing[id].pop(0)
+                if row.amount != amount:
+                    row.amount = amount
+                    changed.append(row)
+            else:
+                created.append(IngredientAmount(
+                    recipe=recipe, ingredient_id=id, amount=amount))
+        removed = []
+        for rows in existing.values():
+            for row in rows:
+                removed.append(row.id)
+                old_amounts[row.ingredient_id] -= row.amount
+        if removed:
+            IngredientAmount.objects.filter(id__in=removed).delete()
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ('amount',))
+        if created:
+            IngredientAmount.objects.bulk_create(created)
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
@@ -135,28 +343,41 @@ class RecipeWriteSerializer(RecipeReadSerializer):
         recipe = Recipe.objects.create(author=user, **validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
-        recipe.save()
+        index_recipes((recipe.id,))
+        schedule_variants(recipe.id)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         instance.name = validated_data.pop('name', instance.name)
         instance.cooking_time = validated_data.pop(
             'cooking_time',
             instance.cooking_time,
         )
-        instance.image = validated_data.pop('image', instance.image)
+        stored_image = instance.image.name
+        image = validated_data.pop('image', None)
+        if image is not None:
+            instance.image = image
         ingredients = validated_data.pop('ingredients')
-        IngredientAmount.objects.filter(recipe=instance).delete()
-        self.create_ingredients(ingredients, instance)
+        ShoppingCartIngredient.objects.change_recipe(
+            instance, *self.update_ingredients(instance, ingredients))
         tags = validated_data.pop('tags')
         instance.tags.set(tags)
         instance.text = validated_data.pop('text', instance.text)
-        return super().update(instance, validated_data)
+        # Счётчики обновляются отдельно, их нельзя перезаписывать.
+        instance.save(update_fields=(
+            'name', 'cooking_time', 'image', 'text', 'updated'))
+        index_recipes((instance.id,))
+        # Та же картинка сохраняется под тем же именем, варианты у неё есть.
+        if instance.image.name != stored_image:
+            schedule_variants(instance.id)
+        return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
         serializer = RecipeReadSerializer(
-            instance,
-            context={'request': self.context.get('request')}
+            Recipe.objects.for_user(request.user).get(pk=instance.pk),
+            context={'request': request}
         )
         return serializer.data
 
@@ -171,10 +392,7 @@ class SubscriptionSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField()
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField(read_only=True)
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
         model = Subscription
@@ -183,6 +401,8 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Определяет, подписан ли пользователь на авторов."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -192,15 +412,16 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        recipes_limit = request.query_params.get('recipes_limit')
-        queryset = Recipe.objects.filter(author=obj)
+        if hasattr(obj, 'latest_recipes'):
+            return RecipeSerializer(
+                obj.latest_recipes, many=True, context=self.context).data
+        recipes_limit = get_recipes_limit(request)
+        queryset = Recipe.objects.filter(author=obj).prefetch_related(
+            'image_variants')
         if recipes_limit is not None:
-            try:
-                queryset = queryset[:int(recipes_limit)]
-                return RecipeSerializer(queryset, many=True).data
-            except ValueError:
-                raise ValueError('Неверный формат данных')
-        return RecipeSerializer(queryset, many=True).data
+            queryset = queryset[:recipes_limit]
+        return RecipeSerializer(
+            queryset, many=True, context=self.context).data
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
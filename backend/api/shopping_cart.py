@@ -0,0 +1,135 @@
+"""Потоковая выгрузка списка покупок в разных форматах."""
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Count, F, Max
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from reportlab.lib.pagesizes import A4
+from rest_framework.exceptions import ValidationError
+
+from recipes import reference
+from recipes.models import ShoppingCart, ShoppingCartIngredient
+from .pdf import StreamingPDF
+
+CHUNK_SIZE = 2000
+PDF_LINES_PER_PAGE = 50
+
+
+def get_ingredients(user):
+    """Суммарное количество каждого ингредиента в списке покупок."""
+    return ShoppingCartIngredient.objects.filter(
+        user=user
+    ).order_by(
+        'ingredient__name'
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        total=F('amount'),
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def get_version(user, file_format):
+    """Вернуть ETag и время последнего изменения списка покупок.
+
+    Названия и единицы измерения ингредиентов берутся из справочника,
+    поэтому в ETag входит и его версия.
+    """
+    cart = ShoppingCart.objects.filter(user=user).aggregate(
+        count=Count('id'),
+        recipes_updated=Max('recipe__updated'),
+    )
+    last_modified = max(filter(None, (
+        user.shopping_cart_updated, cart['recipes_updated'])))
+    timestamp = int(last_modified.timestamp())
+    etag = quote_etag(
+        f'{user.id}-{cart["count"]}-{last_modified.timestamp()}-'
+        f'{reference.ingredients.get_version()}-{file_format}')
+    return etag, timestamp
+
+
+def render_txt(ingredients):
+    for ingredient in ingredients:
+        yield (f'{ingredient["ingredient__name"]} - {ingredient["total"]}'
+               f'{ingredient["ingredient__measurement_unit"]}\n')
+
+
+class Echo:
+    """Буфер, который возвращает записанную строку вместо хранения."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единицы измерения'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['total'],
+            ingredient['ingredient__measurement_unit'],
+        ))
+
+
+def render_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'amount': ingredient['total'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+def render_pdf(ingredients):
+    document = StreamingPDF(
+        settings.SHOPPING_CART_PDF_FONT, A4, PDF_LINES_PER_PAGE)
+    lines = (text.rstrip('\n') for text in render_txt(ingredients))
+    try:
+        yield document.begin()
+        while True:
+            page = list(islice(lines, PDF_LINES_PER_PAGE))
+            if not page:
+                break
+            yield document.add_page(page)
+        yield document.end()
+    finally:
+        document.close()
+
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'json': ('application/json', render_json),
+    'pdf': ('application/pdf', render_pdf),
+}
+
+
+def download_shopping_cart(request):
+    """Ответ со списком покупок или 304, если список не изменился."""
+    file_format = request.query_params.get('type', 'txt')
+    if file_format not in EXPORT_FORMATS:
+        raise ValidationError({'type': (
+            f'Допустимые форматы: {", ".join(EXPORT_FORMATS)}',
+        )})
+    etag, last_modified = get_version(request.user, file_format)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type, render = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            render(get_ingredients(request.user)),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_cart.{file_format}')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
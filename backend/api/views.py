@@ -1,30 +1,42 @@
-from django.db.models.aggregates import Sum
-from django.shortcuts import HttpResponse, get_object_or_404
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (BooleanField, Prefetch, Value,
+                              prefetch_related_objects)
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
-                            ShoppingCart, Tag)
+from recipes import reference
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart, Tag,
+                            TimelineEntry)
+from recipes.versions import LIST_VERSION_KEY, recipe_version_key
 from users.models import Subscription, User
+from .autocomplete import ingredient_index
+from .caching import cached_response
 from .filters import IngredientsFilter, RecipeFilter
-from .pagination import CustomPagination
+from .pagination import FeedPagination, KeysetPagination
 from .permissions import IsAuthorOrAdminOrReadOnly
 from .serializers import (IngredientSerializer, RecipeReadSerializer,
                           RecipeSerializer, RecipeWriteSerializer,
                           SubscribeSerializer, SubscriptionSerializer,
-                          TagSerializer)
+                          TagSerializer, get_recipes_limit)
+from .shopping_cart import download_shopping_cart
 
 
+@transaction.atomic
 def post_delete_favorite_shopping_cart(request, model, id):
     """Добавить или удалить в список покупок или избранное."""
     user = request.user
     recipe = get_object_or_404(Recipe, id=id)
     if request.method == 'POST':
         model.objects.create(user=user, recipe=recipe)
-        serializer = RecipeSerializer(recipe)
+        serializer = RecipeSerializer(recipe, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     obj = get_object_or_404(model, user=user, recipe=recipe)
     obj.delete()
@@ -39,6 +51,7 @@ class SubscribeViewSet(viewsets.ModelViewSet):
 
     def create(self, request, *args, **kwargs):
         """Подписаться на автора."""
+        get_recipes_limit(request)
         serializer = SubscribeSerializer(
             data={'user': request.user.id,
                   'following': self.kwargs.get('user_id')},
@@ -61,13 +74,50 @@ class SubscribeViewSet(viewsets.ModelViewSet):
 
 class SubscriptionViewSet(viewsets.ModelViewSet):
 
-    pagination_class = CustomPagination
+    pagination_class = FeedPagination
+    keyset_ordering = ('id',)
     permission_classes = (IsAuthenticated,)
     serializer_class = SubscriptionSerializer
 
     def get_queryset(self):
         """Получить список подписок текущего пользователя."""
-        return User.objects.filter(following__user=self.request.user)
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('id')
+
+    def paginate_queryset(self, queryset):
+        """Подгрузить последние рецепты всех авторов страницы разом."""
+        recipes_limit = get_recipes_limit(self.request)
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            prefetch_related_objects(page, Prefetch(
+                'recipes',
+                queryset=Recipe.objects.latest_by_author(
+                    [author.id for author in page], recipes_limit),
+                to_attr='latest_recipes',
+            ))
+        return page
+
+
+def reference_response(request, reference, get_content):
+    """Ответ из кэша справочника с ETag по его версии или 304."""
+    data = reference.get()
+    etag = quote_etag(f'{reference.name}-{data.version}')
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response(get_content(data))
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def get_reference_item(data, pk):
+    try:
+        return data.by_id[int(pk)]
+    except (KeyError, ValueError):
+        raise Http404
 
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
@@ -77,19 +127,82 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (IngredientsFilter,)
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        """Поиск по началу названия с дополнением похожими названиями."""
+        name = request.query_params.get(IngredientsFilter.search_param)
+        if not name:
+            return reference_response(
+                request, reference.ingredients, lambda data: data.items)
+        return reference_response(
+            request, reference.ingredients,
+            lambda data: ingredient_index.search(
+                name, settings.INGREDIENTS_SEARCH_LIMIT))
+
+    def retrieve(self, request, pk=None):
+        return reference_response(
+            request, reference.ingredients,
+            lambda data: get_reference_item(data, pk))
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = TagSerializer
 
+    def list(self, request, *args, **kwargs):
+        return reference_response(
+            request, reference.tags, lambda data: data.items)
+
+    def retrieve(self, request, pk=None):
+        return reference_response(
+            request, reference.tags,
+            lambda data: get_reference_item(data, pk))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    pagination_class = FeedPagination
+    keyset_ordering = ('-pub_date', 'id')
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    # Параметры фильтров и навигации, от которых зависит список.
+    cached_params = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                     'search', 'page', 'limit', 'count', 'cursor')
+
+    def get_queryset(self):
+        if self.request.method in permissions.SAFE_METHODS:
+            # Для выдачи нужны только id: сами рецепты собирает из кэша
+            # RecipeListSerializer, поля ниже нужны навигации.
+            return Recipe.objects.only('id', 'author_id', 'pub_date')
+        return Recipe.objects.for_user(self.request.user)
+
+    def get_version_keys(self, *keys):
+        """Версии рецептов и справочников, которые попадают в ответ."""
+        return (*keys, reference.tags.version_key,
+                reference.ingredients.version_key)
+
+    def list(self, request, *args, **kwargs):
+        get_list = super().list
+        return cached_response(
+            request, self.get_version_keys(LIST_VERSION_KEY),
+            lambda: get_list(request, *args, **kwargs),
+            params=self.cached_params,
+        )
+
+    def get_recipe(self):
+        data = self.get_serializer([self.get_object()], many=True).data
+        if not data:
+            raise Http404
+        return Response(data[0])
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs['pk'])
+        if not pk.isdigit():
+            raise Http404
+        return cached_response(
+            request, self.get_version_keys(recipe_version_key(int(pk))),
+            self.get_recipe,
+        )
 
     def get_serializer_class(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -118,28 +231,23 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Добавить или удалить в список покупок."""
         return post_delete_favorite_shopping_cart(request, ShoppingCart, id)
 
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь."""
+        queryset = self.get_queryset().filter(
+            TimelineEntry.objects.feed(request.user))
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(
         detail=False,
         permission_classes=(IsAuthenticated,)
     )
     def download_shopping_cart(self, request):
         """Скачать список с ингредиентами."""
-        shoppingcart_recipes_id = ShoppingCart.objects.filter(
-            user=self.request.user.id).values_list("recipe__id", flat=True)
-        ingredients = IngredientAmount.objects.filter(
-            recipe_id__in=shoppingcart_recipes_id
-        ).order_by(
-            'ingredient__name'
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit',
-        ).annotate(total=Sum('amount'))
-        shopping_cart = '\n'.join([
-            f'{ingredient["ingredient__name"]} - {ingredient["total"]}'
-            f'{ingredient["ingredient__measurement_unit"]}'
-            for ingredient in ingredients
-        ])
-        filename = 'shopping_cart.txt'
-        response = HttpResponse(shopping_cart, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
-        return response
+        return download_shopping_cart(request)
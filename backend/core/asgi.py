@@ -0,0 +1,214 @@
+"""ASGI-приложение поверх WSGI-приложения Django.
+
+В Django 2.2 нет ни асинхронных представлений, ни асинхронного ORM, поэтому
+представления вместе со всеми запросами к базе выполняются в пуле потоков,
+а не в цикле событий. Цикл событий берёт на себя медленных клиентов: тело
+запроса (например, картинка в base64) читается целиком до того, как
+занять поток, а куски ответа передаются циклу через очередь из
+STREAM_QUEUE_SIZE кусков. Обычный ответ - один кусок, и поток свободен,
+как только отработал Django; потоковый ответ (выгрузка списка покупок)
+не собирается в памяти, а поток ждёт медленного клиента, только когда
+очередь заполнена.
+
+asgiref.wsgi.WsgiToAsgi для этого не подходит: все запросы он выполняет в
+одном общем потоке и держит его, пока клиент принимает ответ.
+"""
+import asyncio
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from tempfile import SpooledTemporaryFile
+
+# Тело запроса больше этого размера пишется во временный файл.
+BODY_MEMORY_SIZE = 2 ** 20
+# Мелкие куски ответа (строки списка покупок) склеиваются до этого размера:
+# передача куска из потока в цикл событий недёшева.
+STREAM_CHUNK_SIZE = 64 * 1024
+# Сколько кусков ответа может ждать отправки клиенту.
+STREAM_QUEUE_SIZE = 16
+SPECIAL_HEADERS = {
+    'content-length': 'CONTENT_LENGTH',
+    'content-type': 'CONTENT_TYPE',
+}
+
+
+def get_environ(scope, body):
+    """Окружение WSGI для HTTP-запроса ASGI."""
+    script_name = scope.get('root_path', '').encode().decode('latin1')
+    path_info = scope['path'].encode().decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    headers = defaultdict(list)
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin1').lower()
+        key = SPECIAL_HEADERS.get(
+            name, 'HTTP_' + name.upper().replace('-', '_'))
+        headers[key].append(value.decode('latin1'))
+    for key, values in headers.items():
+        environ[key] = ('; ' if key == 'HTTP_COOKIE' else ',').join(values)
+    return environ
+
+
+class ResponseStream:
+    """Ответ WSGI-приложения, передаваемый сообщениями ASGI через emit().
+
+    Заголовки отправляются вместе с первым куском тела: до него
+    start_response можно вызвать повторно с exc_info.
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self.start = None
+        self.started = False
+        self.buffer = []
+        self.buffered = 0
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info is not None and self.started:
+            raise exc_info[1].with_traceback(exc_info[2])
+        self.start = {
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in headers
+            ],
+        }
+        return self.write
+
+    def write(self, chunk):
+        self.buffer.append(chunk)
+        self.buffered += len(chunk)
+        if self.buffered >= STREAM_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.started:
+            self.started = True
+            self.emit(self.start)
+        if self.buffered:
+            self.emit({
+                'type': 'http.response.body',
+                'body': b''.join(self.buffer),
+                'more_body': True,
+            })
+            self.buffer.clear()
+            self.buffered = 0
+
+
+def run_wsgi(application, environ, emit):
+    """Выполнить запрос и передать ответ сообщениями ASGI через emit().
+
+    Вызывается в потоке пула; итерация по ответу тоже идёт здесь, так что
+    ленивые ответы (StreamingHttpResponse) обращаются к базе не из цикла
+    событий, а close() ответа закрывает соединение с базой этого потока.
+    """
+    stream = ResponseStream(emit)
+    result = application(environ, stream.start_response)
+    try:
+        for chunk in result:
+            stream.write(chunk)
+        stream.flush()
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+async def iterate_queue(queue, done):
+    """Сообщения из очереди, пока поток done не закончит ответ."""
+    while True:
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.wait((getter, done), return_when=asyncio.FIRST_COMPLETED)
+        if not getter.done():
+            getter.cancel()
+            break
+        yield getter.result()
+    # emit() возвращается, только когда сообщение уже в очереди.
+    while not queue.empty():
+        yield queue.get_nowait()
+
+
+async def discard(messages, done):
+    """Дочитать ответ, который уже некому отправить."""
+    async for _ in messages:
+        pass
+    with suppress(Exception):
+        await done
+
+
+class WSGIToASGI:
+    """ASGI-приложение, выполняющее WSGI-приложение в пуле из threads
+    потоков."""
+
+    def __init__(self, application, threads):
+        self.application = application
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError(f'Соединения {scope["type"]} не поддерживаются')
+        with SpooledTemporaryFile(max_size=BODY_MEMORY_SIZE) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            await self.respond(get_environ(scope, body), send)
+
+    async def respond(self, environ, send):
+        """Отправлять клиенту куски ответа по мере их готовности."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        done = loop.run_in_executor(
+            self.executor, run_wsgi, self.application, environ, emit)
+        messages = iterate_queue(queue, done)
+        try:
+            async for message in messages:
+                await send(message)
+        except BaseException:
+            # Иначе поток навсегда застрянет на заполненной очереди.
+            asyncio.ensure_future(discard(messages, done))
+            raise
+        await done
+        await send({'type': 'http.response.body'})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,208 @@
+"""Переиспользование соединений с базой.
+
+DatabaseWrapper из core.backends.postgresql и core.backends.sqlite3 - это
+бэкенды Django с ConnectionMixin:
+
+- соединение, оставшееся с прошлого HTTP-запроса (CONN_MAX_AGE) или
+  взятое из пула, перед первым использованием проверяется
+  (DB_HEALTH_CHECKS), и оборванное заменяется новым, а не роняет запрос;
+- с DB_POOL_SIZE соединения берутся из пула, общего для потоков процесса,
+  и возвращаются в него в конце запроса: потоки ASGI делят
+  DB_POOL_SIZE соединений, а соединения старше DB_CONN_MAX_AGE
+  закрываются;
+- число открытых соединений, время их установки, неудачные проверки и
+  ожидания пула копятся в connection_stats и отдаются в /metrics.
+"""
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.utils import OperationalError
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionStats:
+    """Счётчики соединений процесса по базам."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(Counter)
+
+    def add(self, alias, **values):
+        with self.lock:
+            self.values[alias].update(values)
+
+    def snapshot(self):
+        """Счётчики вместе с текущим состоянием пулов."""
+        with self.lock:
+            snapshot = {
+                alias: dict(values) for alias, values in self.values.items()}
+        for alias, pool in list(pools.items()):
+            snapshot.setdefault(alias, {}).update(
+                in_use=pool.in_use, idle=len(pool.idle))
+        return snapshot
+
+
+connection_stats = ConnectionStats()
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    """Соединения одной базы для всех потоков процесса."""
+
+    def __init__(self, alias, size, timeout, max_age):
+        self.alias = alias
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.reset()
+        # Дочерний процесс не должен пользоваться сокетами родителя.
+        os.register_at_fork(before=self.close_idle, after_in_child=self.reset)
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(self.size)
+        # Пары (соединение, время открытия); берутся с конца.
+        self.idle = []
+        self.in_use = 0
+
+    def expired(self, opened):
+        return time.monotonic() - opened > self.max_age
+
+    def get(self, connect):
+        """Свободное соединение или новое от connect().
+
+        Возвращает соединение, время его открытия и признак того, что оно
+        уже использовалось.
+        """
+        if not self.slots.acquire(blocking=False):
+            connection_stats.add(self.alias, pool_waits=1)
+            if not self.slots.acquire(timeout=self.timeout):
+                connection_stats.add(self.alias, pool_timeouts=1)
+                raise OperationalError(
+                    f'Пул соединений {self.alias} занят дольше '
+                    f'{self.timeout} с')
+        with self.lock:
+            self.in_use += 1
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    connection, opened = self.idle.pop()
+                if not self.expired(opened):
+                    return connection, opened, True
+                close_quietly(connection)
+            return connect(), time.monotonic(), False
+        except BaseException:
+            self.release()
+            raise
+
+    def put(self, connection, opened, reusable):
+        try:
+            if reusable and not self.expired(opened):
+                with self.lock:
+                    self.idle.append((connection, opened))
+            else:
+                close_quietly(connection)
+        finally:
+            self.release()
+
+    def release(self):
+        with self.lock:
+            self.in_use -= 1
+        self.slots.release()
+
+    def close_idle(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            close_quietly(connection)
+
+
+def get_pool(alias):
+    if not settings.DB_POOL_SIZE:
+        return None
+    pool = pools.get(alias)
+    if pool is None:
+        with pools_lock:
+            pool = pools.get(alias)
+            if pool is None:
+                pool = pools[alias] = ConnectionPool(
+                    alias, settings.DB_POOL_SIZE, settings.DB_POOL_TIMEOUT,
+                    settings.DB_CONN_MAX_AGE)
+    return pool
+
+
+class ConnectionMixin:
+    """Проверка, пул и учёт соединений для DatabaseWrapper Django."""
+
+    # Соединение уже использовалось и перед работой его надо проверить.
+    needs_health_check = False
+    opened = None
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias)
+        if pool is None:
+            return self.open_connection(conn_params)
+        connection, self.opened, self.needs_health_check = pool.get(
+            lambda: self.open_connection(conn_params))
+        connection_stats.add(
+            self.alias, checkouts=1, reused=int(self.needs_health_check))
+        return connection
+
+    def open_connection(self, conn_params):
+        started = time.perf_counter()
+        connection = super().get_new_connection(conn_params)
+        connection_stats.add(
+            self.alias, opened=1,
+            connect_time=time.perf_counter() - started)
+        return connection
+
+    def _close(self):
+        pool = get_pool(self.alias)
+        if pool is None or self.connection is None:
+            return super()._close()
+        pool.put(self.connection, self.opened, self.is_reusable())
+
+    def is_reusable(self):
+        """Можно ли вернуть соединение в пул."""
+        if self.in_atomic_block or not self.autocommit:
+            return False
+        return not self.errors_occurred or self.is_usable()
+
+    def close_if_unusable_or_obsolete(self):
+        """Вызывается в начале и в конце каждого HTTP-запроса."""
+        super().close_if_unusable_or_obsolete()
+        if self.connection is not None:
+            self.needs_health_check = True
+
+    def close_if_health_check_failed(self):
+        """Закрыть уже использованное соединение, если оно оборвалось."""
+        if (self.connection is None or not self.needs_health_check
+                or not settings.DB_HEALTH_CHECKS or self.in_atomic_block):
+            return False
+        self.needs_health_check = False
+        if self.is_usable():
+            return False
+        connection_stats.add(self.alias, health_check_failures=1)
+        self.errors_occurred = True
+        self.close()
+        return True
+
+    def _cursor(self, name=None):
+        # Проверка - перед первым запросом, а не в начале HTTP-запроса:
+        # запросам из кэша соединение не нужно.
+        while self.close_if_health_check_failed():
+            self.ensure_connection()
+        return super()._cursor(name)
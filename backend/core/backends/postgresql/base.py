@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.db.backends.postgresql import base
+
+from core.backends.pool import ConnectionMixin
+
+
+class DatabaseWrapper(ConnectionMixin, base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        """statement_timeout передаётся при подключении, без лишнего
+        запроса SET. PgBouncer такой параметр не пропускает, за ним
+        таймаут задаётся для роли: ALTER ROLE ... SET statement_timeout."""
+        params = super().get_connection_params()
+        if settings.DB_STATEMENT_TIMEOUT and not settings.DB_PGBOUNCER:
+            params['options'] = ' '.join(filter(None, (
+                params.get('options'),
+                f'-c statement_timeout={settings.DB_STATEMENT_TIMEOUT}',
+            )))
+        return params
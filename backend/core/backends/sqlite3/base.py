@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from core.backends.pool import ConnectionMixin
+
+
+class DatabaseWrapper(ConnectionMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,386 @@
+"""Потоковая загрузка данных пачками.
+
+Записи читаются по одной из CSV, JSON (массив объектов, например выгрузка
+dumpdata) и JSON Lines, так что файл любого размера не попадает в память
+целиком. Записи в формате dumpdata ({"model", "pk", "fields"}) и простые
+строки с полями модели проходят через десериализатор Django, как в
+loaddata, а сохраняются пачками по транзакции на пачку.
+
+После каждой пачки число сохранённых записей файла пишется в файл
+контрольной точки; повторный запуск пропускает их. С upsert существующие
+записи обновляются: по pk, а у записей без pk - по ключу из UPSERT_KEYS.
+На PostgreSQL таблицы из COPY_MODELS можно загружать через COPY во
+временную таблицу и один INSERT ... SELECT из неё.
+"""
+import csv
+import io
+import json
+import os
+import re
+from itertools import groupby
+
+from django.core.management.color import no_style
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
+
+CHUNK_SIZE = 64 * 1024
+UPDATE_BATCH_SIZE = 1000
+# Поле, по которому upsert находит уже загруженную запись без pk.
+UPSERT_KEYS = {
+    'recipes.ingredient': 'name',
+    'recipes.tag': 'slug',
+}
+COPY_MODELS = ('recipes.ingredient', 'recipes.tag', 'recipes.recipe')
+COPY_NULL = r'\N'
+STAGE_TABLE = 'bulk_import_stage'
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+SEPARATOR = re.compile(r'[\s,]*')
+
+
+class BulkImportError(Exception):
+    pass
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+def read_json(file):
+    """Объекты JSON-массива по одному, файл читается частями."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), ''):
+        buffer = chunk.lstrip()
+        if buffer:
+            break
+    if not buffer.startswith('['):
+        raise BulkImportError('Ожидается JSON-массив объектов')
+    index = 1
+    finished = False
+    while True:
+        index = SEPARATOR.match(buffer, index).end()
+        if buffer[index:index + 1] == ']':
+            return
+        try:
+            item, index = decoder.raw_decode(buffer, index)
+        except ValueError as exc:
+            if finished:
+                raise BulkImportError(f'Неверный JSON: {exc}')
+            chunk = file.read(CHUNK_SIZE)
+            finished = not chunk
+            buffer, index = buffer[index:] + chunk, 0
+            continue
+        yield item
+
+
+def read_json_lines(file):
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            raise BulkImportError(f'Строка {number}: {exc}')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_json_lines,
+}
+
+
+def get_format(path):
+    file_format = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if file_format is None:
+        raise BulkImportError(
+            f'Не удалось определить формат {path}, укажите его явно')
+    return file_format
+
+
+class Checkpoint:
+    """Сколько записей каждого файла уже сохранено.
+
+    Вместе с числом хранятся размер и время изменения файла: продолжать
+    загрузку изменившегося файла нельзя.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as file:
+                self.files = json.load(file)
+
+    @staticmethod
+    def stamp(source):
+        stat = os.stat(source)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def get(self, source):
+        entry = self.files.get(os.path.abspath(source))
+        if entry is None:
+            return 0
+        if entry['stamp'] != self.stamp(source):
+            raise BulkImportError(
+                f'{source} изменился после контрольной точки {self.path}')
+        return entry['records']
+
+    def save(self, source, records):
+        self.files[os.path.abspath(source)] = {
+            'records': records, 'stamp': self.stamp(source)}
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.files, file)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def split_by_pk(model, objs):
+    """Объекты с pk и без него и поля, которые у них сохраняются."""
+    fields = model._meta.concrete_fields
+    return (
+        ([obj for obj in objs if obj.pk is not None], fields),
+        ([obj for obj in objs if obj.pk is None],
+         [field for field in fields if not field.primary_key]),
+    )
+
+
+def copy_value(value):
+    if value is None:
+        return COPY_NULL
+    return '"{}"'.format(str(value).replace('"', '""'))
+
+
+def copy_rows(objs, fields):
+    """Объекты в CSV для COPY."""
+    data = io.StringIO()
+    for obj in objs:
+        data.write(','.join(
+            copy_value(field.get_db_prep_save(
+                getattr(obj, field.attname), connection))
+            for field in fields
+        ) + '\n')
+    data.seek(0)
+    return data
+
+
+class BulkLoader:
+    """Загрузка записей пачками; counts - число записей по моделям."""
+
+    def __init__(self, batch_size=5000, upsert=False, use_copy=False,
+                 checkpoint=None, progress=None):
+        if use_copy and connection.vendor != 'postgresql':
+            raise BulkImportError('COPY доступен только на PostgreSQL')
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.use_copy = use_copy
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.counts = {}
+        self.models_with_pk = set()
+
+    def load(self, path, file_format=None, model=None):
+        """Загрузить файл; model - метка модели для записей без model."""
+        reader = READERS[file_format or get_format(path)]
+        done = self.checkpoint.get(path) if self.checkpoint else 0
+        records = 0
+        batch = []
+        with open(path, encoding='utf-8', newline='') as file:
+            for record in reader(file):
+                records += 1
+                if records <= done:
+                    continue
+                batch.append(self.normalize(record, model))
+                if len(batch) >= self.batch_size:
+                    self.save_batch(path, batch, records, done)
+                    batch = []
+        if batch:
+            self.save_batch(path, batch, records, done)
+        return records
+
+    def normalize(self, record, model):
+        """Запись в формате dumpdata."""
+        if 'model' in record and 'fields' in record:
+            return record
+        if model is None:
+            raise BulkImportError('Для записей без поля model укажите модель')
+        fields = dict(record)
+        pk = fields.pop('pk', None)
+        id = fields.pop('id', None)
+        return {'model': model, 'pk': pk or id or None, 'fields': fields}
+
+    def save_batch(self, path, batch, records, done):
+        try:
+            items = list(Deserializer(batch, ignorenonexistent=True))
+        except DeserializationError as exc:
+            raise BulkImportError(str(exc))
+        groups = groupby(zip(batch, items), key=lambda pair: (
+            type(pair[1].object), tuple(pair[0]['fields'])))
+        with transaction.atomic():
+            for (model, names), pairs in groups:
+                self.save_objects(model, names, [item for _, item in pairs])
+        # Точка сохраняется после коммита: при сбое между ними пачка
+        # загрузится повторно, а не потеряется.
+        if self.checkpoint:
+            self.checkpoint.save(path, records)
+        if self.progress:
+            self.progress(path, records, done)
+
+    def save_objects(self, model, names, items):
+        objs = [item.object for item in items]
+        label = model._meta.label_lower
+        self.counts[label] = self.counts.get(label, 0) + len(objs)
+        if any(obj.pk is not None for obj in objs):
+            self.models_with_pk.add(model)
+        for obj in objs:
+            self.fill_auto_dates(obj)
+        key = self.get_upsert_key(model, objs) if self.upsert else None
+        if key is not None:
+            objs = list({getattr(obj, key): obj for obj in objs}.values())
+        # Обновляются только поля, которые есть в записях.
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key
+            and (field.name in names or field.attname in names)
+        ]
+        if self.use_copy and label in COPY_MODELS:
+            for part, columns in split_by_pk(model, objs):
+                if part:
+                    self.copy(model, part, columns, key, fields)
+        else:
+            if key is not None:
+                objs = self.update_existing(model, objs, key, fields)
+            self.insert(model, objs)
+        self.save_m2m(model, items)
+
+    @staticmethod
+    def fill_auto_dates(obj):
+        """Даты auto_now и auto_now_add, которых нет в записи.
+
+        Вставка идёт в режиме raw, как в loaddata: даты из выгрузки
+        сохраняются как есть.
+        """
+        for field in obj._meta.concrete_fields:
+            if (getattr(field, 'auto_now', False)
+                    or getattr(field, 'auto_now_add', False)):
+                if getattr(obj, field.attname) is None:
+                    field.pre_save(obj, add=True)
+
+    @staticmethod
+    def get_upsert_key(model, objs):
+        if all(obj.pk is not None for obj in objs):
+            return 'pk'
+        key = UPSERT_KEYS.get(model._meta.label_lower)
+        if key is None:
+            raise BulkImportError(
+                f'Для записей {model._meta.label} без pk обновление не '
+                f'поддерживается')
+        return key
+
+    @staticmethod
+    def update_existing(model, objs, key, fields):
+        """Обновить уже загруженные записи, вернуть новые."""
+        existing = dict(model._base_manager.filter(**{
+            f'{key}__in': [getattr(obj, key) for obj in objs]
+        }).values_list(key, 'pk'))
+        created = []
+        updated = []
+        for obj in objs:
+            pk = existing.get(getattr(obj, key))
+            if pk is None:
+                created.append(obj)
+            else:
+                obj.pk = pk
+                updated.append(obj)
+        if updated and fields:
+            model._base_manager.bulk_update(
+                updated, [field.name for field in fields],
+                batch_size=UPDATE_BATCH_SIZE)
+        return created
+
+    @staticmethod
+    def insert(model, objs):
+        """INSERT в режиме raw, конфликтующие записи пропускаются.
+
+        bulk_create так не умеет: он перезаписывает даты auto_now.
+        """
+        for batch, fields in split_by_pk(model, objs):
+            size = connection.ops.bulk_batch_size(fields, batch) or 1
+            for start in range(0, len(batch), size):
+                model._base_manager._insert(
+                    batch[start:start + size], fields=fields, raw=True,
+                    ignore_conflicts=True)
+
+    @staticmethod
+    def copy(model, objs, columns, key, fields):
+        """Загрузить объекты через COPY во временную таблицу и перенести
+        их оттуда одним INSERT (при upsert - ещё и UPDATE)."""
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        names = ', '.join(quote(field.column) for field in columns)
+        select = (f'INSERT INTO {table} ({names}) '
+                  f'SELECT {names} FROM {STAGE_TABLE} s')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {STAGE_TABLE} AS '
+                f'SELECT {names} FROM {table} WITH NO DATA')
+            cursor.copy_expert(
+                f"COPY {STAGE_TABLE} ({names}) FROM STDIN "
+                f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                copy_rows(objs, columns))
+            if key is not None:
+                column = quote(model._meta.get_field(
+                    model._meta.pk.name if key == 'pk' else key).column)
+                match = f't.{column} = s.{column}'
+                if fields:
+                    cursor.execute(
+                        f'UPDATE {table} t SET ' + ', '.join(
+                            f'{quote(field.column)} = s.{quote(field.column)}'
+                            for field in fields
+                        ) + f' FROM {STAGE_TABLE} s WHERE {match}')
+                select += (f' WHERE NOT EXISTS '
+                           f'(SELECT 1 FROM {table} t WHERE {match})')
+            cursor.execute(select + ' ON CONFLICT DO NOTHING')
+            cursor.execute(f'DROP TABLE {STAGE_TABLE}')
+
+    def save_m2m(self, model, items):
+        """Связи многие-ко-многим из записей; при upsert старые связи
+        загруженных объектов заменяются."""
+        rows = {}
+        for item in items:
+            for name, values in (item.m2m_data or {}).items():
+                if item.object.pk is None:
+                    raise BulkImportError(
+                        f'Связи {model._meta.label}.{name} можно загрузить '
+                        f'только для записей с pk')
+                rows.setdefault(name, []).append((item.object.pk, values))
+        for name, pairs in rows.items():
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = f'{field.m2m_field_name()}_id'
+            target = f'{field.m2m_reverse_field_name()}_id'
+            if self.upsert:
+                through._base_manager.filter(**{
+                    f'{source}__in': [pk for pk, _ in pairs]}).delete()
+            through._base_manager.bulk_create((
+                through(**{source: pk, target: value})
+                for pk, values in pairs for value in values
+            ), ignore_conflicts=True)
+
+    def reset_sequences(self):
+        """Сдвинуть последовательности pk после загрузки записей с pk."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), list(self.models_with_pk))
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
@@ -0,0 +1,410 @@
+"""Профилирование запросов к API.
+
+ProfilingMiddleware включается настройкой PROFILING_ENABLED. Для каждого
+запроса к представлению DRF она замеряет время ответа, число и время
+SQL-запросов, повторы одинаковых запросов (признак N+1), время
+сериализации и размер ответа. Суммы по представлениям и действиям
+каждый процесс периодически сбрасывает в общий кэш, а metrics_view отдаёт
+их сложенными в текстовом формате Prometheus вместе со счётчиками
+соединений с базой (core.backends.pool).
+
+Запрос с заголовком X-Profile, равным PROFILING_TOKEN, выполняется под
+cProfile (с вероятностью PROFILING_SAMPLE_RATE), и статистика
+сохраняется в PROFILING_DUMP_DIR.
+"""
+import contextvars
+import cProfile
+import hashlib
+import logging
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from rest_framework import serializers
+from rest_framework.views import APIView
+
+from core.backends.pool import connection_stats
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы времени ответа, секунды.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Сколько самых частых повторяющихся запросов показывать на представление.
+TOP_DUPLICATES = 5
+WORKERS_KEY = 'profiling:workers'
+SNAPSHOT_TIMEOUT = 24 * 60 * 60
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+def fingerprint(sql):
+    """SQL без конкретных значений: одинаковый у запросов, различающихся
+    только параметрами."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    sql = re.sub(r'%s|\?', '?', sql)
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+class RequestProfile:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.query_time = 0.0
+        self.fingerprints = Counter()
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка выполнения SQL для connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items()
+                if count > 1}
+
+
+def timed_data(data):
+    """Свойство data сериализатора, которое учитывает время сериализации.
+
+    Вложенные вызовы (например, из SerializerMethodField) не считаются
+    повторно.
+    """
+
+    def wrapper(serializer):
+        profile = current_profile.get()
+        if profile is None or profile.serializer_depth:
+            return data.fget(serializer)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            profile.serializer_time += time.perf_counter() - started
+            profile.serializer_depth -= 1
+
+    wrapper.profiled = True
+    return property(wrapper)
+
+
+def instrument_serializers():
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'profiled', False):
+            cls.data = timed_data(cls.data)
+
+
+class Stats:
+    """Суммы замеров одного представления и действия."""
+
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.queries = 0
+        self.query_time = 0.0
+        self.duplicate_queries = 0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+        self.duplicates = Counter()
+
+    def add(self, profile, duration, size):
+        self.requests += 1
+        self.duration += duration
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.buckets[index] += 1
+        self.queries += profile.queries
+        self.query_time += profile.query_time
+        self.serializer_time += profile.serializer_time
+        self.response_bytes += size
+        for sql, count in profile.duplicates.items():
+            self.duplicate_queries += count - 1
+            self.duplicates[sql] += count - 1
+
+    def merge(self, other):
+        for name, value in vars(other).items():
+            if name == 'buckets':
+                self.buckets = [a + b for a, b in zip(self.buckets, value)]
+            elif name == 'duplicates':
+                self.duplicates.update(value)
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+
+class Registry:
+    """Суммы замеров процесса по ключу (представление, действие, метод)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.flushed = time.monotonic()
+
+    @property
+    def worker(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def add(self, key, profile, duration, size):
+        with self.lock:
+            self.stats.setdefault(key, Stats()).add(profile, duration, size)
+        if time.monotonic() - self.flushed > settings.PROFILING_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Сохранить суммы процесса в общий кэш."""
+        self.flushed = time.monotonic()
+        with self.lock:
+            snapshot = {
+                key: {**vars(stats), 'buckets': list(stats.buckets),
+                      'duplicates': Counter(stats.duplicates)}
+                for key, stats in self.stats.items()
+            }
+        cache.set(f'profiling:{self.worker}', snapshot, SNAPSHOT_TIMEOUT)
+        cache.set(f'profiling:connections:{self.worker}',
+                  connection_stats.snapshot(), SNAPSHOT_TIMEOUT)
+        workers = cache.get(WORKERS_KEY) or set()
+        if self.worker not in workers:
+            cache.set(WORKERS_KEY, workers | {self.worker}, SNAPSHOT_TIMEOUT)
+
+    def collect(self):
+        """Суммы всех процессов, которые сбрасывали их в кэш."""
+        self.flush()
+        workers = cache.get(WORKERS_KEY) or set()
+        snapshots = cache.get_many(
+            [f'profiling:{worker}' for worker in workers])
+        total = {}
+        for snapshot in snapshots.values():
+            for key, values in snapshot.items():
+                stats = Stats()
+                vars(stats).update(values)
+                total.setdefault(key, Stats()).merge(stats)
+        return total
+
+    def collect_connections(self):
+        """Счётчики соединений всех процессов по базам."""
+        workers = cache.get(WORKERS_KEY) or set()
+        snapshots = cache.get_many(
+            [f'profiling:connections:{worker}' for worker in workers])
+        total = {}
+        for snapshot in snapshots.values():
+            for alias, values in snapshot.items():
+                total.setdefault(alias, Counter()).update(values)
+        return total
+
+
+registry = Registry()
+
+
+class ProfilingMiddleware:
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        profiler = self.get_profiler(request)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.execute))
+                if profiler is None:
+                    response = self.get_response(request)
+                else:
+                    response = profiler.runcall(self.get_response, request)
+            duration = time.perf_counter() - started
+        finally:
+            current_profile.reset(token)
+        if profile.view is None:
+            return response
+        if profiler is not None:
+            response['X-Profile-Dump'] = self.dump(profiler, profile.view)
+        size = 0 if response.streaming else len(response.content)
+        registry.add(
+            (*profile.view, request.method), profile, duration, size)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', None)
+        profile = current_profile.get()
+        if profile is None or view is None or not issubclass(view, APIView):
+            return None
+        method = request.method.lower()
+        actions = getattr(view_func, 'actions', None) or {}
+        profile.view = (view.__name__, actions.get(method, method))
+        return None
+
+    def get_profiler(self, request):
+        header = request.META.get(PROFILE_HEADER)
+        if (not header or not settings.PROFILING_TOKEN
+                or not constant_time_compare(header, settings.PROFILING_TOKEN)
+                or random.random() >= settings.PROFILING_SAMPLE_RATE):
+            return None
+        return cProfile.Profile()
+
+    def dump(self, profiler, view):
+        os.makedirs(settings.PROFILING_DUMP_DIR, exist_ok=True)
+        name = '{}-{}-{}.prof'.format(
+            '.'.join(view), time.strftime('%Y%m%d-%H%M%S'), os.getpid())
+        profiler.dump_stats(os.path.join(settings.PROFILING_DUMP_DIR, name))
+        logger.info('Профиль %s сохранён в %s', '.'.join(view), name)
+        return name
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', ' ')
+
+
+def labels(**values):
+    return ','.join(f'{name}="{escape(value)}"'
+                    for name, value in values.items())
+
+
+METRICS = (
+    ('foodgram_requests_total', 'counter', 'requests',
+     'Число запросов'),
+    ('foodgram_db_queries_total', 'counter', 'queries',
+     'Число SQL-запросов'),
+    ('foodgram_db_duration_seconds_total', 'counter', 'query_time',
+     'Время SQL-запросов'),
+    ('foodgram_db_duplicate_queries_total', 'counter', 'duplicate_queries',
+     'Повторы SQL-запросов, различающихся только параметрами'),
+    ('foodgram_serializer_duration_seconds_total', 'counter',
+     'serializer_time', 'Время сериализации ответа'),
+    ('foodgram_response_bytes_total', 'counter', 'response_bytes',
+     'Размер ответов без потоковых'),
+)
+
+
+CONNECTION_METRICS = (
+    ('foodgram_db_connections_opened_total', 'counter', 'opened',
+     'Открыто соединений с базой'),
+    ('foodgram_db_connect_duration_seconds_total', 'counter', 'connect_time',
+     'Время установки соединений с базой'),
+    ('foodgram_db_health_check_failures_total', 'counter',
+     'health_check_failures', 'Оборванных соединений, найденных проверкой'),
+    ('foodgram_db_pool_checkouts_total', 'counter', 'checkouts',
+     'Соединений, выданных пулом'),
+    ('foodgram_db_pool_reused_total', 'counter', 'reused',
+     'Соединений, выданных пулом повторно'),
+    ('foodgram_db_pool_waits_total', 'counter', 'pool_waits',
+     'Ожиданий свободного соединения в пуле'),
+    ('foodgram_db_pool_timeouts_total', 'counter', 'pool_timeouts',
+     'Отказов пула после DB_POOL_TIMEOUT'),
+    ('foodgram_db_pool_in_use', 'gauge', 'in_use',
+     'Соединений пула в работе'),
+    ('foodgram_db_pool_idle', 'gauge', 'idle',
+     'Свободных соединений в пуле'),
+    ('foodgram_db_replica_requests_total', 'counter', 'replica_requests',
+     'HTTP-запросов, читавших с реплики'),
+    ('foodgram_db_replica_failures_total', 'counter', 'replica_failures',
+     'Проверок, нашедших реплику отстающей или недоступной'),
+)
+# Настройки соединений: имя метрики, значение, описание.
+CONNECTION_SETTINGS = (
+    ('foodgram_db_pool_size', lambda: settings.DB_POOL_SIZE,
+     'Размер пула соединений процесса, 0 - без пула'),
+    ('foodgram_db_conn_max_age_seconds', lambda: settings.DB_CONN_MAX_AGE,
+     'Сколько секунд соединение используется повторно'),
+    ('foodgram_db_statement_timeout_seconds',
+     lambda: settings.DB_STATEMENT_TIMEOUT / 1000,
+     'statement_timeout PostgreSQL, 0 - без ограничения'),
+    ('foodgram_db_replica_max_lag_seconds',
+     lambda: settings.REPLICA_MAX_LAG,
+     'Допустимое отставание реплики'),
+)
+
+
+def render_connection_metrics(stats):
+    """Счётчики и настройки соединений в формате Prometheus."""
+    lines = []
+    for metric, kind, field, help_text in CONNECTION_METRICS:
+        lines += [f'# HELP {metric} {help_text}.', f'# TYPE {metric} {kind}']
+        for alias in sorted(stats):
+            lines.append(f'{metric}{{{labels(database=alias)}}} '
+                         f'{stats[alias].get(field, 0)}')
+    for metric, value, help_text in CONNECTION_SETTINGS:
+        lines += [f'# HELP {metric} {help_text}.', f'# TYPE {metric} gauge',
+                  f'{metric} {value()}']
+    return '\n'.join(lines) + '\n'
+
+
+def render_metrics(stats):
+    """Суммы замеров в текстовом формате Prometheus."""
+    lines = []
+    keys = sorted(stats)
+    for metric, kind, field, help_text in METRICS:
+        lines += [f'# HELP {metric} {help_text}.', f'# TYPE {metric} {kind}']
+        for view, action, method in keys:
+            key_labels = labels(view=view, action=action, method=method)
+            lines.append(f'{metric}{{{key_labels}}} '
+                         f'{getattr(stats[view, action, method], field)}')
+    metric = 'foodgram_request_duration_seconds'
+    lines += [f'# HELP {metric} Время ответа.', f'# TYPE {metric} histogram']
+    for view, action, method in keys:
+        item = stats[view, action, method]
+        key_labels = labels(view=view, action=action, method=method)
+        for bound, count in zip(DURATION_BUCKETS, item.buckets):
+            lines.append(f'{metric}_bucket{{{key_labels},le="{bound}"}} '
+                         f'{count}')
+        lines += [
+            f'{metric}_bucket{{{key_labels},le="+Inf"}} {item.requests}',
+            f'{metric}_sum{{{key_labels}}} {item.duration}',
+            f'{metric}_count{{{key_labels}}} {item.requests}',
+        ]
+    metric = 'foodgram_db_duplicate_query_total'
+    lines += [
+        f'# HELP {metric} Самые частые повторы SQL-запросов.',
+        f'# TYPE {metric} counter',
+    ]
+    for view, action, method in keys:
+        item = stats[view, action, method]
+        for sql, count in item.duplicates.most_common(TOP_DUPLICATES):
+            key_labels = labels(
+                view=view, action=action, method=method,
+                fingerprint=hashlib.sha1(sql.encode()).hexdigest()[:12],
+                sql=sql[:200],
+            )
+            lines.append(f'{metric}{{{key_labels}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus; с PROFILING_TOKEN - только по нему."""
+    if settings.PROFILING_TOKEN and not constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {settings.PROFILING_TOKEN}',
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(registry.collect())
+        + render_connection_metrics(registry.collect_connections()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
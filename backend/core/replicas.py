@@ -0,0 +1,182 @@
+"""Чтение с реплик.
+
+ReplicaMiddleware на время запроса с безопасным методом (GET, HEAD,
+OPTIONS) разрешает чтение с реплик из DB_REPLICA_HOSTS и DB_REPLICA_NAMES,
+а ReplicaRouter отправляет такие чтения на одну реплику, выбранную для
+всего запроса. Запись, запросы с другими методами, команды manage.py и
+фоновые потоки работают с default.
+
+- После запроса, меняющего данные, пользователь REPLICA_STICKY_SECONDS
+  читает с default и сразу видит своё избранное, список покупок и
+  подписки. Пользователь определяется по заголовку Authorization или
+  cookie сессии, отметка хранится в кэше.
+- Отставание реплики проверяется не чаще раза в REPLICA_CHECK_INTERVAL
+  секунд; отстающая больше чем на REPLICA_MAX_LAG секунд или недоступная
+  реплика до следующей проверки не используется.
+- То, что ложится в общий кэш (ответы анонимным пользователям, тела
+  рецептов, справочники), читается с default внутри use_primary().
+"""
+import contextvars
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .backends.pool import connection_stats
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Модели, которые всегда читаются с default: только что выданный токен
+# или сессия на реплике может ещё не появиться.
+PRIMARY_MODELS = {'authtoken.token', 'sessions.session'}
+# Отставание в секундах; на основной базе и на догнавшей реплике - 0.
+LAG_QUERIES = {
+    'postgresql': (
+        'SELECT CASE WHEN NOT pg_is_in_recovery() '
+        'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+        'END'
+    ),
+}
+# Для остальных баз отставание не измерить, проверяется только связь.
+PING_QUERY = 'SELECT 0'
+
+# Состояние текущего запроса: None - только default, иначе словарь, в
+# который роутер запоминает выбранную реплику.
+current_request = contextvars.ContextVar('replica_request', default=None)
+
+
+@contextmanager
+def use_primary():
+    """Читать с default данные, которые попадут в общий кэш.
+
+    Версии в кэше меняются сразу после коммита на основной базе, а реплика
+    может ещё не получить изменений: прочитанное с неё легло бы в кэш под
+    новой версией и отдавалось бы всем, пока не истечёт.
+    """
+    token = current_request.set(None)
+    try:
+        yield
+    finally:
+        current_request.reset(token)
+
+
+class ReplicaStatus:
+    """Результаты проверок отставания реплик в процессе."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Реплика -> (время проверки, пригодна ли).
+        self.checked = {}
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self.lock:
+            checked_at, healthy = self.checked.get(alias, (None, False))
+            if (checked_at is not None
+                    and now - checked_at < settings.REPLICA_CHECK_INTERVAL):
+                return healthy
+            # Пока этот поток проверяет реплику, остальные пользуются
+            # прошлым результатом.
+            self.checked[alias] = (now, healthy)
+        healthy = self.check(alias)
+        with self.lock:
+            self.checked[alias] = (time.monotonic(), healthy)
+        return healthy
+
+    def check(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_QUERIES.get(connection.vendor, PING_QUERY))
+                lag = float(cursor.fetchone()[0] or 0)
+        except DatabaseError as error:
+            connection_stats.add(alias, replica_failures=1)
+            logger.warning('Реплика %s недоступна: %s', alias, error)
+            return False
+        if lag > settings.REPLICA_MAX_LAG:
+            connection_stats.add(alias, replica_failures=1)
+            logger.warning('Реплика %s отстаёт на %.1f с', alias, lag)
+            return False
+        return True
+
+
+replica_status = ReplicaStatus()
+
+
+def choose_replica():
+    """Случайная пригодная реплика или default, если таких нет."""
+    replicas = [
+        alias for alias in settings.DB_REPLICAS
+        if replica_status.is_healthy(alias)
+    ]
+    if not replicas:
+        return DEFAULT_DB_ALIAS
+    alias = random.choice(replicas)
+    connection_stats.add(alias, replica_requests=1)
+    return alias
+
+
+class ReplicaRouter:
+    """Чтения запроса с безопасным методом - на реплику, остальное - в
+    default."""
+
+    def db_for_read(self, model, **hints):
+        state = current_request.get()
+        if state is None or model._meta.label_lower in PRIMARY_MODELS:
+            return DEFAULT_DB_ALIAS
+        if 'alias' not in state:
+            state['alias'] = choose_replica()
+        return state['alias']
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def get_sticky_key(request):
+    """Ключ кэша с отметкой о недавней записи пользователя."""
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not credentials:
+        return None
+    digest = hashlib.sha1(credentials.encode()).hexdigest()
+    return f'replicas:primary:{digest}'
+
+
+class ReplicaMiddleware:
+    """Разрешает чтение с реплик запросам с безопасным методом."""
+
+    def __init__(self, get_response):
+        if not settings.DB_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = get_sticky_key(request)
+        if request.method not in SAFE_METHODS:
+            try:
+                return self.get_response(request)
+            finally:
+                if key is not None:
+                    cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+        if key is not None and cache.get(key):
+            return self.get_response(request)
+        token = current_request.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
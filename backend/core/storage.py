@@ -0,0 +1,64 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, в котором имя файла - хэш его содержимого.
+
+    Файл сохраняется как <каталог upload_to>/<aa>/<sha256><расширение>.
+    Одинаковые файлы занимают место один раз, а имя файла никогда не
+    указывает на другое содержимое, поэтому его можно кэшировать навсегда.
+    Файлы хранилище не удаляет: это делает команда collect_media_garbage.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save, совпадение
+        # исходных имён ни на что не влияет.
+        return name
+
+    def make_directory(self, directory):
+        if self.directory_permissions_mode is None:
+            os.makedirs(directory, exist_ok=True)
+            return
+        old_umask = os.umask(0)
+        try:
+            os.makedirs(
+                directory, self.directory_permissions_mode, exist_ok=True)
+        finally:
+            os.umask(old_umask)
+
+    def _save(self, name, content):
+        directory, basename = posixpath.split(name.replace('\\', '/'))
+        extension = os.path.splitext(basename)[1].lower()
+        self.make_directory(self.path(directory))
+        # Файл пишется во временный в том же каталоге с подсчётом хэша,
+        # затем появляется под своим именем жёсткой ссылкой: атомарно и без
+        # перезаписи, если такой файл уже есть.
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.path(directory), prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            digest = digest.hexdigest()
+            name = posixpath.join(
+                directory, digest[:2], f'{digest}{extension}')
+            path = self.path(name)
+            self.make_directory(os.path.dirname(path))
+            try:
+                os.link(temp_path, path)
+            except FileExistsError:
+                # Обновляем дату, чтобы сборщик мусора не удалил файл,
+                # на который вот-вот сошлётся новая запись.
+                os.utime(path)
+            else:
+                os.chmod(path, self.file_permissions_mode or 0o644)
+        finally:
+            os.unlink(temp_path)
+        return name
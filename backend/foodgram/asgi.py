@@ -0,0 +1,23 @@
+"""
+ASGI config for foodgram project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Django 2.2 has no ASGI handler of its own, so the WSGI application is wrapped
+in core.asgi.WSGIToASGI: views run in a pool of ASGI_THREADS threads while
+the event loop talks to slow clients.
+
+Run it with uvicorn workers under gunicorn (see gunicorn.conf.py):
+
+    SERVER_INTERFACE=asgi gunicorn foodgram.asgi:application
+"""
+
+import os
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+from core.asgi import WSGIToASGI
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+application = WSGIToASGI(get_wsgi_application(), settings.ASGI_THREADS)
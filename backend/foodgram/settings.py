@@ -63,12 +63,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -96,17 +98,91 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Бэкенды Django заменены обёртками из core.backends: они проверяют
+# повторно используемые соединения, держат пул и считают соединения для
+# /metrics.
+DB_ENGINES = {
+    'django.db.backends.postgresql': 'core.backends.postgresql',
+    'django.db.backends.sqlite3': 'core.backends.sqlite3',
+}
+DB_ENGINE = os.getenv('DB_ENGINE', default='django.db.backends.postgresql')
+# Сколько секунд соединение используется повторно (постоянное или из пула)
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', default=60))
+# Проверять повторно используемое соединение перед первым запросом
+DB_HEALTH_CHECKS = os.getenv('DB_HEALTH_CHECKS', default='True') == 'True'
+# Пул соединений, общий для потоков процесса; 0 - без пула
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', default=0))
+# Сколько секунд ждать свободного соединения из пула
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', default=10))
+# statement_timeout PostgreSQL в миллисекундах; 0 - без ограничения.
+# Действует и на команды manage.py, долгим пересборкам его лучше не задавать.
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', default=0))
+# За PgBouncer в режиме transaction: без серверных курсоров
+DB_PGBOUNCER = os.getenv('DB_PGBOUNCER', default='') == 'True'
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE', default='django.db.backends.postgresql'),
+        'ENGINE': DB_ENGINES.get(DB_ENGINE, DB_ENGINE),
         'NAME': os.getenv('DB_NAME', default='postgres'),
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='localhost'),
         'PORT': os.getenv('DB_PORT', default=5432),
+        # Соединения из пула возвращаются в него в конце запроса
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else DB_CONN_MAX_AGE,
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PGBOUNCER,
+    }
+}
+
+# Реплики для запросов GET, HEAD и OPTIONS (core.replicas): через запятую
+# хосты ("host" или "host:port") и/или имена баз (для SQLite - файлы);
+# остальные параметры берутся у основной базы.
+DB_REPLICA_HOSTS = [
+    host for host in os.getenv('DB_REPLICA_HOSTS', default='').split(',')
+    if host
+]
+DB_REPLICA_NAMES = [
+    name for name in os.getenv('DB_REPLICA_NAMES', default='').split(',')
+    if name
+]
+DB_REPLICAS = []
+for index in range(max(len(DB_REPLICA_HOSTS), len(DB_REPLICA_NAMES))):
+    replica = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if index < len(DB_REPLICA_HOSTS):
+        host, _, port = DB_REPLICA_HOSTS[index].partition(':')
+        replica.update(HOST=host, PORT=port or replica['PORT'])
+    if index < len(DB_REPLICA_NAMES):
+        replica['NAME'] = DB_REPLICA_NAMES[index]
+    DB_REPLICAS.append(f'replica{index + 1}')
+    DATABASES[DB_REPLICAS[-1]] = replica
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# На сколько секунд реплика может отстать, прежде чем чтение уйдёт в default
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', default=5))
+# Секунд между проверками отставания реплик в процессе
+REPLICA_CHECK_INTERVAL = float(
+    os.getenv('REPLICA_CHECK_INTERVAL', default=5))
+# Сколько секунд после записи пользователь читает с default; должно
+# покрывать REPLICA_MAX_LAG и REPLICA_CHECK_INTERVAL
+REPLICA_STICKY_SECONDS = int(
+    os.getenv('REPLICA_STICKY_SECONDS', default=15))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
     }
 }
 
+# Сколько секунд теги и ингредиенты хранятся в общем кэше
+REFERENCE_CACHE_TIMEOUT = int(
+    os.getenv('REFERENCE_CACHE_TIMEOUT', default=24 * 60 * 60))
+# Ответы анонимным пользователям: в общем кэше и в Cache-Control
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=60 * 60))
+RESPONSE_CACHE_MAX_AGE = int(os.getenv('RESPONSE_CACHE_MAX_AGE', default=5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -149,6 +225,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы именуются хэшем содержимого и не дублируются
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+# Сколько секунд файл без ссылок хранится до удаления сборщиком мусора
+MEDIA_GC_GRACE = int(os.getenv('MEDIA_GC_GRACE', default=24 * 60 * 60))
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -157,6 +237,16 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.TokenAuthentication',
     ),
+    # JSON через orjson; без него - стандартными классами.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 DJOSER = {
@@ -178,3 +268,43 @@ MAX_LENGTH_FIELD = 150
 MAX_LENGTH_EMAIL = 254
 MAX_LENGTH_UOM = 16
 MAX_LENGTH_HEX = 7
+
+# Шрифт с кириллицей для списка покупок в PDF
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+# Подсказки ингредиентов
+INGREDIENTS_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENTS_SEARCH_LIMIT', default=50))
+
+# Конфигурация полнотекстового поиска PostgreSQL для поиска рецептов
+SEARCH_CONFIG = os.getenv('SEARCH_CONFIG', default='russian')
+
+# Лента подписок: рецепты авторов с большим числом подписчиков
+# подмешиваются при чтении
+FEED_FANOUT_THRESHOLD = int(os.getenv('FEED_FANOUT_THRESHOLD', default=1000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', default=100))
+FEED_BATCH_SIZE = 1000
+
+# Картинки рецептов: предельный размер в байтах и фоновая подготовка копий
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=10 * 2 ** 20))
+IMAGE_QUEUE = os.getenv(
+    'IMAGE_QUEUE', default='recipes.images.ThreadPoolQueue')
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+IMAGE_VARIANT_QUALITY = 80
+
+# ASGI (foodgram.asgi): потоков на процесс для представлений Django
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', default=10))
+
+# Профилирование запросов и метрики Prometheus по адресу /metrics
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', default='') == 'True'
+# Токен для /metrics (Authorization: Bearer) и заголовка X-Profile
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', default='')
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=1))
+PROFILING_DUMP_DIR = os.getenv(
+    'PROFILING_DUMP_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILING_FLUSH_INTERVAL = int(
+    os.getenv('PROFILING_FLUSH_INTERVAL', default=10))
@@ -13,10 +13,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
+from core.profiling import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
+
+if settings.PROFILING_ENABLED:
+    # Не проксируется nginx наружу: доступно только внутри сети.
+    urlpatterns.append(path('metrics', metrics_view))
@@ -0,0 +1,29 @@
+"""Настройки gunicorn; с SERVER_INTERFACE=asgi процессы работают через
+uvicorn и обслуживают foodgram.asgi:application."""
+import os
+
+bind = '0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', default=1))
+if os.getenv('SERVER_INTERFACE') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Кэши, которые живут в памяти одного процесса.
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def on_starting(server):
+    """Не запускать несколько процессов без общего кэша: версии
+    справочников и ответов, сменённые в одном процессе, остальные бы не
+    увидели."""
+    if server.cfg.workers < 2:
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    from django.conf import settings
+    if settings.CACHES['default']['BACKEND'] in LOCAL_CACHES:
+        raise RuntimeError(
+            f'Процессов gunicorn: {server.cfg.workers}, а кэш локальный; '
+            f'задайте общий CACHE_BACKEND (например, '
+            f'django_redis.cache.RedisCache).')
@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from .models import Favorite, Ingredient, IngredientAmount, Recipe, Tag
+from .images import schedule_variants
+from .models import Ingredient, IngredientAmount, Recipe, Tag
+from .search import index_recipes
 
 
 class IngredientsInline(admin.TabularInline):
@@ -18,6 +20,12 @@ class IngredientAdmin(admin.ModelAdmin):
     list_filter = ('name',)
     empty_value_display = '-пусто-'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'name' in form.changed_data:
+            index_recipes(IngredientAmount.objects.filter(
+                ingredient=obj).values_list('recipe_id', flat=True))
+
 
 class RecipeAdmin(admin.ModelAdmin):
     """Класс рецептов."""
@@ -25,13 +33,15 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ('id', 'author', 'name', 'favorites_count')
     search_fields = ('name',)
     list_filter = ('author', 'name', 'tags')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     inlines = [IngredientsInline]
     empty_value_display = '-пусто-'
 
-    def favorites_count(self, obj):
-        favorite_recipes = Favorite.objects.filter(
-            recipe=obj).all()
-        return len(favorite_recipes)
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        index_recipes((form.instance.id,))
+        if 'image' in form.changed_data:
+            schedule_variants(form.instance.id)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -0,0 +1,155 @@
+"""Уменьшенные копии картинок рецептов.
+
+Картинка сохраняется в запросе как есть, а варианты для карточки в списке,
+страницы рецепта и превью в соцсетях строятся после коммита в очереди
+задач settings.IMAGE_QUEUE.
+"""
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps, features
+
+from .models import Recipe, RecipeImageVariant
+
+logger = logging.getLogger(__name__)
+
+# Вариант: (ширина, высота, обрезать ли до точного размера).
+VARIANTS = {
+    'card': (480, 480, False),
+    'detail': (1280, 1280, False),
+    'og': (1200, 630, True),
+}
+
+
+def get_formats():
+    """Форматы вариантов, которые поддерживает установленный Pillow."""
+    formats = []
+    for name in ('webp', 'avif'):
+        try:
+            if features.check(name):
+                formats.append(name)
+        except ValueError:
+            pass
+    return formats
+
+
+def resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def open_original(recipe):
+    with recipe.image.open('rb') as file, Image.open(file) as original:
+        original = ImageOps.exif_transpose(original)
+        mode = 'RGBA' if 'A' in original.getbands() else 'RGB'
+        return original.convert(mode)
+
+
+def render(original, name, file_format):
+    """Построить вариант картинки, вернуть (путь, ширина, высота)."""
+    image = resize(original, *VARIANTS[name])
+    buffer = io.BytesIO()
+    image.save(buffer, format=file_format.upper(),
+               quality=settings.IMAGE_VARIANT_QUALITY)
+    # Хранилище само назовёт файл по содержимому и не станет записывать
+    # его повторно при перестроении.
+    path = default_storage.save(
+        f'recipes/variants/{name}.{file_format}',
+        ContentFile(buffer.getvalue()))
+    return path, image.width, image.height
+
+
+def build_variants(recipe_id):
+    """Построить все варианты текущей картинки рецепта.
+
+    Одинаковые картинки хранятся одним файлом, поэтому варианты, уже
+    построенные для другого рецепта с той же картинкой, используются
+    повторно.
+    """
+    recipe = Recipe.objects.filter(id=recipe_id).only('id', 'image').first()
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    built = {
+        (variant.name, variant.format): (
+            variant.image.name, variant.width, variant.height)
+        for variant in RecipeImageVariant.objects.filter(
+            source=source).exclude(recipe_id=recipe_id)
+    }
+    original = None
+    for name in VARIANTS:
+        for file_format in get_formats():
+            if (name, file_format) in built:
+                path, width, height = built[name, file_format]
+            else:
+                if original is None:
+                    original = open_original(recipe)
+                path, width, height = render(original, name, file_format)
+            RecipeImageVariant.objects.update_or_create(
+                recipe_id=recipe_id, name=name, format=file_format,
+                defaults={
+                    'source': source,
+                    'image': path,
+                    'width': width,
+                    'height': height,
+                },
+            )
+
+
+def run_job(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Задача %s%r завершилась ошибкой', func.__name__,
+                         args)
+
+
+class ThreadPoolQueue:
+    """Очередь задач в пуле потоков текущего процесса."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='image-variants',
+        )
+
+    def submit(self, func, *args):
+        self.executor.submit(self.run, func, *args)
+
+    def run(self, func, *args):
+        try:
+            run_job(func, *args)
+        finally:
+            connections.close_all()
+
+
+class ImmediateQueue:
+    """Выполняет задачи сразу в текущем потоке: для тестов и отладки."""
+
+    def submit(self, func, *args):
+        run_job(func, *args)
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        _queue = import_string(settings.IMAGE_QUEUE)()
+    return _queue
+
+
+def schedule_variants(recipe_id):
+    """Поставить построение вариантов в очередь после коммита."""
+    transaction.on_commit(
+        lambda: get_queue().submit(build_variants, recipe_id))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from recipes.images import build_variants
+from recipes.models import Recipe, RecipeImageVariant
+
+
+class Command(BaseCommand):
+    help = ('Построить уменьшенные копии картинок рецептов, у которых '
+            'их ещё нет')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить варианты для всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.annotate(has_variants=Exists(
+                RecipeImageVariant.objects.filter(
+                    recipe=OuterRef('pk'), source=OuterRef('image'))
+            )).filter(has_variants=False)
+        built = 0
+        for recipe_id in recipes.values_list('id', flat=True).iterator():
+            try:
+                build_variants(recipe_id)
+            except Exception as error:
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Уменьшенные копии построены, рецептов: {built}.'))
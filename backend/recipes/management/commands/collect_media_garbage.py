@@ -0,0 +1,79 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import MEDIA_FIELDS, MediaFile
+
+CHUNK_SIZE = 500
+
+
+def walk(directory):
+    """Все файлы каталога хранилища вместе с подкаталогами."""
+    if not default_storage.exists(directory):
+        return
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = 'Удалить файлы картинок, на которые не ссылается ни одна запись'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.MEDIA_GC_GRACE,
+            help='Не трогать файлы моложе стольких секунд',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        referenced = set(MediaFile.objects.filter(
+            references__gt=0).values_list('name', flat=True))
+        released = list(MediaFile.objects.filter(
+            references=0).values_list('name', flat=True))
+        directories = {
+            model._meta.get_field(field).upload_to.rstrip('/')
+            for model, field in MEDIA_FIELDS.items()
+        }
+        candidates = set(released)
+        for directory in directories:
+            candidates.update(
+                name for name in walk(directory) if name not in referenced)
+        # Счётчики могут отставать от данных, поэтому перед удалением
+        # ссылки на кандидатов проверяются по самим записям.
+        names = list(candidates)
+        actual = Counter()
+        for start in range(0, len(names), CHUNK_SIZE):
+            actual.update(MediaFile.objects.count_references(
+                names[start:start + CHUNK_SIZE]))
+        for name, references in actual.items():
+            if not options['dry_run']:
+                MediaFile.objects.update_or_create(
+                    name=name, defaults={'references': references})
+        verb = 'Будет удалён' if options['dry_run'] else 'Удалён'
+        deleted = kept = 0
+        for name in sorted(candidates - set(actual)):
+            if default_storage.exists(name):
+                if default_storage.get_modified_time(name) > cutoff:
+                    kept += 1
+                    continue
+                self.stdout.write(f'{verb}: {name}')
+                if not options['dry_run']:
+                    default_storage.delete(name)
+                deleted += 1
+            if not options['dry_run']:
+                MediaFile.objects.filter(name=name, references=0).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено файлов: {deleted}, оставлено до истечения '
+            f'--grace: {kept}.'))
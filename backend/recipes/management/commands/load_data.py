@@ -1,31 +1,108 @@
-import csv
+import os
+import time
 
 from django.conf import settings
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 
-from recipes.models import Ingredient, Tag
+from core.bulk_import import READERS, BulkImportError, BulkLoader, Checkpoint
+from recipes.reference import REFERENCES
+
+# Файлы по умолчанию и модели для их строк.
+DEFAULT_FILES = (
+    ('ingredients.csv', 'recipes.ingredient'),
+    ('tags.csv', 'recipes.tag'),
+)
+MODELS_BY_STEM = dict(
+    (os.path.splitext(name)[0], model) for name, model in DEFAULT_FILES)
+# После этих моделей пересчитываются производные данные, как в seed_data.
+RECIPE_MODELS = {
+    'recipes.recipe', 'recipes.ingredientamount', 'recipes.favorite',
+    'recipes.shoppingcart', 'users.subscription', 'users.user',
+}
+REBUILD_COMMANDS = (
+    'rebuild_shopping_carts', 'reconcile_counters', 'rebuild_search_index',
+    'rebuild_timelines',
+)
 
 
 class Command(BaseCommand):
-    help = 'Load data from static'
+    help = ('Загрузить данные из CSV, JSON (в том числе выгрузки dumpdata) '
+            'и JSON Lines пачками; по умолчанию - static/data/*.csv')
 
-    def handle(self, *args, **kwargs):
-        model_data = (
-            (Ingredient, 'ingredients'),
-            (Tag, 'tags')
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Файлы для загрузки; по умолчанию ingredients.csv и '
+                 'tags.csv из static/data',
+        )
+        parser.add_argument(
+            '--model',
+            help='Модель (app_label.model) для записей без поля model; по '
+                 'умолчанию определяется по имени файла',
+        )
+        parser.add_argument('--format', choices=sorted(READERS),
+                            help='Формат файлов; по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help='Обновлять существующие записи: по pk, а ингредиенты и '
+                 'теги без pk - по названию и slug',
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загружать ингредиенты, теги и рецепты через COPY '
+                 '(только PostgreSQL)',
         )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки: повторный запуск продолжит '
+                 'загрузку с места сбоя; удаляется после успешной загрузки',
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [
+            os.path.join(settings.BASE_DIR, 'static', 'data', name)
+            for name, _ in DEFAULT_FILES
+        ]
+        checkpoint = (Checkpoint(options['checkpoint'])
+                      if options['checkpoint'] else None)
+        self.started = time.monotonic()
         try:
-            for model, file in model_data:
-                with open(
-                    f'{settings.BASE_DIR}/static/data/{file}.csv',
-                    'r',
-                    encoding='utf-8'
-                ) as csv_file:
-                    reader = csv.DictReader(csv_file)
-                    model.objects.bulk_create(
-                        objs=[model(**data) for data in reader],
-                        ignore_conflicts=True
-                    )
-            print('Load data completed.')
-        except FileNotFoundError:
-            raise CommandError('Файл не найден')
+            loader = BulkLoader(
+                batch_size=options['batch_size'], upsert=options['upsert'],
+                use_copy=options['copy'], checkpoint=checkpoint,
+                progress=self.write_progress,
+            )
+            for path in paths:
+                self.started = time.monotonic()
+                loader.load(
+                    path, options['format'],
+                    options['model'] or self.get_model(path))
+        except FileNotFoundError as exc:
+            raise CommandError(f'Файл не найден: {exc.filename}')
+        except BulkImportError as exc:
+            raise CommandError(exc)
+        loader.reset_sequences()
+        if checkpoint:
+            checkpoint.clear()
+        for label, count in sorted(loader.counts.items()):
+            self.stdout.write(f'{label}: {count}')
+        if RECIPE_MODELS & set(loader.counts):
+            for command in REBUILD_COMMANDS:
+                call_command(command, stdout=self.stdout)
+        # Закэшированные тела рецептов и ответы API содержат справочники.
+        for reference in REFERENCES.values():
+            reference.bump()
+        self.stdout.write(self.style.SUCCESS('Загрузка данных завершена.'))
+
+    @staticmethod
+    def get_model(path):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return MODELS_BY_STEM.get(stem)
+
+    def write_progress(self, path, records, done):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'{os.path.basename(path)}: {records} записей '
+            f'({(records - done) / max(elapsed, 1e-3):.0f}/с)')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from recipes.models import Recipe
+from recipes.search import FTS_TABLE, index_recipes
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать поисковые документы рецептов'
+
+    def handle(self, *args, **options):
+        ids = Recipe.objects.order_by('id').values_list('id', flat=True)
+        indexed = 0
+        with transaction.atomic():
+            if connection.vendor == 'sqlite':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            batch = []
+            for id in ids.iterator():
+                batch.append(id)
+                if len(batch) == BATCH_SIZE:
+                    index_recipes(batch)
+                    indexed += len(batch)
+                    batch = []
+            index_recipes(batch)
+            indexed += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс пересобран, рецептов: {indexed}.'))
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingCartIngredient
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Пересобрать суммарные списки покупок или сверить их '
+            'с рецептами в корзинах')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить таблицу, не изменяя её',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check()
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        created = 0
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.all().delete()
+            batch = []
+            for row in ShoppingCartIngredient.objects.live().iterator():
+                batch.append(ShoppingCartIngredient(**row))
+                if len(batch) >= BATCH_SIZE:
+                    ShoppingCartIngredient.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            ShoppingCartIngredient.objects.bulk_create(batch)
+            created += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, строк: {created}.'))
+
+    def check(self):
+        stored = ShoppingCartIngredient.objects.order_by(
+            'user_id', 'ingredient_id'
+        ).values_list('user_id', 'ingredient_id', 'amount').iterator()
+        live = ShoppingCartIngredient.objects.live().values_list(
+            'user_id', 'ingredient_id', 'amount').iterator()
+        errors = 0
+        for key, stored_amount, live_amount in merge(stored, live):
+            if stored_amount != live_amount:
+                errors += 1
+                self.stdout.write(
+                    f'user={key[0]} ingredient={key[1]}: '
+                    f'{stored_amount} != {live_amount}')
+        if errors:
+            raise CommandError(
+                f'Найдено расхождений: {errors}. '
+                f'Запустите команду без --check.')
+        self.stdout.write(self.style.SUCCESS('Списки покупок актуальны.'))
+
+
+def merge(stored, live):
+    """Объединить два отсортированных потока (пользователь, ингредиент,
+    количество) по ключу."""
+    stored_row = next(stored, None)
+    live_row = next(live, None)
+    while stored_row or live_row:
+        stored_key = stored_row[:2] if stored_row else None
+        live_key = live_row[:2] if live_row else None
+        if live_key is None or (stored_key and stored_key < live_key):
+            yield stored_key, stored_row[2], None
+            stored_row = next(stored, None)
+        elif stored_key is None or live_key < stored_key:
+            yield live_key, None, live_row[2]
+            live_row = next(live, None)
+        else:
+            yield stored_key, stored_row[2], live_row[2]
+            stored_row = next(stored, None)
+            live_row = next(live, None)
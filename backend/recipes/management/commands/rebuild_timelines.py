@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import TimelineEntry
+
+
+class Command(BaseCommand):
+    help = ('Пересобрать ленты подписок, например после изменения '
+            'FEED_FANOUT_THRESHOLD или FEED_BACKFILL_SIZE')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = TimelineEntry.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны, записей: {created}.'))
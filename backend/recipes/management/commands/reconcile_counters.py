@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import MediaFile
+from recipes.signals import COUNTERS
+
+
+def count(model, field):
+    """Подзапрос с фактическим количеством связей объекта."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Сверить и исправить денормализованные счётчики'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сверить счётчики, не изменяя их',
+        )
+
+    def handle(self, *args, **options):
+        check = options['check']
+        errors = 0
+        for relation, (field, model, counter) in COUNTERS.items():
+            actual = count(relation, field)
+            drifted = model.objects.annotate(actual=actual).exclude(
+                **{counter: F('actual')}
+            ).values('pk')
+            if check:
+                drifted_count = drifted.count()
+            else:
+                drifted_count = model.objects.filter(
+                    pk__in=drifted).update(**{counter: actual})
+            errors += drifted_count
+            self.report(f'{model.__name__}.{counter}', drifted_count, check)
+        drifted_count = MediaFile.objects.reconcile(check=check)
+        errors += drifted_count
+        self.report('MediaFile.references', drifted_count, check)
+        if not errors:
+            self.stdout.write(self.style.SUCCESS('Счётчики актуальны.'))
+        elif check:
+            raise CommandError(
+                f'Найдено расхождений: {errors}. '
+                f'Запустите команду без --check.')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено счётчиков: {errors}.'))
+
+    def report(self, label, drifted_count, check):
+        if check:
+            self.stdout.write(f'{label}: {drifted_count} расхождений')
+        else:
+            self.stdout.write(f'{label}: исправлено {drifted_count}')
@@ -0,0 +1,148 @@
+import random
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from recipes.reference import REFERENCES
+from users.models import Subscription, User
+
+
+class Command(BaseCommand):
+    help = 'Заполнить базу синтетическими данными для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--ingredient-amounts', type=int, default=10000,
+            help='Общее число ингредиентов во всех рецептах',
+        )
+        parser.add_argument('--favorites', type=int, default=5000)
+        parser.add_argument('--shopping-carts', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.random = random.Random(options['seed'])
+        started = time.monotonic()
+        tags = self.ensure_tags()
+        ingredients = self.ensure_ingredients()
+        users = self.create_users(options['users'])
+        recipes = self.create_recipes(options['recipes'], users, tags)
+        self.create_ingredient_amounts(
+            options['ingredient_amounts'], recipes, ingredients)
+        for model, count in ((Favorite, options['favorites']),
+                             (ShoppingCart, options['shopping_carts'])):
+            self.create_pairs(model, 'recipe', count, users, recipes)
+        self.create_pairs(
+            Subscription, 'following', options['subscriptions'], users, users)
+        call_command('rebuild_shopping_carts', stdout=self.stdout)
+        call_command('reconcile_counters', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        call_command('rebuild_timelines', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {time.monotonic() - started:.1f} с.'))
+
+    def bulk_create(self, model, objs):
+        """Сохранить объекты пачками, не держа в памяти весь набор."""
+        batch = []
+        created = 0
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                created += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        if model in REFERENCES:
+            REFERENCES[model].bump()
+        self.stdout.write(f'{model.__name__}: {created}')
+
+    def ensure_tags(self):
+        if not Tag.objects.exists():
+            self.bulk_create(Tag, (
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in (
+                    ('Завтрак', '#E26C2D', 'breakfast'),
+                    ('Обед', '#49B64E', 'lunch'),
+                    ('Ужин', '#8775D2', 'dinner'),
+                )
+            ))
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def ensure_ingredients(self):
+        if not Ingredient.objects.exists():
+            self.bulk_create(Ingredient, (
+                Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+                for i in range(2000)
+            ))
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def create_users(self, count):
+        start = User.objects.count()
+        self.bulk_create(User, (
+            User(
+                username=f'seed{i}', email=f'seed{i}@example.com',
+                first_name='Имя', last_name='Фамилия',
+            ) for i in range(start, start + count)
+        ))
+        return list(User.objects.order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, count, users, tags):
+        start = Recipe.objects.count()
+        with transaction.atomic():
+            self.bulk_create(Recipe, (
+                Recipe(
+                    author_id=self.random.choice(users),
+                    name=f'Рецепт {i}',
+                    text='Описание рецепта',
+                    cooking_time=self.random.randint(1, 120),
+                    image='recipes/images/seed.png',
+                ) for i in range(start, start + count)
+            ))
+            recipes = list(
+                Recipe.objects.order_by('id').values_list('id', flat=True))
+            through = Recipe.tags.through
+            self.bulk_create(through, (
+                through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes[start:]
+                for tag in self.random.sample(
+                    tags, self.random.randint(1, len(tags)))
+            ))
+        return recipes
+
+    def create_ingredient_amounts(self, count, recipes, ingredients):
+        per_recipe, rest = divmod(count, len(recipes))
+
+        def amounts():
+            for index, recipe in enumerate(recipes):
+                number = min(per_recipe + (index < rest), len(ingredients))
+                for ingredient in self.random.sample(ingredients, number):
+                    yield IngredientAmount(
+                        recipe_id=recipe, ingredient_id=ingredient,
+                        amount=self.random.randint(1, 500),
+                    )
+
+        self.bulk_create(IngredientAmount, amounts())
+
+    def create_pairs(self, model, field, count, users, targets):
+        """Создать уникальные пары (пользователь, объект)."""
+        count = min(count, len(users) * (len(targets) - 1))
+
+        def pairs():
+            for index in range(count):
+                user = users[index % len(users)]
+                target = targets[
+                    (index // len(users) + 1 + user) % len(targets)]
+                if target != user or field != 'following':
+                    yield model(user_id=user, **{f'{field}_id': target})
+
+        self.bulk_create(model, pairs())
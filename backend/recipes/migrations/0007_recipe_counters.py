@@ -0,0 +1,52 @@
+# Generated by Django 2.2 on 2026-10-18 12:08
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def count(model, field):
+    return Coalesce(models.Subquery(
+        model.objects.filter(
+            **{field: models.OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=models.Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    Subscription = apps.get_model('users', 'Subscription')
+    User = apps.get_model('users', 'User')
+    Recipe.objects.update(
+        favorites_count=count(Favorite, 'recipe'),
+        in_carts_count=count(ShoppingCart, 'recipe'),
+    )
+    User.objects.update(
+        recipes_count=count(Recipe, 'author'),
+        followers_count=count(Subscription, 'following'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_shoppingcartingredient'),
+        ('users', '0006_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
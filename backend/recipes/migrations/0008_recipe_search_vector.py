@@ -0,0 +1,68 @@
+# Generated by Django 2.2 on 2026-10-18 12:11
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+INGREDIENTS = (
+    "SELECT {aggregate} FROM recipes_ingredientamount a "
+    "JOIN recipes_ingredient i ON i.id = a.ingredient_id "
+    "WHERE a.recipe_id = r.id"
+)
+
+POSTGRESQL_FORWARD = (
+    "CREATE INDEX recipes_recipe_search_vector_gin "
+    "ON recipes_recipe USING gin (search_vector)",
+    "UPDATE recipes_recipe r SET search_vector = "
+    "setweight(to_tsvector(%(config)s, r.name), 'A') || "
+    "setweight(to_tsvector(%(config)s, coalesce(({ingredients}), '')), 'B') || "
+    "setweight(to_tsvector(%(config)s, r.text), 'C')".format(
+        ingredients=INGREDIENTS.format(aggregate="string_agg(i.name, ' ')")),
+)
+
+SQLITE_FORWARD = (
+    "CREATE VIRTUAL TABLE recipes_recipe_fts "
+    "USING fts5(name, ingredients, text, tokenize='unicode61')",
+    "INSERT INTO recipes_recipe_fts (rowid, name, ingredients, text) "
+    "SELECT r.id, r.name, coalesce(({ingredients}), ''), r.text "
+    "FROM recipes_recipe r".format(
+        ingredients=INGREDIENTS.format(aggregate="group_concat(i.name, ' ')")),
+)
+
+BACKWARD = {
+    'postgresql': ('DROP INDEX recipes_recipe_search_vector_gin',),
+    'sqlite': ('DROP TABLE recipes_recipe_fts',),
+}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {
+        'postgresql': POSTGRESQL_FORWARD,
+        'sqlite': SQLITE_FORWARD,
+    }.get(vendor, ())
+    params = {'config': settings.SEARCH_CONFIG}
+    for statement in statements:
+        schema_editor.execute(
+            statement, params if vendor == 'postgresql' else None)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in BACKWARD.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый документ'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2 on 2026-10-18 12:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from itertools import groupby
+from operator import itemgetter
+
+
+def fill_timelines(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscription = apps.get_model('users', 'Subscription')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    subscriptions = Subscription.objects.filter(
+        following__followers_count__lte=settings.FEED_FANOUT_THRESHOLD,
+    ).order_by('following_id').values_list('following_id', 'user_id')
+    for author_id, rows in groupby(subscriptions, key=itemgetter(0)):
+        recipes = list(Recipe.objects.filter(
+            author_id=author_id
+        ).order_by('-pub_date', 'id').values_list(
+            'id', flat=True)[:settings.FEED_BACKFILL_SIZE])
+        TimelineEntry.objects.bulk_create((
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+            for _, user_id in rows for recipe_id in recipes
+        ), batch_size=settings.FEED_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_search_vector'),
+        ('users', '0006_user_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='timeline_entry_unique'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2 on 2026-10-18 12:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeImageVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, verbose_name='Исходная картинка')),
+                ('name', models.CharField(max_length=16, verbose_name='Вариант')),
+                ('format', models.CharField(max_length=8, verbose_name='Формат')),
+                ('image', models.ImageField(upload_to='recipes/variants/', verbose_name='Картинка')),
+                ('width', models.PositiveIntegerField(verbose_name='Ширина')),
+                ('height', models.PositiveIntegerField(verbose_name='Высота')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='recipes.Recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Вариант картинки',
+                'verbose_name_plural': 'Варианты картинок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipeimagevariant',
+            constraint=models.UniqueConstraint(fields=('recipe', 'name', 'format'), name='recipe_image_variant_unique'),
+        ),
+    ]
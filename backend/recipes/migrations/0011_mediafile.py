@@ -0,0 +1,42 @@
+# Generated by Django 2.2 on 2026-10-18 12:33
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def fill_media_files(apps, schema_editor):
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    counts = Counter()
+    for name in ('Recipe', 'RecipeImageVariant'):
+        counts.update(apps.get_model('recipes', name).objects.exclude(
+            image=''
+        ).values_list('image', flat=True).iterator())
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=name, references=references)
+         for name, references in counts.items()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipeimagevariant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл',
+                'verbose_name_plural': 'Файлы',
+            },
+        ),
+        migrations.RunPython(fill_media_files, migrations.RunPython.noop),
+    ]
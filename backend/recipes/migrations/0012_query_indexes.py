@@ -0,0 +1,96 @@
+# Generated by Django 2.2 on 2026-10-18 12:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Отбор рецептов по тегам идёт от тега к рецептам: индекс по (tag_id,
+# recipe_id) отвечает без чтения таблицы связей.
+TAGS_INDEX = 'recipes_recipe_tags_tag_recipe_idx'
+# На PostgreSQL поиск по началу названия (name__istartswith) сравнивает
+# UPPER(name::text) через LIKE, обычный индекс по name для этого не годится.
+INGREDIENT_NAME_INDEX = 'recipes_ingredient_name_prefix_idx'
+
+
+def create_ingredient_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX {INGREDIENT_NAME_INDEX} ON recipes_ingredient '
+            f'(UPPER(name::text) text_pattern_ops)')
+
+
+def drop_ingredient_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX {INGREDIENT_NAME_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_mediafile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['recipe', 'user'], name='favorite_recipe_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientamount',
+            index=models.Index(fields=['recipe', 'ingredient', 'amount'], name='ingredient_amount_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', 'id'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date', 'id'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['recipe', 'user'], name='shopping_cart_recipe_user_idx'),
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.Recipe', verbose_name='Избранные рецепты'),
+        ),
+        migrations.AlterField(
+            model_name='favorite',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL, verbose_name='Владелец'),
+        ),
+        migrations.AlterField(
+            model_name='ingredientamount',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ingredients', to='recipes.Recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='author',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recipes', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='pub_date',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Дата публикации'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.Recipe', verbose_name='Рецепты к покупке'),
+        ),
+        migrations.AlterField(
+            model_name='shoppingcart',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart', to=settings.AUTH_USER_MODEL, verbose_name='Владелец'),
+        ),
+        migrations.RunSQL(
+            f'CREATE INDEX {TAGS_INDEX} ON recipes_recipe_tags '
+            f'(tag_id, recipe_id)',
+            f'DROP INDEX {TAGS_INDEX}',
+        ),
+        migrations.RunPython(
+            create_ingredient_name_index, drop_ingredient_name_index),
+    ]
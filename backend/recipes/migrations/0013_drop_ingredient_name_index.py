@@ -0,0 +1,29 @@
+from django.db import migrations
+
+# Подсказки ингредиентов ищут по индексу в памяти процесса (recipes.search),
+# запросов к базе по началу названия нет, и индекс из 0012 не используется.
+INGREDIENT_NAME_INDEX = 'recipes_ingredient_name_prefix_idx'
+
+
+def drop_ingredient_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INGREDIENT_NAME_INDEX}')
+
+
+def create_ingredient_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX {INGREDIENT_NAME_INDEX} ON recipes_ingredient '
+            f'(UPPER(name::text) text_pattern_ops)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            drop_ingredient_name_index, create_ingredient_name_index),
+    ]
@@ -1,9 +1,16 @@
-from django.db import models
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Greatest, RowNumber
 
 from core.validators import (validate_hex, validate_letter_field,
                              validate_min_value)
 from foodgram.settings import MAX_LENGTH_FIELD, MAX_LENGTH_HEX, MAX_LENGTH_UOM
-from users.models import User
+from users.models import Subscription, User
 
 
 class Ingredient(models.Model):
@@ -58,6 +65,70 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов к рецептам."""
+
+    def for_user(self, user):
+        """Подгрузить связи рецептов и флаги текущего пользователя.
+
+        Число запросов не зависит от количества рецептов в выборке.
+        """
+        authors = User.objects.all()
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=models.Exists(
+                Subscription.objects.filter(
+                    user=user, following=models.OuterRef('pk'))
+            ))
+            is_favorited = models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk')))
+            is_in_shopping_cart = models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk')))
+        else:
+            is_favorited = is_in_shopping_cart = models.Value(
+                False, output_field=models.BooleanField())
+            authors = authors.annotate(is_subscribed=is_favorited)
+        return self.prefetch_related(
+            models.Prefetch('author', queryset=authors),
+            'tags',
+            models.Prefetch(
+                'image_variants',
+                queryset=RecipeImageVariant.objects.order_by('id'),
+            ),
+            models.Prefetch(
+                'ingredients',
+                queryset=IngredientAmount.objects.select_related(
+                    'ingredient').order_by('id'),
+            ),
+        ).annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        )
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Последние limit рецептов каждого из авторов одним запросом.
+
+        Место рецепта у автора считается оконной функцией ROW_NUMBER;
+        фильтровать по ней ORM не умеет, поэтому она во вложенном запросе.
+        """
+        queryset = self.order_by('-pub_date', 'id').prefetch_related(
+            'image_variants')
+        if limit is None:
+            return queryset
+        ranked = Recipe.objects.filter(author_id__in=author_ids).annotate(
+            recipe_rank=models.Window(
+                RowNumber(),
+                partition_by=[models.F('author_id')],
+                order_by=[models.F('pub_date').desc(), models.F('id').asc()],
+            )
+        ).values('id', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        return queryset.extra(
+            where=(f'{Recipe._meta.db_table}.id IN (SELECT id FROM ({sql}) '
+                   f'ranked WHERE recipe_rank <= %s)',),
+            params=(*params, limit),
+        )
+
+
 class Recipe(models.Model):
     """Класс, представляющий модель рецепта."""
 
@@ -66,6 +137,7 @@ class Recipe(models.Model):
         on_delete=models.CASCADE,
         related_name='recipes',
         verbose_name='Автор',
+        db_index=False,
     )
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления (в минутах)',
@@ -83,7 +155,24 @@ class Recipe(models.Model):
     )
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
-        auto_now_add=True, db_index=True
+        auto_now_add=True,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в избранное',
+        default=0,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Добавлений в список покупок',
+        default=0,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый документ',
+        null=True,
+        editable=False,
     )
     tags = models.ManyToManyField(
         Tag,
@@ -94,10 +183,21 @@ class Recipe(models.Model):
         verbose_name='Описание',
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        # Под сортировку выдачи (-pub_date, id), в том числе по автору.
+        indexes = [
+            models.Index(
+                name='recipe_pub_date_idx', fields=('-pub_date', 'id')),
+            models.Index(
+                name='recipe_author_pub_date_idx',
+                fields=('author', '-pub_date', 'id'),
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name='author_recipe_unique',
@@ -109,6 +209,125 @@ class Recipe(models.Model):
         return self.name
 
 
+class RecipeImageVariant(models.Model):
+    """Класс, представляющий уменьшенную копию картинки рецепта."""
+
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name='Рецепт',
+    )
+    source = models.CharField(
+        max_length=255,
+        verbose_name='Исходная картинка',
+    )
+    name = models.CharField(
+        max_length=16,
+        verbose_name='Вариант',
+    )
+    format = models.CharField(
+        max_length=8,
+        verbose_name='Формат',
+    )
+    image = models.ImageField(
+        upload_to='recipes/variants/',
+        verbose_name='Картинка',
+    )
+    width = models.PositiveIntegerField(verbose_name='Ширина')
+    height = models.PositiveIntegerField(verbose_name='Высота')
+
+    class Meta:
+        verbose_name = 'Вариант картинки'
+        verbose_name_plural = 'Варианты картинок'
+        constraints = [
+            models.UniqueConstraint(
+                name='recipe_image_variant_unique',
+                fields=('recipe', 'name', 'format'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name}.{self.format} для {self.recipe}'
+
+
+# Модель: поле со ссылкой на файл в хранилище.
+MEDIA_FIELDS = {
+    Recipe: 'image',
+    RecipeImageVariant: 'image',
+}
+
+
+class MediaFileManager(models.Manager):
+    """Счётчики ссылок на файлы: одинаковые картинки хранятся один раз,
+    и файл можно удалить, только когда на него не ссылается ни одна
+    запись из MEDIA_FIELDS."""
+
+    def change(self, name, delta):
+        if not name:
+            return
+        updated = self.filter(name=name).update(
+            references=Greatest(models.F('references') + delta, 0))
+        if updated or delta < 0:
+            return
+        _, created = self.get_or_create(
+            name=name, defaults={'references': delta})
+        if not created:
+            self.filter(name=name).update(
+                references=models.F('references') + delta)
+
+    def count_references(self, names=None):
+        """Фактическое число ссылок на файлы (на все или из names)."""
+        counts = Counter()
+        for model, field in MEDIA_FIELDS.items():
+            queryset = model.objects.exclude(**{field: ''})
+            if names is not None:
+                queryset = queryset.filter(**{f'{field}__in': names})
+            counts.update(queryset.values_list(field, flat=True).iterator())
+        return counts
+
+    @transaction.atomic
+    def reconcile(self, check=False):
+        """Сверить счётчики с фактическими ссылками, вернуть число
+        расхождений; без check - заодно исправить их."""
+        counts = self.count_references()
+        drifted = []
+        for file in self.select_for_update().iterator():
+            references = counts.pop(file.name, 0)
+            if file.references != references:
+                file.references = references
+                drifted.append(file)
+        missing = [
+            self.model(name=name, references=references)
+            for name, references in counts.items()
+        ]
+        if not check:
+            self.bulk_update(drifted, ['references'], batch_size=1000)
+            self.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+        return len(drifted) + len(missing)
+
+
+class MediaFile(models.Model):
+    """Класс, представляющий файл в хранилище и число ссылок на него."""
+
+    name = models.CharField(
+        max_length=255, unique=True,
+        verbose_name='Путь',
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ссылок',
+    )
+
+    objects = MediaFileManager()
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
+
+
 class Favorite(models.Model):
     """Класс, представляющий модель избранных рецептов."""
 
@@ -116,14 +335,22 @@ class Favorite(models.Model):
         User, on_delete=models.CASCADE,
         related_name='favorites',
         verbose_name='Владелец',
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE,
         related_name='+',
         verbose_name='Избранные рецепты',
+        db_index=False,
     )
 
     class Meta:
+        # Уникальность (user, recipe) служит индексом по пользователю,
+        # обратный индекс - по рецепту.
+        indexes = [
+            models.Index(
+                name='favorite_recipe_user_idx', fields=('recipe', 'user')),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name='favorites_unique',
@@ -139,14 +366,22 @@ class ShoppingCart(models.Model):
         User, on_delete=models.CASCADE,
         related_name='shopping_cart',
         verbose_name='Владелец',
+        db_index=False,
     )
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE,
         related_name='+',
         verbose_name='Рецепты к покупке',
+        db_index=False,
     )
 
     class Meta:
+        indexes = [
+            models.Index(
+                name='shopping_cart_recipe_user_idx',
+                fields=('recipe', 'user'),
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name='buying_unique',
@@ -169,12 +404,245 @@ class IngredientAmount(models.Model):
     recipe = models.ForeignKey(
         Recipe, on_delete=models.CASCADE,
         related_name='ingredients',
-        verbose_name='Рецепт'
+        verbose_name='Рецепт',
+        db_index=False,
     )
 
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        # Количества ингредиентов рецепта читаются только из индекса.
+        indexes = [
+            models.Index(
+                name='ingredient_amount_recipe_idx',
+                fields=('recipe', 'ingredient', 'amount'),
+            ),
+        ]
 
     def __str__(self):
         return f'{self.ingredient} в {self.recipe}'
+
+
+def get_recipe_amounts(recipe):
+    """Количество каждого ингредиента в рецепте."""
+    return dict(IngredientAmount.objects.filter(
+        recipe=recipe
+    ).values_list('ingredient_id').annotate(total=models.Sum('amount')))
+
+
+class ShoppingCartIngredientManager(models.Manager):
+    """Поддержка суммарного списка покупок в актуальном состоянии."""
+
+    def apply(self, user_ids, deltas):
+        """Изменить количество ингредиентов в списках пользователей.
+
+        deltas - словарь {id ингредиента: изменение количества}.
+        """
+        deltas = {id: delta for id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic():
+            # Недостающие строки заводятся с нулём и пополняются общим
+            # UPDATE: параллельное добавление того же ингредиента не падает
+            # на уникальности, а ждёт блокировку строки.
+            self.bulk_create([
+                self.model(user_id=user_id, ingredient_id=id, amount=0)
+                for user_id in user_ids
+                for id, delta in deltas.items()
+                if delta > 0
+            ], ignore_conflicts=True)
+            self.filter(user__in=user_ids, ingredient__in=deltas).update(
+                amount=models.F('amount') + models.Case(
+                    *(models.When(ingredient_id=id, then=models.Value(delta))
+                      for id, delta in deltas.items()),
+                    output_field=models.IntegerField(),
+                ))
+            if min(deltas.values()) < 0:
+                self.filter(user__in=user_ids, amount__lte=0).delete()
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Учесть изменение ингредиентов рецепта во всех списках покупок."""
+        self.apply(
+            ShoppingCart.objects.filter(
+                recipe=recipe).values_list('user_id', flat=True),
+            {id: new_amounts.get(id, 0) - old_amounts.get(id, 0)
+             for id in old_amounts.keys() | new_amounts.keys()},
+        )
+
+    def add_recipe(self, user_id, recipe):
+        self.apply((user_id,), get_recipe_amounts(recipe))
+
+    def remove_recipe(self, user_id, recipe):
+        self.apply((user_id,), {
+            id: -amount for id, amount in get_recipe_amounts(recipe).items()
+        })
+
+    def live(self):
+        """Суммарный список покупок, посчитанный по рецептам."""
+        return ShoppingCart.objects.filter(
+            recipe__ingredients__isnull=False
+        ).values(
+            'user_id',
+            ingredient_id=models.F('recipe__ingredients__ingredient'),
+        ).annotate(
+            amount=models.Sum('recipe__ingredients__amount')
+        ).order_by('user_id', 'ingredient_id')
+
+
+class ShoppingCartIngredient(models.Model):
+    """Класс, представляющий суммарное количество ингредиента
+    в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_cart_ingredients',
+        verbose_name='Владелец',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+    )
+
+    objects = ShoppingCartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списке покупок'
+        constraints = [
+            models.UniqueConstraint(
+                name='shopping_cart_ingredient_unique',
+                fields=('user', 'ingredient'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} у {self.user}'
+
+
+class TimelineEntryManager(models.Manager):
+    """Ленты подписок: рецепты автора раскладываются по лентам подписчиков
+    при публикации, а рецепты авторов, у которых подписчиков больше
+    FEED_FANOUT_THRESHOLD, подмешиваются при чтении."""
+
+    def is_popular(self, author_id):
+        return User.objects.filter(
+            id=author_id,
+            followers_count__gt=settings.FEED_FANOUT_THRESHOLD,
+        ).exists()
+
+    def fan_out(self, recipe):
+        """Добавить новый рецепт в ленты подписчиков автора."""
+        if self.is_popular(recipe.author_id):
+            return
+        followers = Subscription.objects.filter(
+            following_id=recipe.author_id
+        ).values_list('user_id', flat=True).iterator()
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe=recipe)
+             for user_id in followers),
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def backfill(self, author_id, user_ids):
+        """Добавить последние рецепты автора в ленты пользователей, вернуть
+        число записей."""
+        recipes = list(Recipe.objects.filter(
+            author_id=author_id
+        ).order_by('-pub_date', 'id').values_list(
+            'id', flat=True)[:settings.FEED_BACKFILL_SIZE])
+        entries = [
+            self.model(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids for recipe_id in recipes
+        ]
+        self.bulk_create(
+            entries,
+            batch_size=settings.FEED_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        return len(entries)
+
+    def follow(self, user_id, author_id):
+        """Добавить в ленту последние рецепты нового автора."""
+        if not self.is_popular(author_id):
+            self.backfill(author_id, (user_id,))
+
+    def unfollow(self, user_id, author_id):
+        """Убрать рецепты автора из ленты бывшего подписчика.
+
+        Вызывается после уменьшения счётчика подписчиков, строка автора
+        заблокирована до конца транзакции. Если автор только что перестал
+        быть популярным, его рецепты больше не подмешиваются при чтении, и
+        они раскладываются по лентам оставшихся подписчиков.
+        """
+        self.filter(
+            user_id=user_id,
+            recipe__in=Recipe.objects.filter(author_id=author_id),
+        ).delete()
+        if User.objects.filter(
+            id=author_id,
+            followers_count=settings.FEED_FANOUT_THRESHOLD,
+        ).exists():
+            self.backfill(author_id, Subscription.objects.filter(
+                following_id=author_id).values_list('user_id', flat=True))
+
+    def rebuild(self):
+        """Пересобрать ленты всех пользователей, вернуть число записей."""
+        self.all().delete()
+        subscriptions = Subscription.objects.filter(
+            following__followers_count__lte=settings.FEED_FANOUT_THRESHOLD,
+        ).order_by('following_id').values_list(
+            'following_id', 'user_id').iterator()
+        return sum(
+            self.backfill(author_id, [user_id for _, user_id in rows])
+            for author_id, rows in groupby(subscriptions, key=itemgetter(0))
+        )
+
+    def feed(self, user):
+        """Условие отбора рецептов ленты пользователя."""
+        condition = models.Q(id__in=self.filter(
+            user=user).values('recipe_id'))
+        popular = list(Subscription.objects.filter(
+            user=user,
+            following__followers_count__gt=settings.FEED_FANOUT_THRESHOLD,
+        ).values_list('following_id', flat=True))
+        if popular:
+            condition |= models.Q(author_id__in=popular)
+        return condition
+
+
+class TimelineEntry(models.Model):
+    """Класс, представляющий рецепт в ленте подписок пользователя."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+
+    objects = TimelineEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                name='timeline_entry_unique',
+                fields=('user', 'recipe'),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
@@ -0,0 +1,112 @@
+"""Кэш справочников: тегов и ингредиентов.
+
+Справочник лежит в общем кэше (settings.CACHES) под ключом с номером
+версии и дублируется в памяти процесса. При любом изменении справочника
+версия меняется, и старые ключи просто перестают читаться: это видят все
+процессы, которые используют общий кэш.
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.replicas import use_primary
+from .models import Ingredient, Tag
+
+
+class ReferenceData:
+    """Версия справочника, его записи по порядку и по id."""
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = items
+        self.by_id = {item['id']: item for item in items}
+
+
+class ReferenceCache:
+
+    def __init__(self, name, model, fields):
+        self.name = name
+        self.model = model
+        self.fields = fields
+        self.version_key = f'reference:{name}:version'
+        self.lock = threading.Lock()
+        self.local = None
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.add(self.version_key, version, None)
+            # Ключ мог завести параллельный запрос, а мог уже и вытеснить
+            # кэш.
+            version = cache.get(self.version_key, version)
+        return version
+
+    def bump(self):
+        """Сменить версию справочника после коммита его изменения: иначе
+        параллельный запрос мог бы закэшировать ещё старые записи под
+        новой версией."""
+        transaction.on_commit(self.reset)
+
+    def reset(self):
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+        self.local = None
+
+    def get(self):
+        """Актуальная версия справочника."""
+        version = self.get_version()
+        local = self.local
+        if local is not None and local.version == version:
+            return local
+        with self.lock:
+            local = self.local
+            if local is None or local.version != version:
+                local = self.local = ReferenceData(
+                    version, self.load(version))
+        return local
+
+    def get_including(self, ids):
+        """Справочник, в котором есть записи с ids.
+
+        Версия меняется только после коммита, и до него в кэше может не
+        быть только что добавленных записей: тогда справочник читается из
+        базы мимо кэша.
+        """
+        data = self.get()
+        if data.by_id.keys() >= set(ids):
+            return data
+        return ReferenceData(
+            None, list(self.model.objects.values(*self.fields)))
+
+    def load(self, version):
+        key = f'reference:{self.name}:{version}'
+        items = cache.get(key)
+        if items is None:
+            with use_primary():
+                items = list(self.model.objects.values(*self.fields))
+            cache.set(key, items, settings.REFERENCE_CACHE_TIMEOUT)
+        return items
+
+    def missing(self, ids):
+        """id из ids, которых нет в справочнике.
+
+        Версия могла смениться в другом процессе, который ещё не сбросил
+        свою копию, поэтому id, которых нет в кэше, проверяются по базе.
+        """
+        by_id = self.get().by_id
+        unknown = [id for id in ids if id not in by_id]
+        if not unknown:
+            return []
+        found = set(self.model.objects.filter(
+            id__in=unknown).values_list('id', flat=True))
+        return [id for id in unknown if id not in found]
+
+
+tags = ReferenceCache('tags', Tag, ('id', 'name', 'color', 'slug'))
+ingredients = ReferenceCache(
+    'ingredients', Ingredient, ('id', 'name', 'measurement_unit'))
+
+REFERENCES = {Tag: tags, Ingredient: ingredients}
@@ -0,0 +1,103 @@
+"""Полнотекстовый поиск рецептов.
+
+На PostgreSQL документ хранится в столбце Recipe.search_vector с GIN-индексом,
+на SQLite - в виртуальной таблице FTS5 с rowid, равным id рецепта.
+"""
+import re
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, TextField
+from django.db.models.expressions import RawSQL
+
+from .models import IngredientAmount, Recipe
+
+FTS_TABLE = 'recipes_recipe_fts'
+FTS_WEIGHTS = '10.0, 5.0, 1.0'
+
+
+def get_documents(recipe_ids):
+    """Название, ингредиенты и описание каждого рецепта для FTS5."""
+    ingredients = {}
+    for recipe_id, name in IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient__name'):
+        ingredients.setdefault(recipe_id, []).append(name)
+    for id, name, text in Recipe.objects.filter(
+        id__in=recipe_ids
+    ).values_list('id', 'name', 'text'):
+        yield id, name, ' '.join(ingredients.get(id, ())), text
+
+
+def vector(expression, weight):
+    return SearchVector(
+        expression, weight=weight, config=settings.SEARCH_CONFIG)
+
+
+def index_recipes(recipe_ids):
+    """Обновить поисковые документы рецептов."""
+    recipe_ids = list(recipe_ids)
+    if connection.vendor == 'postgresql':
+        # Один UPDATE на все рецепты: документ собирается в базе.
+        ingredients = IngredientAmount.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        Recipe.objects.filter(id__in=recipe_ids).update(search_vector=(
+            vector('name', 'A')
+            + vector(Subquery(ingredients, output_field=TextField()), 'B')
+            + vector('text', 'C')
+        ))
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} '
+                f'(rowid, name, ingredients, text) VALUES (%s, %s, %s, %s)',
+                list(get_documents(recipe_ids)),
+            )
+
+
+def unindex_recipes(recipe_ids):
+    """Убрать документы удалённых рецептов из FTS5 на SQLite; на
+    PostgreSQL документ удаляется вместе со строкой рецепта."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                [(id,) for id in recipe_ids],
+            )
+
+
+def fts_query(value):
+    """Запрос FTS5: все слова как префиксы, без спецсимволов."""
+    words = re.findall(r'\w+', value)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, value):
+    """Отфильтровать рецепты по запросу и упорядочить по релевантности."""
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, config=settings.SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', 'id')
+    if connection.vendor == 'sqlite':
+        query = fts_query(value)
+        if not query:
+            return queryset.none()
+        # bm25 допустим только рядом с MATCH, поэтому ранг участвует лишь
+        # в сортировке: подсчёт страниц отбрасывает её и не ломается.
+        rank = RawSQL(f'bm25({FTS_TABLE}, {FTS_WEIGHTS})', ())
+        return queryset.extra(
+            tables=(FTS_TABLE,),
+            where=(
+                f'{FTS_TABLE}.rowid = recipes_recipe.id',
+                f'{FTS_TABLE} MATCH %s',
+            ),
+            params=(query,),
+        ).order_by(rank.asc(), '-pub_date', 'id')
+    return queryset.filter(name__icontains=value)
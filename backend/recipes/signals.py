@@ -0,0 +1,235 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Subscription, User
+from .models import (MEDIA_FIELDS, Favorite, Ingredient, IngredientAmount,
+                     MediaFile, Recipe, RecipeImageVariant, ShoppingCart,
+                     ShoppingCartIngredient, Tag, TimelineEntry)
+from .reference import REFERENCES
+from .search import unindex_recipes
+from .versions import bump_recipes
+
+# Модель-связь: (поле-ссылка, модель со счётчиком, поле счётчика).
+COUNTERS = {
+    Favorite: ('recipe_id', Recipe, 'favorites_count'),
+    ShoppingCart: ('recipe_id', Recipe, 'in_carts_count'),
+    Recipe: ('author_id', User, 'recipes_count'),
+    Subscription: ('following_id', User, 'followers_count'),
+}
+
+
+def change_counter(sender, instance, delta):
+    field, model, counter = COUNTERS[sender]
+    model.objects.filter(pk=getattr(instance, field)).update(
+        **{counter: Greatest(F(counter) + delta, 0)})
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def increment_counter(sender, instance, created, raw=False, **kwargs):
+    """Увеличить счётчик при создании связи."""
+    if created and not raw:
+        change_counter(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def decrement_counter(sender, instance, **kwargs):
+    """Уменьшить счётчик при удалении связи."""
+    change_counter(sender, instance, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def touch_shopping_cart(sender, instance, **kwargs):
+    """Обновить дату изменения списка покупок пользователя."""
+    User.objects.filter(id=instance.user_id).update(
+        shopping_cart_updated=timezone.now())
+
+
+# Суммарный список покупок. При каскадном удалении рецепта его строки
+# ингредиентов и списков покупок удаляются в любом порядке, но каждый
+# обработчик вычитает только то, что ещё не удалено, так что каждое
+# количество вычитается ровно один раз.
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, raw=False, **kwargs):
+    """Добавить ингредиенты рецепта в список покупок."""
+    if created and not raw:
+        ShoppingCartIngredient.objects.add_recipe(
+            instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    """Вычесть ингредиенты рецепта из списка покупок."""
+    ShoppingCartIngredient.objects.remove_recipe(
+        instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_save, sender=IngredientAmount)
+def remember_ingredient_amount(sender, instance, raw=False, **kwargs):
+    """Запомнить ингредиент и количество строки до сохранения."""
+    instance._stored_amount = None
+    if instance.pk and not raw:
+        instance._stored_amount = sender.objects.filter(
+            pk=instance.pk).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientAmount)
+def change_shopping_list_amount(sender, instance, raw=False, **kwargs):
+    """Перенести изменение строки рецепта в списки покупок с ним."""
+    stored = instance.__dict__.pop('_stored_amount', None)
+    if raw:
+        return
+    ShoppingCartIngredient.objects.change_recipe(
+        instance.recipe_id, dict([stored]) if stored else {},
+        {instance.ingredient_id: instance.amount})
+
+
+@receiver(post_delete, sender=IngredientAmount)
+def release_shopping_list_amount(sender, instance, **kwargs):
+    """Вычесть удалённую строку рецепта из списков покупок с ним."""
+    ShoppingCartIngredient.objects.change_recipe(
+        instance.recipe_id, {instance.ingredient_id: instance.amount}, {})
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, raw=False, **kwargs):
+    """Разложить новый рецепт по лентам подписчиков."""
+    if created and not raw:
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def follow_author(sender, instance, created, raw=False, **kwargs):
+    """Добавить рецепты автора в ленту нового подписчика."""
+    if created and not raw:
+        TimelineEntry.objects.follow(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def unfollow_author(sender, instance, **kwargs):
+    """Убрать рецепты автора из ленты бывшего подписчика.
+
+    Подключён после decrement_counter: unfollow нужен уже уменьшенный
+    счётчик подписчиков.
+    """
+    TimelineEntry.objects.unfollow(instance.user_id, instance.following_id)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def bump_reference_version(sender, **kwargs):
+    """Сбросить кэш изменившегося справочника."""
+    REFERENCES[sender].bump()
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=RecipeImageVariant)
+def remember_media_file(sender, instance, raw=False, **kwargs):
+    """Запомнить файл, на который запись ссылалась до сохранения."""
+    instance._stored_media = None
+    if instance.pk and not raw:
+        instance._stored_media = sender.objects.filter(
+            pk=instance.pk
+        ).values_list(MEDIA_FIELDS[sender], flat=True).first()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=RecipeImageVariant)
+def count_media_file(sender, instance, raw=False, **kwargs):
+    """Перенести ссылку со старого файла на новый."""
+    if raw:
+        return
+    old = instance.__dict__.pop('_stored_media', None)
+    new = getattr(instance, MEDIA_FIELDS[sender]).name
+    if old != new:
+        MediaFile.objects.change(new, 1)
+        MediaFile.objects.change(old, -1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=RecipeImageVariant)
+def release_media_file(sender, instance, **kwargs):
+    """Снять ссылку удалённой записи с файла."""
+    MediaFile.objects.change(
+        getattr(instance, MEDIA_FIELDS[sender]).name, -1)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    """Убрать удалённый рецепт из поиска."""
+    unindex_recipes((instance.pk,))
+
+
+# Поля автора, которые попадают в выдачу рецептов.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_version(sender, instance, **kwargs):
+    """Сбросить кэш ответов с изменившимся рецептом."""
+    bump_recipes((instance.pk,))
+
+
+@receiver(post_save, sender=IngredientAmount)
+@receiver(post_delete, sender=IngredientAmount)
+@receiver(post_save, sender=RecipeImageVariant)
+@receiver(post_delete, sender=RecipeImageVariant)
+def bump_recipe_part_version(sender, instance, **kwargs):
+    """Сбросить кэш ответов с рецептом, у которого изменилась часть."""
+    bump_recipes((instance.recipe_id,))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_version(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    """Сбросить кэш ответов с рецептами, у которых изменились теги."""
+    if action == 'pre_clear' and reverse:
+        # После очистки тега его рецепты уже не узнать.
+        instance._cleared_recipes = list(
+            instance.recipes.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        bump_recipes((instance.pk,))
+    elif action == 'post_clear':
+        bump_recipes(instance.__dict__.pop('_cleared_recipes', ()))
+    else:
+        bump_recipes(pk_set)
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(sender, instance, update_fields=None, raw=False,
+                           **kwargs):
+    """Запомнить поля автора, которые видны в рецептах."""
+    instance._stored_author = None
+    if raw or not instance.pk or not instance.recipes_count:
+        return
+    if update_fields is not None and not set(update_fields) & set(
+            AUTHOR_FIELDS):
+        return
+    instance._stored_author = User.objects.filter(
+        pk=instance.pk).values_list(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(sender, instance, **kwargs):
+    """Сбросить кэш ответов с рецептами автора, сменившего имя."""
+    stored = instance.__dict__.pop('_stored_author', None)
+    if stored is None:
+        return
+    if stored != tuple(getattr(instance, field) for field in AUTHOR_FIELDS):
+        bump_recipes(Recipe.objects.filter(
+            author_id=instance.pk).values_list('id', flat=True))
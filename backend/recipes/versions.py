@@ -0,0 +1,41 @@
+"""Версии рецептов для кэширования ответов.
+
+Как и у справочников, версия - случайная строка в общем кэше. Ответ
+кэшируется под ключом с версиями данных, из которых он собран, а при
+изменении данных ключ версии удаляется: следующий читатель заведёт новую
+версию, и старые ответы перестанут читаться. Версии сбрасываются после
+коммита, иначе параллельный запрос мог бы закэшировать ещё старые данные
+под новой версией.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Любое изменение рецептов, влияющее на их списки.
+LIST_VERSION_KEY = 'recipes:list:version'
+
+
+def recipe_version_key(recipe_id):
+    return f'recipes:recipe:{recipe_id}:version'
+
+
+def get_versions(keys):
+    """Текущие версии по ключам, недостающие заводятся."""
+    versions = cache.get_many(keys)
+    missing = {
+        key: uuid.uuid4().hex for key in keys if key not in versions
+    }
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        # Ключ мог завести параллельный запрос, а мог уже и вытеснить кэш.
+        versions.update({**missing, **cache.get_many(list(missing))})
+    return [versions[key] for key in keys]
+
+
+def bump_recipes(recipe_ids):
+    """Сбросить версии рецептов и их списков после коммита."""
+    keys = [recipe_version_key(id) for id in recipe_ids]
+    keys.append(LIST_VERSION_KEY)
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,68 @@
+import pytest
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+from users.models import User
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def make_user(db):
+    def make_user(username):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password='password', first_name=username, last_name=username)
+    return make_user
+
+
+@pytest.fixture
+def user(make_user):
+    return make_user('user')
+
+
+@pytest.fixture
+def author(make_user):
+    return make_user('author')
+
+
+@pytest.fixture
+def client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def tag(db):
+    return Tag.objects.create(
+        name='Завтрак', color='#E26C2D', slug='breakfast')
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('мука', 'сахар', 'соль')
+    ]
+
+
+@pytest.fixture
+def make_recipe(author, tag, ingredients):
+    def make_recipe(name='Блины', amounts=(100, 50), author=author):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text='Текст', cooking_time=10,
+            image='recipes/images/test.png')
+        recipe.tags.add(tag)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient, amount in zip(ingredients, amounts))
+        return recipe
+    return make_recipe
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+from core.asgi import STREAM_CHUNK_SIZE, WSGIToASGI, get_environ
+
+SCOPE = {
+    'type': 'http',
+    'http_version': '1.1',
+    'method': 'GET',
+    'path': '/',
+    'query_string': b'',
+    'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'),
+                (b'accept', b'text/plain'), (b'accept', b'text/html')],
+}
+
+
+def test_repeated_headers():
+    environ = get_environ(SCOPE, None)
+    assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+    assert environ['HTTP_ACCEPT'] == 'text/plain,text/html'
+
+
+def test_streams_chunks_before_response_ends():
+    first = b'x' * STREAM_CHUNK_SIZE
+    first_sent = threading.Event()
+
+    def application(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        yield first
+        # Без потоковой отправки первый кусок не ушёл бы до конца ответа.
+        assert first_sent.wait(5)
+        yield b''
+        yield b'sec'
+        yield b'ond'
+
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+        if message.get('body') == first:
+            first_sent.set()
+
+    asyncio.run(WSGIToASGI(application, 1)(SCOPE, receive, send))
+    assert messages[0]['status'] == 200
+    assert [message.get('body') for message in messages[1:]] == [
+        first, b'second', None]
+    assert messages[-1].get('more_body', False) is False
+
+
+def test_empty_response_sends_headers():
+    def application(environ, start_response):
+        start_response('204 No Content', [])
+        return []
+
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(WSGIToASGI(application, 1)(SCOPE, receive, send))
+    assert [message['type'] for message in messages] == [
+        'http.response.start', 'http.response.body']
@@ -0,0 +1,144 @@
+import io
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from core import bulk_import
+from core.bulk_import import BulkImportError, BulkLoader, Checkpoint
+from recipes.models import Ingredient, Tag
+
+
+def write_lines(path, records):
+    path.write_text(
+        ''.join(json.dumps(record, ensure_ascii=False) + '\n'
+                for record in records),
+        encoding='utf-8')
+    return str(path)
+
+
+def ingredient_rows(names, unit='г'):
+    return [{'name': name, 'measurement_unit': unit} for name in names]
+
+
+def ingredients():
+    return dict(Ingredient.objects.values_list('name', 'measurement_unit'))
+
+
+@pytest.mark.parametrize('chunk_size', (1, 7, 64 * 1024))
+def test_read_json_streams_array(monkeypatch, chunk_size):
+    monkeypatch.setattr(bulk_import, 'CHUNK_SIZE', chunk_size)
+    items = [
+        {'model': 'recipes.tag', 'pk': 1, 'fields': {'name': 'a, ] }'}},
+        {'name': 'кириллица "в кавычках"', 'list': [1, [2, {}]]},
+        {},
+    ]
+    content = json.dumps(items, ensure_ascii=False, indent=2)
+    assert list(bulk_import.read_json(io.StringIO(content))) == items
+    assert list(bulk_import.read_json(io.StringIO(' [ ] '))) == []
+
+
+@pytest.mark.parametrize('content', ('{"a": 1}', '[{"a": 1}, {"b": ]'))
+def test_read_json_rejects_invalid_input(monkeypatch, content):
+    monkeypatch.setattr(bulk_import, 'CHUNK_SIZE', 4)
+    with pytest.raises(BulkImportError):
+        list(bulk_import.read_json(io.StringIO(content)))
+
+
+@pytest.mark.django_db
+def test_interrupted_load_resumes_from_checkpoint(tmp_path, monkeypatch):
+    names = [f'ингредиент {index}' for index in range(10)]
+    path = write_lines(tmp_path / 'ingredients.jsonl', ingredient_rows(names))
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    save_objects = BulkLoader.save_objects
+    calls = []
+
+    def failing_save_objects(self, *args):
+        calls.append(args)
+        if len(calls) == 3:
+            raise RuntimeError('сбой')
+        return save_objects(self, *args)
+
+    monkeypatch.setattr(BulkLoader, 'save_objects', failing_save_objects)
+    loader = BulkLoader(batch_size=3, checkpoint=Checkpoint(checkpoint_path))
+    with pytest.raises(RuntimeError):
+        loader.load(path, model='recipes.ingredient')
+    # Две пачки сохранены, третья откатилась.
+    assert Ingredient.objects.count() == 6
+    assert Checkpoint(checkpoint_path).get(path) == 6
+
+    monkeypatch.setattr(BulkLoader, 'save_objects', save_objects)
+    loader = BulkLoader(batch_size=3, checkpoint=Checkpoint(checkpoint_path))
+    assert loader.load(path, model='recipes.ingredient') == 10
+    assert loader.counts == {'recipes.ingredient': 4}
+    assert sorted(ingredients()) == sorted(names)
+    assert Ingredient.objects.count() == 10
+
+
+@pytest.mark.django_db
+def test_checkpoint_of_changed_file_is_rejected(tmp_path):
+    path = write_lines(tmp_path / 'ingredients.jsonl', ingredient_rows('аб'))
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint.json'))
+    checkpoint.save(path, 1)
+    write_lines(tmp_path / 'ingredients.jsonl', ingredient_rows('абв'))
+    with pytest.raises(BulkImportError):
+        BulkLoader(checkpoint=checkpoint).load(
+            path, model='recipes.ingredient')
+
+
+@pytest.mark.django_db
+def test_command_resumes_and_removes_checkpoint(tmp_path, monkeypatch):
+    path = write_lines(
+        tmp_path / 'ingredients.jsonl', ingredient_rows('абвгде'))
+    checkpoint = tmp_path / 'checkpoint.json'
+    save_batch = BulkLoader.save_batch
+
+    def failing_save_batch(self, path, batch, records, done):
+        if records > 4:
+            raise RuntimeError('сбой')
+        return save_batch(self, path, batch, records, done)
+
+    monkeypatch.setattr(BulkLoader, 'save_batch', failing_save_batch)
+    args = (path, '--model', 'recipes.ingredient', '--batch-size', '2',
+            '--checkpoint', str(checkpoint))
+    with pytest.raises(RuntimeError):
+        call_command('load_data', *args, stdout=StringIO())
+    assert checkpoint.exists()
+    monkeypatch.setattr(BulkLoader, 'save_batch', save_batch)
+    call_command('load_data', *args, stdout=StringIO())
+    assert not checkpoint.exists()
+    assert Ingredient.objects.count() == 6
+
+
+@pytest.mark.django_db
+def test_upsert_of_overlapping_file_updates_without_duplicates(tmp_path):
+    first = write_lines(tmp_path / 'first.jsonl', ingredient_rows('абв'))
+    second = write_lines(
+        tmp_path / 'second.jsonl', ingredient_rows('вгд', unit='кг'))
+    for path in (first, second):
+        BulkLoader(upsert=True).load(path, model='recipes.ingredient')
+    assert ingredients() == {
+        'а': 'г', 'б': 'г', 'в': 'кг', 'г': 'кг', 'д': 'кг'}
+    # Повторная загрузка того же файла ничего не добавляет.
+    BulkLoader(upsert=True).load(second, model='recipes.ingredient')
+    assert Ingredient.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_upsert_by_pk_from_dumpdata(tmp_path):
+    def dump(name, records):
+        path = tmp_path / name
+        path.write_text(json.dumps([
+            {'model': 'recipes.tag', 'pk': pk, 'fields': fields}
+            for pk, fields in records
+        ]), encoding='utf-8')
+        return str(path)
+
+    breakfast = {'name': 'Завтрак', 'color': '#E26C2D', 'slug': 'breakfast'}
+    lunch = {'name': 'Обед', 'color': '#49B64E', 'slug': 'lunch'}
+    BulkLoader(upsert=True).load(dump('first.json', [(1, breakfast)]))
+    BulkLoader(upsert=True).load(dump('second.json', [
+        (1, dict(breakfast, name='Ранний завтрак')), (2, lunch)]))
+    assert dict(Tag.objects.values_list('pk', 'name')) == {
+        1: 'Ранний завтрак', 2: 'Обед'}
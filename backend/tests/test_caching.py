@@ -0,0 +1,19 @@
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.versions import LIST_VERSION_KEY, recipe_version_key
+
+
+def cached_versions(recipe):
+    return cache.get_many([recipe_version_key(recipe.id), LIST_VERSION_KEY])
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tag_clear_resets_recipe_versions(make_recipe, tag):
+    recipe = make_recipe()
+    cache.set_many({recipe_version_key(recipe.id): 'old',
+                    LIST_VERSION_KEY: 'old'}, None)
+    with transaction.atomic():
+        tag.recipes.clear()
+    assert cached_versions(recipe) == {}
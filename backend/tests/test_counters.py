@@ -0,0 +1,27 @@
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+
+from recipes.models import Favorite, Recipe
+
+
+def reconcile(*args):
+    stdout = StringIO()
+    call_command('reconcile_counters', *args, stdout=stdout)
+    return stdout.getvalue()
+
+
+@pytest.mark.django_db
+def test_reconcile_reports_fixed_counters(user, make_recipe):
+    recipe = make_recipe()
+    Favorite.objects.create(user=user, recipe=recipe)
+    Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+    with pytest.raises(CommandError):
+        reconcile('--check')
+    output = reconcile()
+    assert 'Recipe.favorites_count: исправлено 1' in output
+    assert 'Исправлено счётчиков: 1.' in output
+    assert 'Счётчики актуальны.' not in output
+    assert Recipe.objects.get(pk=recipe.pk).favorites_count == 1
+    assert 'Счётчики актуальны.' in reconcile()
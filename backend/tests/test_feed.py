@@ -0,0 +1,40 @@
+import pytest
+
+from users.models import Subscription
+
+
+def feed(client):
+    response = client.get('/api/recipes/feed/')
+    assert response.status_code == 200
+    return {recipe['id'] for recipe in response.json()['results']}
+
+
+@pytest.mark.django_db
+def test_feed_keeps_recipes_after_author_stops_being_popular(
+        settings, client, user, author, make_user, make_recipe):
+    settings.FEED_FANOUT_THRESHOLD = 1
+    client.post(f'/api/users/{author.id}/subscribe/')
+    first = make_recipe('Блины')
+    other = make_user('other')
+    Subscription.objects.create(user=other, following=author)
+    second = make_recipe('Оладьи')
+    late = make_user('late')
+    Subscription.objects.create(user=late, following=author)
+    assert feed(client) == {first.id, second.id}
+
+    Subscription.objects.filter(user=other).delete()
+    Subscription.objects.filter(user=late).delete()
+    assert feed(client) == {first.id, second.id}
+
+
+@pytest.mark.django_db
+def test_feed_backfills_follower_of_popular_author(
+        settings, client, user, author, make_user, make_recipe):
+    settings.FEED_FANOUT_THRESHOLD = 1
+    other = make_user('other')
+    Subscription.objects.create(user=other, following=author)
+    client.post(f'/api/users/{author.id}/subscribe/')
+    recipe = make_recipe()
+    assert feed(client) == {recipe.id}
+    Subscription.objects.filter(user=other).delete()
+    assert feed(client) == {recipe.id}
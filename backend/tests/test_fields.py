@@ -0,0 +1,54 @@
+import base64
+import io
+import textwrap
+
+import pytest
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from api.fields import StreamingBase64ImageField
+
+
+@pytest.fixture
+def image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.fixture
+def field(monkeypatch):
+    # Части не кратны 4, чтобы границы попадали внутрь четвёрок.
+    monkeypatch.setattr(StreamingBase64ImageField, 'CHUNK_SIZE', 10)
+    return StreamingBase64ImageField()
+
+
+def decode(field, data):
+    with field.to_internal_value(data) as file:
+        assert file.name.endswith('.png')
+        return file.read()
+
+
+@pytest.mark.parametrize('prepare', (
+    lambda data: data,
+    lambda data: f'data:image/png;base64,{data}',
+    lambda data: '\n'.join(textwrap.wrap(data, 76)) + '\n',
+    lambda data: '\r\n'.join(textwrap.wrap(data, 7)),
+    lambda data: ' '.join(data),
+    lambda data: data.rstrip('='),
+))
+def test_decodes_wrapped_and_unpadded_input(field, image_data, prepare):
+    assert decode(field, prepare(image_data)) == base64.b64decode(
+        image_data)
+
+
+@pytest.mark.parametrize('data', ('не base64', 'iVBORw0K=GgoAAAA', 'A'))
+def test_rejects_invalid_input(field, data):
+    with pytest.raises(ValidationError):
+        field.to_internal_value(data)
+
+
+def test_rejects_large_images(field, image_data, settings):
+    settings.RECIPE_IMAGE_MAX_SIZE = 20
+    with pytest.raises(ValidationError, match='Размер изображения'):
+        field.to_internal_value(image_data)
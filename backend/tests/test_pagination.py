@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import timedelta
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from django.utils import timezone
+
+from recipes.models import Recipe
+
+URL = '/api/recipes/?cursor=&limit=2'
+
+
+def encode(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def get_cursor(link):
+    return parse_qs(urlsplit(link).query)['cursor'][0]
+
+
+def traverse(client, url, link):
+    """Страницы по ссылкам link ('next' или 'previous'), начиная с url."""
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append([recipe['id'] for recipe in response.data['results']])
+        url = response.data[link]
+    return pages
+
+
+@pytest.fixture
+def recipes(make_recipe):
+    """Семь рецептов, у пяти из которых одинаковое время публикации."""
+    now = timezone.now()
+    recipes = [make_recipe(f'Рецепт {index}') for index in range(7)]
+    for index, recipe in enumerate(recipes):
+        pub_date = now - timedelta(days=max(index - 4, 0))
+        Recipe.objects.filter(pk=recipe.pk).update(pub_date=pub_date)
+    return list(Recipe.objects.order_by('-pub_date', 'id').values_list(
+        'id', flat=True))
+
+
+@pytest.mark.django_db
+def test_cursor_pages_follow_ordering_with_ties(client, recipes):
+    pages = traverse(client, URL, 'next')
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert sum(pages, []) == recipes
+
+
+@pytest.mark.django_db
+def test_previous_links_return_same_pages(client, recipes):
+    forward = traverse(client, URL, 'next')
+    response = client.get(URL)
+    while response.data['next']:
+        response = client.get(response.data['next'])
+    backward = traverse(client, response.data['previous'], 'previous')
+    assert backward == forward[-2::-1]
+    assert client.get(URL).data['previous'] is None
+
+
+@pytest.mark.django_db
+def test_cursor_holds_last_item_values(client, recipes):
+    link = client.get(URL).data['next']
+    data = json.loads(base64.urlsafe_b64decode(get_cursor(link)))
+    last = Recipe.objects.get(pk=recipes[1])
+    assert data == {
+        'v': [last.pub_date.isoformat(), str(last.pk)], 'r': False}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('cursor', (
+    'не-base64',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    encode({'v': ['2024-01-01T00:00:00+00:00'], 'r': False}),
+    encode({'v': ['вчера', '1'], 'r': False}),
+    encode({'r': False}),
+))
+def test_invalid_cursor_is_not_found(client, recipes, cursor):
+    response = client.get('/api/recipes/', {'cursor': cursor})
+    assert response.status_code == 404
@@ -0,0 +1,33 @@
+import pytest
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes import reference
+from recipes.models import Tag
+
+
+@pytest.mark.django_db(transaction=True)
+def test_tags_version_changes_after_commit(tag):
+    version = reference.tags.get().version
+    with transaction.atomic():
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        assert reference.tags.get_version() == version
+    assert reference.tags.get_version() != version
+    assert {item['slug'] for item in reference.tags.get().items} == {
+        'breakfast', 'lunch'}
+
+
+@pytest.mark.django_db
+def test_version_survives_eviction(monkeypatch):
+    monkeypatch.setattr(cache, 'add', lambda *args, **kwargs: True)
+    assert reference.tags.get_version() is not None
+
+
+@pytest.mark.django_db
+def test_missing_checks_database_for_unknown_ids(tag):
+    reference.tags.get()
+    # Версию сменил бы коммит в другом процессе; здесь кэш просто устарел.
+    lunch = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+    assert lunch.id not in reference.tags.get().by_id
+    assert reference.tags.missing([tag.id, lunch.id, lunch.id + 1]) == [
+        lunch.id + 1]
@@ -0,0 +1,97 @@
+import datetime
+import decimal
+import io
+import json
+import uuid
+from collections import OrderedDict
+
+import pytest
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+
+MOSCOW = datetime.timezone(datetime.timedelta(hours=3))
+
+PAYLOADS = (
+    None,
+    [],
+    {},
+    {'id': 1, 'name': 'Блины', 'is_favorited': False, 'image': None},
+    OrderedDict([('b', 1), ('a', [1, 2.5, -0.0, 10 ** 20])]),
+    {1: 'ключ-число', 'вложенный': {'список': [{'x': True}]}},
+    {'floats': [0.1, 1.5, 1e15, 1e-4, 123456789.125, -2.5e-3]},
+    {'text': 'кавычки " \\ / \t\n\r\x00\x1f\x7f и эмодзи 🍳'},
+    {'separators': 'строка абзац конец'},
+    {'html': '</script><b>&amp;</b>'},
+    {'decimal': decimal.Decimal('12.50'), 'big': decimal.Decimal('1e15')},
+    {'big_int': 2 ** 64, 'negative': [-2 ** 63 - 1]},
+    {'uuid': uuid.UUID('12345678-1234-5678-1234-567812345678')},
+    {'lazy': gettext_lazy('Рецепты')},
+    {'date': datetime.date(2024, 2, 29), 'time': datetime.time(7, 5, 3)},
+    {'microseconds': datetime.time(7, 5, 3, 120)},
+    {'naive': datetime.datetime(2024, 1, 2, 3, 4, 5, 678901)},
+    {'utc': datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)},
+    {'moscow': datetime.datetime(2024, 1, 2, 3, 4, 5, 100, tzinfo=MOSCOW)},
+    {'delta': datetime.timedelta(days=1, seconds=5)},
+    {'tuple': (1, 'два'), 'set': frozenset()},
+)
+
+
+@pytest.mark.parametrize('data', PAYLOADS)
+def test_output_matches_json_renderer(data):
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+@pytest.mark.parametrize('data', PAYLOADS)
+def test_ascii_output_matches_json_renderer(data):
+    fast, stock = FastJSONRenderer(), JSONRenderer()
+    fast.ensure_ascii = stock.ensure_ascii = True
+    assert fast.render(data) == stock.render(data)
+
+
+def test_exponent_floats_decode_to_same_values():
+    # Показатель степени orjson пишет короче: 1e16 вместо 1e+16.
+    data = {'floats': [1e16, 1e-7, 2 ** -30, 1e300]}
+    fast = FastJSONRenderer().render(data)
+    assert fast != JSONRenderer().render(data)
+    assert json.loads(fast) == data
+
+
+def test_indented_output_matches_json_renderer():
+    data = PAYLOADS[5]
+    media_type = 'application/json; indent=4'
+    assert FastJSONRenderer().render(data, media_type) == (
+        JSONRenderer().render(data, media_type))
+
+
+def test_media_type_and_charset_match_json_renderer():
+    assert FastJSONRenderer.media_type == JSONRenderer.media_type
+    assert FastJSONRenderer.charset == JSONRenderer.charset
+
+
+@pytest.mark.django_db
+def test_response_content_type(tag):
+    response = APIClient().get('/api/tags/')
+    assert response['Content-Type'] == 'application/json'
+
+
+@pytest.mark.parametrize('content', (
+    b'{"name": "\xd0\x91\xd0\xbb\xd0\xb8\xd0\xbd\xd1\x8b", "n": [1, 2.5]}',
+    b'[{"a": null, "b": true}, "\\u2028"]',
+))
+def test_parser_matches_json_parser(content):
+    assert FastJSONParser().parse(io.BytesIO(content)) == (
+        JSONParser().parse(io.BytesIO(content)))
+
+
+@pytest.mark.parametrize('content', (b'{"a": NaN}', b'{"a": 1,}', b''))
+def test_parser_rejects_what_json_parser_rejects(content):
+    for parser in (FastJSONParser(), JSONParser()):
+        with pytest.raises(ParseError):
+            parser.parse(io.BytesIO(content))
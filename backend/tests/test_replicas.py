@@ -0,0 +1,69 @@
+import pytest
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.replicas import replica_status
+
+
+@pytest.fixture
+def replica(settings):
+    """Реплика - второе соединение с той же тестовой базой."""
+    connections.databases['replica'] = dict(
+        connections['default'].settings_dict)
+    settings.DB_REPLICAS = ['replica']
+    replica_status.checked.clear()
+    yield connections['replica']
+    connections['replica'].close()
+    del connections['replica']
+    del connections.databases['replica']
+    replica_status.checked.clear()
+
+
+def run(client, path):
+    with CaptureQueriesContext(connections['default']) as primary, \
+            CaptureQueriesContext(connections['replica']) as replica:
+        response = client.get(path)
+    assert response.status_code == 200
+    return (response.json(), [query['sql'] for query in primary],
+            [query['sql'] for query in replica])
+
+
+@pytest.mark.django_db(transaction=True)
+def test_anonymous_cache_is_filled_from_primary(replica, make_recipe):
+    recipe = make_recipe()
+    recipe.name = 'Новые блины'
+    recipe.save()
+    data, primary, replica_queries = run(
+        APIClient(), f'/api/recipes/{recipe.id}/')
+    assert data['name'] == 'Новые блины'
+    assert primary
+    assert replica_queries == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_recipe_bodies_are_built_on_primary(replica, user, make_recipe):
+    recipe = make_recipe()
+    client = APIClient()
+    client.force_authenticate(user)
+    data, primary, replica_queries = run(client, '/api/recipes/')
+    assert [item['id'] for item in data['results']] == [recipe.id]
+    # Страница и отметки пользователя - с реплики, тела рецептов и
+    # справочники для общего кэша - с основной базы.
+    assert any('recipes_recipe' in sql for sql in replica_queries)
+    assert not any('recipes_ingredientamount' in sql
+                   for sql in replica_queries)
+    assert any('recipes_ingredientamount' in sql for sql in primary)
+    assert any('recipes_ingredient"' in sql for sql in primary)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_writer_reads_from_primary(replica, user, make_recipe):
+    recipe = make_recipe()
+    client = APIClient(HTTP_AUTHORIZATION='Token test')
+    client.force_authenticate(user)
+    assert client.post(
+        f'/api/recipes/{recipe.id}/favorite/').status_code == 201
+    data, _, replica_queries = run(client, f'/api/recipes/{recipe.id}/')
+    assert data['is_favorited'] is True
+    assert replica_queries == []
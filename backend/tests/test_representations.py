@@ -0,0 +1,58 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.representations import build_recipe_bodies
+from api.serializers import RecipeReadSerializer, apply_viewer_flags
+from recipes import reference
+from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscription
+
+
+def render_both(user, recipe_ids):
+    request = Request(APIRequestFactory().get('/api/recipes/'))
+    request.user = user
+    renderer = JSONRenderer()
+    expected = [
+        renderer.render(RecipeReadSerializer(
+            recipe, context={'request': request}).data)
+        for recipe in Recipe.objects.for_user(user).filter(
+            id__in=recipe_ids).order_by('id')
+    ]
+    actual = [
+        renderer.render(body) for body in apply_viewer_flags(
+            build_recipe_bodies(recipe_ids, request), recipe_ids, user)
+    ]
+    return expected, actual
+
+
+@pytest.mark.django_db
+def test_representations_match_serializer(user, author, make_recipe, tag):
+    lunch = Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+    first, second = make_recipe('Блины'), make_recipe('Суп', (1, 2))
+    second.tags.add(lunch)
+    third = make_recipe('Без ингредиентов', ())
+    Favorite.objects.create(user=user, recipe=first)
+    ShoppingCart.objects.create(user=user, recipe=second)
+    Subscription.objects.create(user=user, following=author)
+    recipe_ids = [first.id, second.id, third.id]
+    for viewer in (AnonymousUser(), user, author):
+        expected, actual = render_both(viewer, recipe_ids)
+        assert actual == expected
+
+
+@pytest.mark.django_db
+def test_representations_see_ingredients_missing_from_cache(make_recipe):
+    recipe = make_recipe()
+    reference.ingredients.get()
+    reference.tags.get()
+    ingredient = Ingredient.objects.create(name='яйца', measurement_unit='шт')
+    IngredientAmount.objects.create(
+        recipe=recipe, ingredient=ingredient, amount=2)
+    recipe.tags.add(Tag.objects.create(
+        name='Ужин', color='#8775D2', slug='dinner'))
+    expected, actual = render_both(AnonymousUser(), [recipe.id])
+    assert actual == expected
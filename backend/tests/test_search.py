@@ -0,0 +1,31 @@
+import pytest
+from django.db import connection
+
+from recipes.search import FTS_TABLE, index_recipes
+
+
+def search(client, value):
+    response = client.get('/api/recipes/', {'search': value})
+    assert response.status_code == 200
+    return [recipe['id'] for recipe in response.json()['results']]
+
+
+@pytest.mark.django_db
+def test_search_finds_by_name_and_ingredient(client, make_recipe):
+    pancakes, fritters = make_recipe('Блины'), make_recipe('Оладьи')
+    index_recipes((pancakes.id, fritters.id))
+    assert search(client, 'блины') == [pancakes.id]
+    assert set(search(client, 'мука')) == {pancakes.id, fritters.id}
+
+
+@pytest.mark.django_db
+def test_deleted_recipe_leaves_search(client, make_recipe):
+    pancakes, fritters = make_recipe('Блины'), make_recipe('Оладьи')
+    index_recipes((pancakes.id, fritters.id))
+    pancakes.delete()
+    assert search(client, 'мука') == [fritters.id]
+    assert search(client, 'блины') == []
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE}')
+            assert cursor.fetchall() == [(fritters.id,)]
@@ -0,0 +1,122 @@
+import pytest
+
+from recipes.models import IngredientAmount, ShoppingCartIngredient
+
+
+def shopping_list(user):
+    return dict(ShoppingCartIngredient.objects.filter(
+        user=user).values_list('ingredient__name', 'amount'))
+
+
+def live_shopping_list(user):
+    return {
+        row['ingredient_id']: row['amount']
+        for row in ShoppingCartIngredient.objects.live().filter(user=user)
+    }
+
+
+@pytest.mark.django_db
+def test_shopping_list_follows_cart(client, user, make_recipe):
+    first, second = make_recipe('Блины'), make_recipe('Оладьи', (10, 5))
+    client.post(f'/api/recipes/{first.id}/shopping_cart/')
+    client.post(f'/api/recipes/{second.id}/shopping_cart/')
+    assert shopping_list(user) == {'мука': 110, 'сахар': 55}
+    client.delete(f'/api/recipes/{first.id}/shopping_cart/')
+    assert shopping_list(user) == {'мука': 10, 'сахар': 5}
+
+
+@pytest.mark.django_db
+def test_apply_adds_to_existing_rows(user, make_recipe, ingredients):
+    flour = ingredients[0]
+    ShoppingCartIngredient.objects.apply((user.id,), {flour.id: 5})
+    ShoppingCartIngredient.objects.apply((user.id,), {flour.id: 7})
+    assert shopping_list(user) == {'мука': 12}
+    ShoppingCartIngredient.objects.apply((user.id,), {flour.id: -12})
+    assert shopping_list(user) == {}
+
+
+@pytest.mark.django_db
+def test_recipe_delete_updates_shopping_list(client, user, make_recipe):
+    first, second = make_recipe('Блины'), make_recipe('Оладьи', (10, 5))
+    client.post(f'/api/recipes/{first.id}/shopping_cart/')
+    client.post(f'/api/recipes/{second.id}/shopping_cart/')
+    first.delete()
+    assert shopping_list(user) == {'мука': 10, 'сахар': 5}
+
+
+@pytest.mark.django_db
+def test_ingredient_rows_update_shopping_list(client, user, make_recipe,
+                                              ingredients):
+    recipe = make_recipe()
+    client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    row = IngredientAmount.objects.get(
+        recipe=recipe, ingredient=ingredients[0])
+    row.amount = 300
+    row.save()
+    IngredientAmount.objects.create(
+        recipe=recipe, ingredient=ingredients[2], amount=1)
+    IngredientAmount.objects.filter(
+        recipe=recipe, ingredient=ingredients[1]).delete()
+    assert shopping_list(user) == {'мука': 300, 'соль': 1}
+    assert live_shopping_list(user) == {
+        ingredients[0].id: 300, ingredients[2].id: 1}
+
+
+@pytest.mark.django_db
+def test_recipe_update_keeps_shopping_list(client, author, user, make_recipe,
+                                           ingredients, tag):
+    recipe = make_recipe(amounts=(100, 50))
+    client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+    author_client = client.__class__()
+    author_client.force_authenticate(author)
+    response = author_client.patch(f'/api/recipes/{recipe.id}/', {
+        'name': recipe.name, 'text': recipe.text, 'cooking_time': 10,
+        'tags': [tag.id],
+        'ingredients': [
+            {'id': ingredients[0].id, 'amount': 120},
+            {'id': ingredients[2].id, 'amount': 3},
+        ],
+    }, format='json')
+    assert response.status_code == 200, response.content
+    assert shopping_list(user) == {'мука': 120, 'соль': 3}
+
+
+def check_xref(document):
+    """Каждая запись таблицы xref указывает на начало своего объекта."""
+    start = int(document.rsplit(b'startxref\n', 1)[1].split()[0])
+    header, *rows = document[start:].split(b'trailer')[0].splitlines()[1:]
+    assert header.split()[1] == b'%d' % (len(rows))
+    for number, row in enumerate(rows[1:], 1):
+        offset = int(row.split()[0])
+        assert document[offset:].startswith(b'%d 0 obj' % number)
+
+
+@pytest.mark.django_db
+def test_pdf_is_streamed_by_page(client, make_recipe, ingredients,
+                                 monkeypatch):
+    monkeypatch.setattr('api.shopping_cart.PDF_LINES_PER_PAGE', 2)
+    client.post(f'/api/recipes/{make_recipe(amounts=(1, 2, 3)).id}'
+                '/shopping_cart/')
+    response = client.get('/api/recipes/download_shopping_cart/?type=pdf')
+    chunks = list(response.streaming_content)
+    # Заголовок, две страницы и хвост с шрифтами и xref.
+    assert len(chunks) == 4
+    document = b''.join(chunks)
+    assert document.startswith(b'%PDF-1.4')
+    assert document.endswith(b'%%EOF\n')
+    assert b'/Count 2' in document
+    check_xref(document)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_etag_changes_with_ingredient_names(client, make_recipe,
+                                            ingredients):
+    client.post(f'/api/recipes/{make_recipe().id}/shopping_cart/')
+    url = '/api/recipes/download_shopping_cart/'
+    etag = client.get(url)['ETag']
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    ingredients[0].measurement_unit = 'кг'
+    ingredients[0].save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert 'мука - 100кг' in b''.join(response.streaming_content).decode()
@@ -0,0 +1,19 @@
+# Generated by Django 2.2 on 2026-10-18 12:03
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_auto_20230329_0719'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='shopping_cart_updated',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата изменения списка покупок'),
+        ),
+    ]
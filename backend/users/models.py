@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
+from django.utils import timezone
 
 from core.validators import validate_letter_field, validate_username
 from foodgram.settings import MAX_LENGTH_EMAIL, MAX_LENGTH_FIELD
@@ -30,6 +31,18 @@ class User(AbstractUser):
         max_length=MAX_LENGTH_FIELD,
         validators=[validate_letter_field],
     )
+    shopping_cart_updated = models.DateTimeField(
+        verbose_name='Дата изменения списка покупок',
+        default=timezone.now,
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'username']
@@ -56,14 +69,24 @@ class Subscription(models.Model):
         User, on_delete=models.CASCADE,
         related_name='follower',
         verbose_name='Подписчик',
+        db_index=False,
     )
     following = models.ForeignKey(
         User, on_delete=models.CASCADE,
         related_name='following',
         verbose_name='Автор',
+        db_index=False,
     )
 
     class Meta:
+        # Уникальность (user, following) служит индексом по подписчику,
+        # обратный индекс - по автору.
+        indexes = [
+            models.Index(
+                name='subscription_following_idx',
+                fields=('following', 'user'),
+            ),
+        ]
         constraints = [
             models.CheckConstraint(
                 name='No self sibscription',